@@ -20,6 +20,10 @@ from urllib.parse import parse_qs
 
 django_asgi_app = get_asgi_application()  # ✅ Load Django apps trước
 
+from products.warmup import warm_up_on_startup  # after the app registry is ready
+
+warm_up_on_startup()
+
 @database_sync_to_async
 def get_user(user_id):
     User = get_user_model()
@@ -221,6 +221,128 @@ SIMPLE_JWT = {
     'JTI_CLAIM': 'jti',
 }
 
+# ==================== CLIP SEARCH SETTINGS ====================
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+# Storage width of Product.embedding: "float32" or "float16" (half the size)
+PRODUCT_EMBEDDING_DTYPE = "float32"
+# Default scoring engine for image/text search: "exact", "ivf" (approximate)
+# or "int8" (quantized). Clients may override per request with ?engine=...
+PRODUCT_SEARCH_ENGINE = "exact"
+PRODUCT_SEARCH_ANN_MIN_ROWS = 5000   # below this the exact scan is always used
+PRODUCT_SEARCH_IVF_LISTS = None      # None -> 4 * sqrt(rows)
+PRODUCT_SEARCH_IVF_NPROBE = 8        # lists scanned per query (recall vs latency)
+PRODUCT_SEARCH_INT8_RERANK = 100     # int8 candidates re-scored with float32
+# The int8 codes are held on top of the float32 rows, which the re-rank still
+# reads. "int8" only lowers memory per worker with SEARCH_INDEX_SNAPSHOT_DIR
+# set: the float32 rows are then memory-mapped and shared by all workers, and
+# a query pages in just the rows it re-scores. Without snapshots it trades
+# ~25% more memory for faster scans.
+# Shared on-disk index (manage.py build_search_index). When set, workers
+# memory-map the published snapshot instead of each loading the matrix from
+# the database, and poll for a newer one every CHECK_INTERVAL seconds.
+# Unset, each worker builds its index from the database and re-reads the
+# products changed elsewhere when the table's count/latest updated_at moves
+# (checked every CHECK_INTERVAL seconds).
+SEARCH_INDEX_SNAPSHOT_DIR = os.environ.get("SEARCH_INDEX_SNAPSHOT_DIR") or None  # e.g. BASE_DIR / "search_index"
+SEARCH_INDEX_CHECK_INTERVAL = 5
+SEARCH_INDEX_KEEP_SNAPSHOTS = 3
+# Index changes are logged next to the snapshot and applied by every worker on
+# its next search; past this many logged changes a worker merges them into a
+# new snapshot in the background.
+SEARCH_INDEX_DELTA_MERGE_ENTRIES = 5000
+
+# Micro-batching: concurrent embedding calls are merged into one forward pass
+CLIP_BATCHING = True
+CLIP_BATCH_MAX_SIZE = 16
+CLIP_BATCH_MAX_WAIT_MS = 5
+# CPU inference: dynamic int8 quantization of the linear layers (check accuracy
+# first with `manage.py clip_quant_check`) and torch intra-op threads per worker.
+# Quantized embeddings are stored as "<CLIP_MODEL_NAME>+int8": after switching
+# CLIP_QUANTIZE, run `manage.py backfill_embeddings` to re-embed the catalog
+# (search only uses vectors from the current configuration).
+CLIP_QUANTIZE = False
+CLIP_TORCH_THREADS = None            # None -> torch default (all cores)
+# Load CLIP in a background thread when each ASGI/WSGI worker starts. None
+# turns it on whenever PRODUCT_SEARCH_DEADLINE_MS is set: a cold worker
+# would otherwise spend its first searches' budget loading the model and
+# answer them degraded. False with a deadline accepts exactly that.
+CLIP_WARMUP_ON_STARTUP = None
+# Out-of-process inference: run `manage.py clip_worker --socket <path>` and set
+# the same path here; web workers then never load torch themselves.
+CLIP_SERVICE_SOCKET = os.environ.get("CLIP_SERVICE_SOCKET") or None
+CLIP_SERVICE_TIMEOUT = 10            # seconds per embedding call
+# Image/text search (sync and /async/ endpoints): CLIP runs on this many
+# dedicated threads (enough to fill a micro-batch). Queue depth is in
+# /api/search/ready/.
+PRODUCT_SEARCH_INFERENCE_WORKERS = 16
+PRODUCT_SEARCH_INFERENCE_MAX_PENDING = 64
+# Budget of the embedding step per search request (clients may lower it with
+# ?deadline_ms=; None waits indefinitely). Past it, or with MAX_PENDING calls
+# already queued, the endpoint answers from BM25/the database instead and
+# marks the response "degraded": true. Setting it also turns on the startup
+# warm-up unless CLIP_WARMUP_ON_STARTUP is False.
+PRODUCT_SEARCH_DEADLINE_MS = 1500
+# Upper bound of ?k= on the search endpoints (values below 1 become 1)
+PRODUCT_SEARCH_MAX_RESULTS = 500
+# Filtered searches matching at most this many rows skip the ANN engine and
+# score just those rows exactly
+PRODUCT_SEARCH_FILTER_EXACT_ROWS = 20000
+# Hybrid text search (?mode=hybrid): BM25 over name/description proposes
+# candidates, CLIP re-scores them. Fusion "weighted" mixes min-max scaled
+# scores, "rrf" uses reciprocal ranks; the weight is the lexical share.
+PRODUCT_SEARCH_LEXICAL_CANDIDATES = 1000
+PRODUCT_SEARCH_HYBRID_FUSION = "weighted"
+PRODUCT_SEARCH_HYBRID_LEXICAL_WEIGHT = 0.3
+PRODUCT_SEARCH_RRF_K = 60
+PRODUCT_SEARCH_BM25_K1 = 1.2
+PRODUCT_SEARCH_BM25_B = 0.75
+# "Similar products" graph (manage.py build_similar_products, then kept up to
+# date on save). The batch job holds at most BLOCK_BYTES of scores at a time.
+PRODUCT_SIMILAR_COUNT = 20
+PRODUCT_SIMILAR_BLOCK_BYTES = 256 * 1024 * 1024
+PRODUCT_SIMILAR_ON_SAVE = True
+# Embed new/changed product images on a background thread after save
+PRODUCT_EMBED_ON_SAVE = True
+# Zero-shot categorization (manage.py auto_categorize, scripts/import_products.py):
+# "prompt" matches category-name prompts, "centroid" the mean vector of each
+# category's products. Only predictions at MIN_CONFIDENCE (softmax) are saved.
+PRODUCT_CATEGORIZE_METHOD = "prompt"
+PRODUCT_CATEGORIZE_PROMPT = "a photo of {name}"
+PRODUCT_CATEGORIZE_MIN_CONFIDENCE = 0.5
+PRODUCT_CATEGORIZE_MIN_EXAMPLES = 3
+PRODUCT_CATEGORIZE_FALLBACK = "Uncategorized"
+# Near-duplicate detection (manage.py find_duplicates): LSH buckets over the
+# embeddings, then image cosine and name-token Jaccard must both clear the bar.
+PRODUCT_DUPLICATE_IMAGE_THRESHOLD = 0.92
+PRODUCT_DUPLICATE_NAME_THRESHOLD = 0.5
+# More bands -> higher recall, more bits -> smaller buckets; the command logs
+# the recall measured on a sample against an exact scan.
+PRODUCT_DUPLICATE_LSH_BANDS = 16
+PRODUCT_DUPLICATE_LSH_BITS = 8
+# Search keeps one product per duplicate cluster (?collapse=true/false overrides)
+PRODUCT_SEARCH_COLLAPSE_DUPLICATES = False
+PRODUCT_SEARCH_COLLAPSE_OVERFETCH = 3
+
+# Query-embedding caches. Set SEARCH_EMBEDDING_CACHE_ALIAS to a CACHES alias
+# (e.g. a Redis cache) to share cached embeddings (and the catalog version
+# that invalidates cached results) between workers.
+SEARCH_TEXT_CACHE_SIZE = 2048
+SEARCH_TEXT_CACHE_TTL = 3600         # seconds
+SEARCH_IMAGE_CACHE_SIZE = 512        # keyed by SHA-256 of the upload + ROI
+SEARCH_IMAGE_CACHE_TTL = 3600
+SEARCH_EMBEDDING_CACHE_ALIAS = None
+# Ranked results per (query vector, k, filters, options); entries are keyed
+# by a catalog version that product changes bump, so they never go stale.
+# The version is kept in SEARCH_EMBEDDING_CACHE_ALIAS, else in the 'default'
+# cache; with a local-memory default cache (no CACHES setting) it cannot be
+# shared between workers and results are not cached.
+SEARCH_RESULT_CACHE_SIZE = 1024
+SEARCH_RESULT_CACHE_TTL = 300
+# Uploaded query images above this many pixels are rejected before decoding
+SEARCH_IMAGE_MAX_PIXELS = 40_000_000
+# ...and decoded at reduced size (JPEG draft mode) within this budget
+SEARCH_IMAGE_DECODE_PIXELS = 4_000_000
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer',
@@ -0,0 +1,232 @@
+"""Out-of-process CLIP embedding: wire protocol, client and worker pool.
+
+``manage.py clip_worker`` binds a Unix socket and forks N worker processes
+that each load CLIP once and accept connections on the shared socket. Web
+processes set ``CLIP_SERVICE_SOCKET`` and ``clip_service`` forwards embedding
+calls here instead of running the model in-process.
+
+Framing (both directions): 4-byte big-endian header length, a UTF-8 JSON
+header, then ``header["payload"]`` bytes of binary payload.
+
+    request  {"op": "image", "images": [[w, h], ...]}  payload: raw RGB bytes
+             {"op": "text", "texts": [...]}
+             {"op": "ping"}
+    response {"ok": true, "count": n, "dim": d}        payload: n*d float32
+             {"ok": false, "error": "..."}
+"""
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+# A worker that dies sooner than this after its start is replaced only after
+# a pause, so a pool that cannot load the model does not fork in a tight loop
+_RESPAWN_MIN_UPTIME = 10.0
+_RESPAWN_DELAY = 1.0
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        read = sock.recv_into(view[got:], n - got)
+        if read == 0:
+            raise ConnectionError("connection closed")
+        got += read
+    return bytes(buf)
+
+
+def send_frame(sock: socket.socket, header: dict, payload: bytes = b"") -> None:
+    header = dict(header, payload=len(payload))
+    raw = json.dumps(header).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(raw)) + raw + payload)
+
+
+def recv_frame(sock: socket.socket) -> Tuple[dict, bytes]:
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    header = json.loads(_recv_exact(sock, length).decode("utf-8"))
+    payload = _recv_exact(sock, header.get("payload", 0)) if header.get("payload") else b""
+    return header, payload
+
+
+# ---------------------------------------------------------------- client side
+class RemoteEmbedder:
+    """Client for the worker pool; one persistent connection per thread."""
+
+    def __init__(self, path: str, timeout: float = 10.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        return sock
+
+    def _call(self, header: dict, payload: bytes = b"") -> Tuple[dict, bytes]:
+        # Retry once on a fresh connection if the request could not be sent (a
+        # worker may have been restarted). Once it was sent, a worker may be
+        # running it: sending it again would double the load of a slow pool.
+        for attempt in (0, 1):
+            sock = getattr(self._local, "sock", None)
+            sent = False
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                send_frame(sock, header, payload)
+                sent = True
+                reply, data = recv_frame(sock)
+                break
+            except OSError:
+                self._local.sock = None
+                if sock is not None:
+                    sock.close()
+                if attempt or sent:
+                    raise
+        if not reply.get("ok"):
+            raise RuntimeError(f"CLIP worker error: {reply.get('error')}")
+        return reply, data
+
+    def _vectors(self, reply: dict, data: bytes) -> List[List[float]]:
+        arr = np.frombuffer(data, dtype="<f4").reshape(reply["count"], reply["dim"])
+        return arr.tolist()
+
+    def embed_images(self, images: Sequence[Image.Image]) -> List[List[float]]:
+        # Sent at full size: the worker must see the same pixels as in-process
+        # CLIP, since both store vectors under the same embedding_model name
+        rgb = [img.convert("RGB") for img in images]
+        payload = b"".join(img.tobytes() for img in rgb)
+        reply, data = self._call({"op": "image", "images": [list(img.size) for img in rgb]}, payload)
+        return self._vectors(reply, data)
+
+    def embed_texts(self, texts: Sequence[str]) -> List[List[float]]:
+        reply, data = self._call({"op": "text", "texts": list(texts)})
+        return self._vectors(reply, data)
+
+    def ping(self) -> bool:
+        try:
+            self._call({"op": "ping"})
+            return True
+        except Exception:
+            return False
+
+
+# ---------------------------------------------------------------- server side
+def _handle_request(header: dict, payload: bytes) -> Tuple[dict, bytes]:
+    import clip_service
+
+    op = header.get("op")
+    if op == "ping":
+        return {"ok": True, "count": 0, "dim": 0}, b""
+    if op == "image":
+        images, offset = [], 0
+        for w, h in header["images"]:
+            size = w * h * 3
+            images.append(Image.frombytes("RGB", (w, h), payload[offset:offset + size]))
+            offset += size
+        vectors = clip_service.get_image_embeddings(images)
+    elif op == "text":
+        vectors = [clip_service.get_text_embedding(t) for t in header["texts"]]
+    else:
+        return {"ok": False, "error": f"unknown op {op!r}"}, b""
+    arr = np.asarray(vectors, dtype="<f4")
+    return {"ok": True, "count": arr.shape[0], "dim": arr.shape[1] if arr.ndim == 2 else 0}, arr.tobytes()
+
+
+def _serve_connection(conn: socket.socket) -> None:
+    with conn:
+        while True:
+            try:
+                header, payload = recv_frame(conn)
+            except (ConnectionError, OSError):
+                return
+            try:
+                reply, data = _handle_request(header, payload)
+            except Exception as e:
+                logger.exception("CLIP worker request failed")
+                reply, data = {"ok": False, "error": str(e)}, b""
+            try:
+                send_frame(conn, reply, data)
+            except OSError:
+                return
+
+
+def _worker_loop(listener: socket.socket) -> None:
+    """Accept connections on the shared socket; one thread per connection.
+
+    Concurrent requests from different connections meet in clip_service's
+    micro-batcher, so one process still runs batched forward passes.
+    """
+    import clip_service
+
+    clip_service.warm_up()
+    logger.info("CLIP worker %s ready", os.getpid())
+    while True:
+        conn, _ = listener.accept()
+        threading.Thread(target=_serve_connection, args=(conn,), daemon=True).start()
+
+
+def _spawn(listener: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _worker_loop(listener)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def serve(path: str, processes: int = 1) -> None:
+    """Bind ``path`` and run ``processes`` pre-forked workers until interrupted.
+
+    A worker that dies (e.g. killed for memory during a forward pass) is
+    replaced, so the pool keeps its size.
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    os.chmod(path, 0o660)
+    listener.listen(128)
+
+    children = {_spawn(listener): time.monotonic() for _ in range(max(1, processes))}
+
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    # Process managers stop services with SIGTERM; take the children down too
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        while True:
+            pid, status = os.wait()
+            started = children.pop(pid, None)
+            if started is None:
+                continue
+            logger.warning("CLIP worker %s exited (status %s), starting a new one", pid, status)
+            if time.monotonic() - started < _RESPAWN_MIN_UPTIME:
+                # Dying right after start (e.g. the model cannot load): do not spin
+                time.sleep(_RESPAWN_DELAY)
+            children[_spawn(listener)] = time.monotonic()
+    except KeyboardInterrupt:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+    finally:
+        listener.close()
+        if os.path.exists(path):
+            os.unlink(path)
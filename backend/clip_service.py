@@ -1,26 +1,175 @@
-"""CLIP utilities: load once, extract image embeddings for similarity search."""
-from functools import lru_cache
-from typing import List
+"""CLIP utilities: load once, extract image embeddings for similarity search.
 
-import torch
+When ``CLIP_BATCHING`` is on, concurrent ``get_image_embedding`` /
+``get_text_embedding`` calls are collected by a per-modality micro-batcher
+(up to ``CLIP_BATCH_MAX_SIZE`` items or ``CLIP_BATCH_MAX_WAIT_MS``) and run as
+one padded forward pass; every caller still gets back its own vector.
+
+``CLIP_SERVICE_SOCKET`` puts this module in client mode: embeddings are
+requested from a ``manage.py clip_worker`` process pool over a Unix socket and
+torch/transformers are never imported in the calling process.
+
+``CLIP_QUANTIZE`` switches CPU inference to a dynamically int8-quantized copy
+of the model (linear layers only) and ``CLIP_TORCH_THREADS`` pins torch's
+intra-op thread count per worker. ``latency_stats()`` reports per-call
+forward-pass latency; ``manage.py clip_quant_check`` compares the quantized
+model against fp32 on catalog images.
+"""
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Sequence
+
+from django.conf import settings
 from PIL import Image
-from transformers import CLIPModel, AutoProcessor
+
+from products.embeddings import checkpoint_name
+
+
+def _quantize_enabled() -> bool:
+    return getattr(settings, "CLIP_QUANTIZE", False)
+
+
+def _load_clip(quantized: Optional[bool] = None):
+    """Return ``(model, processor, device)``; ``quantized`` defaults to CLIP_QUANTIZE."""
+    return _load_model(_quantize_enabled() if quantized is None else bool(quantized))
+
+
+# (model, processor, device) per ``quantized`` flag, loaded once under _model_lock
+_models: dict = {}
+_model_lock = threading.Lock()
 
 
-@lru_cache(maxsize=1)
-def _load_clip():
-    model_name = "openai/clip-vit-base-patch32"
+def _load_model(quantized: bool):
+    """Load the model once per process, even when many threads ask at cold start."""
+    loaded = _models.get(quantized)
+    if loaded is None:
+        with _model_lock:
+            loaded = _models.get(quantized)
+            if loaded is None:
+                loaded = _models[quantized] = _build_model(quantized)
+    return loaded
+
+
+def _build_model(quantized: bool):
+    import torch
+    from transformers import CLIPModel, AutoProcessor
+
+    threads = getattr(settings, "CLIP_TORCH_THREADS", None)
+    if threads:
+        torch.set_num_threads(int(threads))
+
+    model_name = checkpoint_name()
     model = CLIPModel.from_pretrained(model_name, use_safetensors=True)
     processor = AutoProcessor.from_pretrained(model_name)
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if quantized and device.type == "cpu":
+        # Dynamic quantization: int8 weights for nn.Linear, activations
+        # quantized on the fly. CPU only; on GPU the fp32 model is used.
+        model.eval()
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
     model.to(device)
     model.eval()
     return model, processor, device
 
 
-def get_image_embedding(image: Image.Image) -> List[float]:
-    """Return L2-normalized CLIP image embedding as a list of floats."""
-    model, processor, device = _load_clip()
+def _percentile(sorted_values: List[float], q: float) -> float:
+    return round(sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))], 2)
+
+
+def _remote():
+    """Client for the out-of-process worker pool, or None in in-process mode."""
+    global _remote_client
+    path = getattr(settings, "CLIP_SERVICE_SOCKET", None)
+    if not path:
+        return None
+    if _remote_client is None or _remote_client.path != path:
+        from clip_remote import RemoteEmbedder
+
+        _remote_client = RemoteEmbedder(path, timeout=getattr(settings, "CLIP_SERVICE_TIMEOUT", 10))
+    return _remote_client
+
+
+_remote_client = None
+
+
+def is_loaded() -> bool:
+    """Whether the model is in memory (client mode: whether the worker pool answers)."""
+    remote = _remote()
+    if remote is not None:
+        return remote.ping()
+    return bool(_models)
+
+
+def warm_up() -> float:
+    """Load the model and run one image and one text forward pass.
+
+    The first real request then skips weight loading and torch's lazy
+    initialisation. Returns the elapsed seconds.
+    """
+    started = time.perf_counter()
+    if _remote() is not None:
+        get_text_embedding("warm up")
+        return time.perf_counter() - started
+    _load_clip()
+    _embed_images([Image.new("RGB", (224, 224))])
+    _embed_texts(["warm up"])
+    return time.perf_counter() - started
+
+
+class _LatencyStats:
+    """Rolling window of forward-pass timings per modality."""
+
+    def __init__(self, window: int = 1000):
+        self._samples = {"image": deque(maxlen=window), "text": deque(maxlen=window)}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, batch_size: int, seconds: float) -> None:
+        with self._lock:
+            self._samples[kind].append((batch_size, seconds))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = {kind: list(values) for kind, values in self._samples.items()}
+        out = {}
+        for kind, values in samples.items():
+            if not values:
+                out[kind] = {"calls": 0}
+                continue
+            ms = sorted(sec * 1000 for _, sec in values)
+            out[kind] = {
+                "calls": len(ms),
+                "mean_batch": round(sum(b for b, _ in values) / len(values), 2),
+                "mean_ms": round(sum(ms) / len(ms), 2),
+                "p50_ms": _percentile(ms, 0.50),
+                "p95_ms": _percentile(ms, 0.95),
+                "p99_ms": _percentile(ms, 0.99),
+            }
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            for values in self._samples.values():
+                values.clear()
+
+
+_latency = _LatencyStats()
+
+
+def latency_stats() -> dict:
+    """Forward-pass latency over the last calls, per modality."""
+    stats = _latency.snapshot()
+    stats["quantized"] = _quantize_enabled()
+    torch = sys.modules.get("torch")
+    stats["torch_threads"] = torch.get_num_threads() if torch is not None else None
+    return stats
+
+
+def _to_rgb(image) -> Image.Image:
+    """Coerce a PIL image, numpy array or torch tensor to a PIL RGB image."""
     # Ensure we have a PIL RGB image. Accept numpy arrays or torch tensors too.
     try:
         if isinstance(image, Image.Image):
@@ -40,10 +189,10 @@ def get_image_embedding(image: Image.Image) -> List[float]:
                     pil_img = Image.fromarray(image.astype('uint8'))
                 image = pil_img.convert('RGB')
             else:
-                # torch tensor -> convert to numpy
+                # torch tensor -> convert to numpy (only possible if torch is loaded)
                 try:
-                    import torch as _torch
-                    if isinstance(image, _torch.Tensor):
+                    _torch = sys.modules.get("torch")
+                    if _torch is not None and isinstance(image, _torch.Tensor):
                         arr = image.detach().cpu().numpy()
                         # if (C,H,W) -> (H,W,C)
                         if arr.ndim == 3 and arr.shape[0] in (1,3,4):
@@ -59,44 +208,206 @@ def get_image_embedding(image: Image.Image) -> List[float]:
         # If conversion logic fails, continue and let processor raise a clear error
         pass
 
+    # Ensure minimum size to avoid ambiguous channel dimensions
+    if hasattr(image, 'size'):
+        w, h = image.size
+        if w < 10 or h < 10:
+            # Resize very small images to minimum 224x224 (CLIP's expected size)
+            image = image.resize((max(224, w), max(224, h)), Image.LANCZOS)
+    return image
+
+
+def _embed_images(images: Sequence[Image.Image], quantized: Optional[bool] = None) -> List[List[float]]:
+    """One forward pass over already-coerced RGB images."""
+    import torch
+
+    model, processor, device = _load_clip(quantized)
+    started = time.perf_counter()
     # Build inputs and move tensors to device explicitly
     try:
-        # Ensure minimum size to avoid ambiguous channel dimensions
-        if hasattr(image, 'size'):
-            w, h = image.size
-            if w < 10 or h < 10:
-                # Resize very small images to minimum 224x224 (CLIP's expected size)
-                image = image.resize((max(224, w), max(224, h)), Image.LANCZOS)
-        
-        inputs = processor(images=[image], return_tensors="pt", padding=True)
+        inputs = processor(images=list(images), return_tensors="pt", padding=True)
         # Move all tensors to device
         inputs = {k: v.to(device) for k, v in inputs.items()}
     except Exception as e:
         # add context about the input to help debugging
-        img_type = type(image).__name__
-        img_mode = getattr(image, 'mode', None)
-        img_size = getattr(image, 'size', None)
-        raise RuntimeError(
-            f"Failed to preprocess image for CLIP: {e} -- input type={img_type}, mode={img_mode}, size={img_size}"
+        desc = ", ".join(
+            f"type={type(img).__name__}, mode={getattr(img, 'mode', None)}, size={getattr(img, 'size', None)}"
+            for img in images
         )
+        raise RuntimeError(f"Failed to preprocess image for CLIP: {e} -- inputs: {desc}")
 
     with torch.inference_mode():
         feats = model.get_image_features(**inputs)
         # KHÔNG normalize - giống notebook gốc
         # Cosine similarity sẽ được tính trong views.py với L2 normalization
 
-    return feats[0].cpu().tolist()
+    result = feats.cpu().tolist()
+    _latency.record("image", len(result), time.perf_counter() - started)
+    return result
 
 
-def get_text_embedding(text: str) -> List[float]:
-    """Return CLIP text embedding as a list of floats."""
-    model, processor, device = _load_clip()
-    
-    inputs = processor(text=[text], return_tensors="pt", padding=True)
+_TEXT_MAX_TOKENS = 77
+
+
+def _embed_texts(texts: Sequence[str], quantized: Optional[bool] = None) -> List[List[float]]:
+    """One forward pass over a batch of texts, padded to the longest one."""
+    import torch
+
+    model, processor, device = _load_clip(quantized)
+    started = time.perf_counter()
+
+    # CLIP's position embeddings stop at 77 tokens: longer queries are cut, not rejected
+    inputs = processor(
+        text=list(texts), return_tensors="pt", padding=True, truncation=True, max_length=_TEXT_MAX_TOKENS
+    )
     inputs = {k: v.to(device) for k, v in inputs.items()}
-    
+
     with torch.inference_mode():
         text_features = model.get_text_features(**inputs)
         # KHÔNG normalize - để views.py xử lý
-    
-    return text_features[0].cpu().tolist()
+
+    result = text_features.cpu().tolist()
+    _latency.record("text", len(result), time.perf_counter() - started)
+    return result
+
+
+class _MicroBatcher:
+    """Collects concurrent requests and runs them through ``batch_fn`` together.
+
+    A daemon thread blocks for the first request, then keeps collecting until
+    ``max_size`` items are queued or ``max_wait`` seconds have passed since the
+    first one arrived. A request may carry several items (e.g. full image +
+    ROI crop); they always run in the same forward pass. Each caller waits on
+    its own Future, which resolves to the list of its items' results. If a
+    batched pass fails, each request is retried alone, so a bad input only
+    fails its own caller.
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[list], list], max_size: int, max_wait: float):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_size = max(1, int(max_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"clip-batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, items: Sequence) -> Future:
+        future: Future = Future()
+        self._queue.put((list(items), future))
+        return future
+
+    def pending(self) -> int:
+        """Requests queued but not yet picked up by a batch."""
+        return self._queue.qsize()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Skip callers that cancelled while queued
+            batch = [(items, f) for items, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            flat = [item for items, _ in batch for item in items]
+            try:
+                results = self.batch_fn(flat)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # Retry each request on its own so one bad input only fails its caller
+                for items, f in batch:
+                    try:
+                        f.set_result(self.batch_fn(items))
+                    except Exception as item_error:
+                        f.set_exception(item_error)
+                continue
+            offset = 0
+            for items, f in batch:
+                f.set_result(results[offset:offset + len(items)])
+                offset += len(items)
+
+
+_batchers: dict = {}
+_batchers_lock = threading.Lock()
+
+
+def _batching_enabled() -> bool:
+    return getattr(settings, "CLIP_BATCHING", False)
+
+
+def _batcher(kind: str) -> _MicroBatcher:
+    batcher = _batchers.get(kind)
+    if batcher is None:
+        with _batchers_lock:
+            batcher = _batchers.get(kind)
+            if batcher is None:
+                batch_fn = _embed_images if kind == "image" else _embed_texts
+                batcher = _MicroBatcher(
+                    kind,
+                    batch_fn,
+                    max_size=getattr(settings, "CLIP_BATCH_MAX_SIZE", 16),
+                    max_wait=getattr(settings, "CLIP_BATCH_MAX_WAIT_MS", 5) / 1000.0,
+                )
+                _batchers[kind] = batcher
+    return batcher
+
+
+def pending_requests() -> int:
+    """Embedding requests waiting in the micro-batch queues."""
+    return sum(b.pending() for b in list(_batchers.values()))
+
+
+def get_image_embedding(image: Image.Image) -> List[float]:
+    """Return the (unnormalized) CLIP image embedding as a list of floats."""
+    image = _to_rgb(image)
+    remote = _remote()
+    if remote is not None:
+        return remote.embed_images([image])[0]
+    if _batching_enabled():
+        return _batcher("image").submit([image]).result()[0]
+    return _embed_images([image])[0]
+
+
+def get_image_embeddings(images: Sequence[Image.Image]) -> List[List[float]]:
+    """Embeddings for several images in one forward pass, in input order.
+
+    Small lists (up to ``CLIP_BATCH_MAX_SIZE``) go through the micro-batcher as
+    one request, so they share a pass with concurrent searches; larger ones,
+    such as backfill batches, run directly.
+    """
+    images = [_to_rgb(img) for img in images]
+    if not images:
+        return []
+    remote = _remote()
+    if remote is not None:
+        return remote.embed_images(images)
+    if _batching_enabled() and len(images) <= getattr(settings, "CLIP_BATCH_MAX_SIZE", 16):
+        return _batcher("image").submit(images).result()
+    return _embed_images(images)
+
+
+def get_text_embedding(text: str) -> List[float]:
+    """Return CLIP text embedding as a list of floats."""
+    remote = _remote()
+    if remote is not None:
+        return remote.embed_texts([text])[0]
+    if _batching_enabled():
+        return _batcher("text").submit([text]).result()[0]
+    return _embed_texts([text])[0]
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, Category, WishlistItem, SavedItem
+from .models import Product, Category, WishlistItem, SavedItem, DuplicateCluster, DuplicateMember
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -27,4 +27,48 @@ class WishlistItemAdmin(admin.ModelAdmin):
 class SavedItemAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'product', 'quantity', 'color', 'size', 'moved_from_cart_at')
     search_fields = ('user__username', 'product__name')
-    list_filter = ('moved_from_cart_at',)
\ No newline at end of file
+    list_filter = ('moved_from_cart_at',)
+
+
+class DuplicateMemberInline(admin.TabularInline):
+    model = DuplicateMember
+    extra = 0
+    fields = ('product', 'is_representative', 'score', 'name_score')
+    readonly_fields = fields
+    raw_id_fields = ('product',)
+    can_delete = False
+
+
+@admin.register(DuplicateCluster)
+class DuplicateClusterAdmin(admin.ModelAdmin):
+    list_display = ('id', 'size', 'score', 'status', 'created_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('members__product__name',)
+    inlines = [DuplicateMemberInline]
+    actions = ['mark_confirmed', 'mark_rejected', 'deactivate_duplicates']
+
+    @admin.action(description='Đánh dấu là trùng lặp')
+    def mark_confirmed(self, request, queryset):
+        for cluster in queryset:
+            cluster.status = DuplicateCluster.STATUS_CONFIRMED
+            cluster.save(update_fields=['status', 'updated_at'])
+
+    @admin.action(description='Đánh dấu là không trùng')
+    def mark_rejected(self, request, queryset):
+        for cluster in queryset:
+            cluster.status = DuplicateCluster.STATUS_REJECTED
+            cluster.save(update_fields=['status', 'updated_at'])
+
+    @admin.action(description='Ẩn các bản trùng (giữ sản phẩm đại diện)')
+    def deactivate_duplicates(self, request, queryset):
+        hidden = 0
+        members = DuplicateMember.objects.filter(
+            cluster__in=queryset, is_representative=False, product__is_active=True
+        ).select_related('product')
+        for member in members:
+            # save() so the search indexes drop the product via the signals
+            member.product.is_active = False
+            member.product.save(update_fields=['is_active', 'updated_at'])
+            hidden += 1
+        queryset.update(status=DuplicateCluster.STATUS_CONFIRMED)
+        self.message_user(request, f'Đã ẩn {hidden} sản phẩm trùng lặp.')
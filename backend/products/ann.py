@@ -0,0 +1,248 @@
+"""Approximate nearest-neighbour engines layered on top of ``EmbeddingIndex``.
+
+An engine is built from the rows of an index and answers top-k cosine
+queries over those rows. It records the index ``generation`` it was built
+from and reports itself stale once rows move or too many rows were appended
+after the build, at which point the index rebuilds it. Rows appended after
+the build are always scanned exactly, so fresh products are never missed.
+
+Engines:
+    ivf   inverted file with a spherical k-means coarse quantizer. ``nprobe``
+          lists are scanned per query; more lists probed = higher recall and
+          higher latency.
+    int8  per-dimension scalar quantization to int8. Candidates are scored
+          on the codes (a quarter of the float32 bytes per scanned row), then
+          the best ``rerank`` of them are re-scored with the float32 rows.
+          The codes come on top of the float32 matrix: memory per worker only
+          drops when the float32 rows are memory-mapped from a shared
+          snapshot (``SEARCH_INDEX_SNAPSHOT_DIR``), where a query touches just
+          the rows it re-scores and the pages are shared by all workers.
+"""
+import math
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .search_index import top_k
+
+# Rows processed per block, to bound temporary (rows x dim) float buffers
+_BLOCK_ROWS = 16384
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on L2-normalized rows. Returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    n_clusters = max(1, min(n_clusters, n))
+    centroids = vectors[rng.choice(n, n_clusters, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        counts = np.bincount(assign, minlength=n_clusters)
+        # Sum members per cluster via one sort + reduceat (np.add.at is very slow)
+        order = np.argsort(assign, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        nonempty = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(vectors[order], starts[nonempty], axis=0)
+        if not nonempty.all():
+            # Re-seed empty clusters with random points so every list is used
+            sums[~nonempty] = vectors[rng.choice(n, int((~nonempty).sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class _Engine(ABC):
+    """Shared bookkeeping: which index rows the engine was built over."""
+
+    name = ""
+    # Parameter swept by ``manage.py bench_ann``
+    tuning_param = ""
+    # Rebuild once rows appended after the build exceed this share of the index
+    _MAX_TAIL_RATIO = 0.1
+
+    def __init__(self, built_size: int, generation: int):
+        self.built_size = built_size
+        self.generation = generation
+
+    def is_stale(self, index) -> bool:
+        if index.generation != self.generation:
+            return True
+        vectors, _ids, _alive = index.arrays()
+        tail = vectors.shape[0] - self.built_size
+        # Fewer rows than at the build: the engine points past the end of the index
+        return tail < 0 or tail > max(1024, self.built_size * self._MAX_TAIL_RATIO)
+
+    def _tail_rows(self, n_rows: int) -> Optional[np.ndarray]:
+        """Rows appended after the build; they are not in the engine yet."""
+        if n_rows > self.built_size:
+            return np.arange(self.built_size, n_rows)
+        return None
+
+    @classmethod
+    @abstractmethod
+    def build(cls, index, seed: int = 0) -> "_Engine":
+        """Build the engine over the current rows of ``index``."""
+
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        """Bytes held by the engine on top of the index arrays."""
+
+    @abstractmethod
+    def search(
+        self, index, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None, **params,
+    ) -> List[Tuple[int, float]]:
+        """Top ``k`` ``(product_id, score)`` pairs for a normalized ``query``, best first."""
+
+
+def _exact_rerank(
+    index, query: np.ndarray, rows: np.ndarray, k: int, mask: Optional[np.ndarray] = None
+) -> List[Tuple[int, float]]:
+    """Exact float32 scores for ``rows``; returns the top-k as (product_id, score).
+
+    ``mask`` (live rows passing the search filters) replaces the alive flags.
+    """
+    vectors, ids, alive = index.arrays()
+    allowed = alive if mask is None else mask
+    # Rows appended after the mask was taken (or gone since the build) are left out
+    rows = rows[rows < min(allowed.shape[0], vectors.shape[0])]
+    if rows.size == 0:
+        return []
+    scores = vectors[rows] @ query
+    scores[~allowed[rows]] = -np.inf
+    best = top_k(scores, k)
+    return [(int(ids[rows[i]]), float(scores[i])) for i in best if np.isfinite(scores[i])]
+
+
+class IVFIndex(_Engine):
+    """Inverted-file index: rows bucketed by their nearest k-means centroid."""
+
+    name = "ivf"
+    tuning_param = "nprobe"
+    # Train the quantizer on at most this many rows per list
+    _TRAIN_POINTS_PER_LIST = 32
+
+    def __init__(self, centroids: np.ndarray, list_rows: List[np.ndarray], built_size: int, generation: int):
+        super().__init__(built_size, generation)
+        self.centroids = centroids
+        self.list_rows = list_rows
+
+    @classmethod
+    def build(cls, index, n_lists: Optional[int] = None, seed: int = 0):
+        vectors, _ids, _alive = index.arrays()
+        n = vectors.shape[0]
+        if n_lists is None:
+            n_lists = getattr(settings, "PRODUCT_SEARCH_IVF_LISTS", None) or int(4 * math.sqrt(n))
+        n_lists = max(1, min(int(n_lists), n))
+
+        rng = np.random.default_rng(seed)
+        train_size = min(n, n_lists * cls._TRAIN_POINTS_PER_LIST)
+        train = vectors[rng.choice(n, train_size, replace=False)] if train_size < n else vectors
+        centroids = kmeans(np.ascontiguousarray(train), n_lists, seed=seed)
+
+        # Assign every row in blocks to bound the (rows x lists) score matrix
+        assign = np.empty(n, dtype=np.int32)
+        for start in range(0, n, _BLOCK_ROWS):
+            block = vectors[start:start + _BLOCK_ROWS]
+            assign[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(centroids.shape[0] + 1))
+        list_rows = [order[bounds[i]:bounds[i + 1]] for i in range(centroids.shape[0])]
+        return cls(centroids, list_rows, n, index.generation)
+
+    @property
+    def nbytes(self) -> int:
+        return self.centroids.nbytes + sum(rows.nbytes for rows in self.list_rows)
+
+    def search(
+        self, index, query: np.ndarray, k: int, nprobe: Optional[int] = None,
+        mask: Optional[np.ndarray] = None, **_params,
+    ) -> List[Tuple[int, float]]:
+        vectors, _ids, _alive = index.arrays()
+        if nprobe is None:
+            nprobe = getattr(settings, "PRODUCT_SEARCH_IVF_NPROBE", 8)
+        nprobe = max(1, min(int(nprobe), len(self.list_rows)))
+
+        probe = top_k(self.centroids @ query, nprobe)
+        parts = [self.list_rows[c] for c in probe]
+        tail = self._tail_rows(vectors.shape[0])
+        if tail is not None:
+            parts.append(tail)
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        return _exact_rerank(index, query, rows, k, mask)
+
+
+class Int8Index(_Engine):
+    """Scalar-quantized codes: ``x[d] ~= codes[d] * scale[d]`` with int8 codes.
+
+    Scores are computed asymmetrically: the float query is multiplied by the
+    per-dimension scales once, then dotted with the int8 codes block by block.
+    The float32 rows stay in the index for the re-rank, so this only saves
+    memory when they are memory-mapped from a snapshot (see module docstring).
+    """
+
+    name = "int8"
+    tuning_param = "rerank"
+
+    def __init__(self, codes: np.ndarray, scale: np.ndarray, built_size: int, generation: int):
+        super().__init__(built_size, generation)
+        self.codes = codes
+        self.scale = scale
+
+    @classmethod
+    def build(cls, index, seed: int = 0):
+        vectors, _ids, _alive = index.arrays()
+        n = vectors.shape[0]
+        scale = np.abs(vectors).max(axis=0) / 127.0 if n else np.zeros(index.dim, dtype=np.float32)
+        scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+        codes = np.empty((n, index.dim), dtype=np.int8)
+        for start in range(0, n, _BLOCK_ROWS):
+            block = vectors[start:start + _BLOCK_ROWS]
+            codes[start:start + block.shape[0]] = np.clip(np.rint(block / scale), -127, 127)
+        return cls(codes, scale, n, index.generation)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scale.nbytes
+
+    # Small blocks keep the widened float32 copy of the codes in cache
+    _SCORE_BLOCK_ROWS = 1024
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        scaled = query * self.scale
+        scores = np.empty(self.codes.shape[0], dtype=np.float32)
+        for start in range(0, self.codes.shape[0], self._SCORE_BLOCK_ROWS):
+            block = self.codes[start:start + self._SCORE_BLOCK_ROWS]
+            scores[start:start + block.shape[0]] = block.astype(np.float32) @ scaled
+        return scores
+
+    def search(
+        self, index, query: np.ndarray, k: int, rerank: Optional[int] = None,
+        mask: Optional[np.ndarray] = None, **_params,
+    ) -> List[Tuple[int, float]]:
+        vectors, _ids, alive = index.arrays()
+        allowed = alive if mask is None else mask
+        if rerank is None:
+            rerank = getattr(settings, "PRODUCT_SEARCH_INT8_RERANK", 100)
+        rerank = max(int(rerank), k)
+
+        approx = self.approximate_scores(query)
+        if allowed.shape[0] < self.built_size:
+            # Mask taken over fewer rows than the engine was built with: the rest stay out
+            allowed = np.concatenate([allowed, np.zeros(self.built_size - allowed.shape[0], dtype=bool)])
+        approx[~allowed[: self.built_size]] = -np.inf
+        rows = top_k(approx, rerank)
+        tail = self._tail_rows(vectors.shape[0])
+        if tail is not None:
+            rows = np.concatenate([rows, tail])
+        return _exact_rerank(index, query, rows, k, mask)
+
+
+ENGINES = {
+    IVFIndex.name: IVFIndex,
+    Int8Index.name: Int8Index,
+}
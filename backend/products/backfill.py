@@ -0,0 +1,206 @@
+"""Resumable, batched CLIP embedding backfill for products.
+
+Three stages overlap:
+    1. a thread pool downloads/decodes the images of the *next* batch,
+    2. the current batch runs through CLIP as one forward pass,
+    3. results are written with a single ``bulk_update``.
+
+After every written batch the highest processed product id is saved to a
+JSON checkpoint, so an interrupted run continues from there. The checkpoint
+is removed once a run completes.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .delta_log import record_upsert
+from .embeddings import current_model_name
+from .image_io import open_product_image
+from .models import Product
+from .search_cache import bump_catalog_version
+from .search_index import product_attributes
+
+
+def default_checkpoint_path() -> Path:
+    return Path(getattr(settings, "EMBEDDING_BACKFILL_CHECKPOINT", settings.BASE_DIR / ".backfill_checkpoint.json"))
+
+
+@dataclass
+class BackfillState:
+    model: str
+    only_missing: bool
+    last_id: int = 0
+    processed: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: int = 0
+    failed_ids: List[int] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, path: Path, model: str, only_missing: bool) -> "BackfillState":
+        """Resume from ``path`` if it was written for the same model and mode."""
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return cls(model=model, only_missing=only_missing)
+        if data.get("model") != model or data.get("only_missing") != only_missing:
+            return cls(model=model, only_missing=only_missing)
+        return cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
+
+    def save(self, path: Path) -> None:
+        # Write-then-rename so a crash never leaves a truncated checkpoint
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(asdict(self)), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def store_embeddings(products: List[Product]) -> None:
+    """Write the embeddings set on ``products`` with one ``bulk_update``.
+
+    The products must have been loaded with their filter attributes
+    (category/seller/price/stock) for the live index upsert.
+    """
+    if not products:
+        return
+    with transaction.atomic():
+        Product.objects.bulk_update(products, Product.EMBEDDING_SAVE_FIELDS)
+    # bulk_update skips post_save, so sync the index (and its log) and the result cache by hand
+    bump_catalog_version()
+    for p in products:
+        record_upsert(p.id, p.embedding_vector, product_attributes(p))
+
+
+class EmbeddingBackfill:
+    def __init__(
+        self,
+        only_missing: bool = True,
+        batch_size: int = 32,
+        workers: int = 8,
+        checkpoint: Optional[Path] = None,
+        resume: bool = True,
+        limit: Optional[int] = None,
+        log: Callable[[str], None] = print,
+    ):
+        self.only_missing = only_missing
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.checkpoint = Path(checkpoint) if checkpoint else default_checkpoint_path()
+        self.limit = limit
+        self.log = log
+        self.model = current_model_name()
+        if resume:
+            self.state = BackfillState.load(self.checkpoint, self.model, only_missing)
+        else:
+            self.state = BackfillState(model=self.model, only_missing=only_missing)
+
+    def queryset(self):
+        qs = Product.objects.filter(is_active=True, id__gt=self.state.last_id)
+        if self.only_missing:
+            # missing, or computed with a different CLIP checkpoint or quantization
+            qs = qs.filter(Q(embedding__isnull=True) | ~Q(embedding_model=self.model))
+        return qs.order_by("id")
+
+    def _batches(self):
+        qs = self.queryset().only("id", "image", "image_url", "category_id", "seller_id", "price", "stock")
+        if self.limit is not None:
+            qs = qs[: self.limit]
+        batch = []
+        for product in qs.iterator(chunk_size=self.batch_size * 4):
+            batch.append(product)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def run(self) -> BackfillState:
+        import clip_service
+
+        total = self.queryset().count()
+        if self.limit is not None:
+            total = min(total, self.limit)
+        if total == 0:
+            self.log("✅ Không có sản phẩm cần backfill.")
+            return self.state
+        if self.state.last_id:
+            self.log(f"↩️  Resuming after product {self.state.last_id} ({self.state.processed} done before)")
+        self.log(f"🔄 Backfill embeddings cho {total} sản phẩm (only_missing={self.only_missing})")
+
+        started = time.perf_counter()
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backfill-io") as pool:
+            batches = self._batches()
+            current = next(batches, None)
+            pending = [pool.submit(self._load, p) for p in current] if current else []
+            while current:
+                # Start loading the next batch before running this one through CLIP
+                upcoming = next(batches, None)
+                upcoming_futures = [pool.submit(self._load, p) for p in upcoming] if upcoming else []
+
+                self._process(current, [f.result() for f in pending], clip_service)
+                done += len(current)
+                rate = done / max(time.perf_counter() - started, 1e-6)
+                eta = (total - done) / rate if rate else 0
+                self.log(
+                    f"  📦 {done}/{total} ({rate:.1f}/s, ETA {eta:.0f}s) "
+                    f"updated={self.state.updated} skipped={self.state.skipped} errors={self.state.errors}"
+                )
+                current, pending = upcoming, upcoming_futures
+
+        # A finished run starts from scratch next time
+        self.checkpoint.unlink(missing_ok=True)
+        self.log("✅ Hoàn tất backfill")
+        self.log(
+            f"📊 Processed: {self.state.processed}, Updated: {self.state.updated}, "
+            f"Skipped: {self.state.skipped}, Errors: {self.state.errors}"
+        )
+        return self.state
+
+    def _load(self, product):
+        try:
+            return open_product_image(product)
+        except Exception:
+            return None
+
+    def _process(self, products, images, clip_service) -> None:
+        ready = [(p, img) for p, img in zip(products, images) if img is not None]
+        self.state.skipped += len(products) - len(ready)
+
+        vectors = []
+        if ready:
+            try:
+                vectors = clip_service.get_image_embeddings([img for _, img in ready])
+            except Exception as e:
+                # Fall back to one-by-one so a single bad image does not sink the batch
+                self.log(f"⚠️ Batch failed ({e}); retrying items individually")
+                vectors = []
+                for p, img in ready:
+                    try:
+                        vectors.append(clip_service.get_image_embeddings([img])[0])
+                    except Exception as item_error:
+                        self.log(f"❌ Lỗi sản phẩm {p.id}: {item_error}")
+                        self.state.errors += 1
+                        self.state.failed_ids.append(p.id)
+                        vectors.append(None)
+
+        changed = []
+        for (p, img), vec in zip(ready, vectors):
+            img.close()
+            if vec is None:
+                continue
+            p.set_embedding(vec, model_name=self.model)
+            changed.append(p)
+
+        store_embeddings(changed)
+        self.state.updated += len(changed)
+        self.state.processed += len(products)
+        self.state.last_id = products[-1].id
+        self.state.save(self.checkpoint)
@@ -0,0 +1,129 @@
+"""Helpers for the search benchmarks (``manage.py bench_search`` / ``bench_ann``).
+
+Catalogs are synthetic: clustered random vectors, L2-normalized, with random
+filter attributes, wrapped in an ``EmbeddingIndex`` without going through the
+database. CLIP is replaced by ``stub_clip`` so view benchmarks measure the
+search path only (decode, cache lookups, scoring, ORM, serialization).
+"""
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+
+from .search_index import ATTRIBUTES, EmbeddingIndex
+
+# Rows generated per step, so 1M x 512 does not need several full-size temporaries
+_CHUNK_ROWS = 65536
+
+
+def synthetic_embeddings(rows: int, dim: int = 512, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """Clustered random vectors, closer to real catalog embeddings than pure noise (normalized)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    out = np.empty((rows, dim), dtype=np.float32)
+    for start in range(0, rows, _CHUNK_ROWS):
+        n = min(_CHUNK_ROWS, rows - start)
+        block = centers[rng.integers(0, clusters, n)]
+        block += 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        out[start:start + n] = block
+    return out
+
+
+def synthetic_index(rows: int, dim: int = 512, seed: int = 0, first_id: int = 1) -> EmbeddingIndex:
+    """Index of ``rows`` synthetic products with ids ``first_id..`` and random attributes."""
+    rng = np.random.default_rng(seed + 1)
+    attrs = {
+        "category": rng.integers(1, 51, rows),
+        "seller": rng.integers(1, 21, rows),
+        "price": rng.uniform(10_000, 2_000_000, rows).round(-3),
+        "stock": rng.integers(0, 100, rows),
+    }
+    attrs = {name: attrs[name].astype(dtype) for name, (dtype, _fill) in ATTRIBUTES.items()}
+    ids = np.arange(first_id, first_id + rows, dtype=np.int64)
+    vectors = synthetic_embeddings(rows, dim, seed=seed)
+    return EmbeddingIndex.from_arrays(vectors, ids, np.ones(rows, dtype=bool), attrs, rows)
+
+
+def query_vectors(index: EmbeddingIndex, count: int, seed: int = 0) -> List[np.ndarray]:
+    """Perturbed copies of random catalog rows (queries near real products)."""
+    rng = np.random.default_rng(seed + 2)
+    vectors, _ids, _alive = index.arrays()
+    picks = rng.choice(vectors.shape[0], min(count, vectors.shape[0]), replace=False)
+    queries = vectors[picks] + 0.05 * rng.standard_normal((picks.shape[0], index.dim)).astype(np.float32)
+    return list(queries / np.linalg.norm(queries, axis=1, keepdims=True))
+
+
+def summarize(latency_ms: Sequence[float]) -> Dict[str, float]:
+    lat = np.asarray(latency_ms, dtype=np.float64)
+    return {
+        "n": int(lat.shape[0]),
+        "mean_ms": round(float(lat.mean()), 4),
+        "p50_ms": round(float(np.percentile(lat, 50)), 4),
+        "p95_ms": round(float(np.percentile(lat, 95)), 4),
+        "p99_ms": round(float(np.percentile(lat, 99)), 4),
+    }
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KiB on Linux, bytes on macOS; only the peak is available here
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def environment() -> dict:
+    return {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+@contextmanager
+def stub_clip(vectors: Iterator[np.ndarray]) -> Iterator[None]:
+    """Replace the CLIP entry points with ones that hand out ``vectors`` in turn."""
+    import clip_service
+
+    def one(_item):
+        return next(vectors).tolist()
+
+    with mock.patch.multiple(
+        clip_service,
+        is_loaded=lambda: True,
+        get_text_embedding=one,
+        get_image_embedding=one,
+        get_image_embeddings=lambda items: [one(item) for item in items],
+    ):
+        yield
@@ -0,0 +1,127 @@
+"""Catch up with database changes made by other processes.
+
+Without ``SEARCH_INDEX_SNAPSHOT_DIR`` there is no delta log: every worker
+builds its embedding index from the database, and the product signals only
+update the index of the process that saved. To pick up changes made by other
+workers, management commands or ``queryset.update()``, ``get_index()``
+compares a cheap signature of the products table (row count and latest
+``updated_at``) with the one taken at the last sync, every
+``SEARCH_INDEX_CHECK_INTERVAL`` seconds. When it moved, a background thread
+re-reads the products updated since then and applies them, then drops indexed
+ids that are gone from the database.
+
+The BM25 index (``products.lexical``) is not part of snapshots or the delta
+log, so it is synced the same way in every configuration.
+
+Rows are re-read from ``_OVERLAP`` before the last seen ``updated_at``, so a
+transaction that committed a little after its timestamp is not missed;
+applying a row twice is harmless. With many workers and a busy catalog,
+snapshots plus the delta log remain the cheaper option.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from django.db.models import Count, Max
+
+from .embeddings import current_model_name, unpack_embedding
+from .search_index import EmbeddingIndex
+
+logger = logging.getLogger(__name__)
+
+_OVERLAP = timedelta(seconds=60)
+
+Signature = Tuple[int, Optional[datetime]]
+
+
+def signature() -> Signature:
+    """``(row count, latest updated_at)`` of the products table."""
+    from .models import Product
+
+    stats = Product.objects.aggregate(count=Count("id"), last=Max("updated_at"))
+    return stats["count"], stats["last"]
+
+
+def _indexable():
+    from .models import Product
+
+    return Product.objects.filter(is_active=True, embedding_model=current_model_name()).exclude(
+        embedding__isnull=True
+    )
+
+
+def _changed_rows(previous: Signature, *fields: str):
+    """``fields`` of the products updated since the ``previous`` signature (with overlap)."""
+    from .models import Product
+
+    rows = Product.objects.all()
+    if previous[1] is not None:
+        rows = rows.filter(updated_at__gte=previous[1] - _OVERLAP)
+    return rows.values_list(*fields).iterator(chunk_size=2000)
+
+
+def _gone(indexed_ids, expected) -> set:
+    """Ids in ``indexed_ids`` missing from the ``expected`` queryset."""
+    return set(indexed_ids) - set(expected.values_list("id", flat=True).iterator(chunk_size=10000))
+
+
+def sync_index(index: EmbeddingIndex) -> int:
+    """Apply database changes made since ``index.db_signature``. Returns the rows re-read.
+
+    Does nothing (and returns 0) while the signature has not moved.
+    """
+    previous = index.db_signature
+    current = signature()
+    if previous is None or current == previous:
+        return 0
+
+    fields = ("id", "is_active", "embedding", "embedding_dim", "embedding_model", "category_id", "seller_id", "price", "stock")
+    model = current_model_name()
+    seen = 0
+    for pid, active, blob, dim, embedding_model, category, seller, price, stock in _changed_rows(previous, *fields):
+        seen += 1
+        vector = unpack_embedding(blob, dim) if active and embedding_model == model else None
+        if vector is None:
+            index.remove(pid)
+            continue
+        index.upsert(pid, vector, {
+            "category": category if category is not None else -1,
+            "seller": seller,
+            "price": float(price),
+            "stock": stock,
+        })
+
+    # Deleted products leave no row behind to re-read
+    if len(index) != _indexable().count():
+        _vectors, ids, alive = index.arrays()
+        for pid in _gone(ids[alive].tolist(), _indexable()):
+            index.remove(pid)
+    index.db_signature = current
+    if seen:
+        logger.info("Synced %d changed products into the search index", seen)
+    return seen
+
+
+def sync_lexical(index) -> int:
+    """``sync_index`` for a ``LexicalIndex``: names and descriptions of active products."""
+    from .models import Product
+
+    previous = index.db_signature
+    current = signature()
+    if previous is None or current == previous:
+        return 0
+
+    seen = 0
+    for pid, active, name, description in _changed_rows(previous, "id", "is_active", "name", "description"):
+        seen += 1
+        if active:
+            index.upsert(pid, name, description)
+        else:
+            index.remove(pid)
+
+    active = Product.objects.filter(is_active=True)
+    if len(index) != active.count():
+        for pid in _gone(index.product_ids(), active):
+            index.remove(pid)
+    index.db_signature = current
+    return seen
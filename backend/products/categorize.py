@@ -0,0 +1,214 @@
+"""Zero-shot category assignment for uncategorized products.
+
+Every candidate category gets one prototype vector in CLIP space:
+
+    prompt    the text embedding of ``PRODUCT_CATEGORIZE_PROMPT`` filled with
+              the category name ("a photo of {name}").
+    centroid  the mean image embedding of the products already in that
+              category (categories with fewer than
+              ``PRODUCT_CATEGORIZE_MIN_EXAMPLES`` products are left out).
+
+Product vectors are scored against all prototypes with one matrix multiply
+per block of products. Scores go through a softmax at CLIP's logit scale, and
+a product is moved only when the winning category's probability reaches the
+confidence threshold; the rest stay where they were.
+
+"Uncategorized" means no category, or the placeholder category
+``PRODUCT_CATEGORIZE_FALLBACK`` that ``scripts/import_products.py`` uses for
+rows without one. The placeholder is never a prediction.
+"""
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .delta_log import record_attributes
+from .models import Category, Product
+from .search_cache import bump_catalog_version, cached_text_embedding
+from .search_index import EmbeddingIndex, get_index, l2_normalize
+
+METHODS = ("prompt", "centroid")
+
+# CLIP's learned temperature: cosine * 100 are the logits it was trained with
+_LOGIT_SCALE = 100.0
+_BLOCK_ROWS = 8192
+
+
+class Prediction(NamedTuple):
+    product_id: int
+    category_id: int
+    confidence: float
+    assigned: bool
+
+
+def fallback_name() -> str:
+    return getattr(settings, "PRODUCT_CATEGORIZE_FALLBACK", "Uncategorized")
+
+
+def min_confidence() -> float:
+    return float(getattr(settings, "PRODUCT_CATEGORIZE_MIN_CONFIDENCE", 0.5))
+
+
+def uncategorized_filter() -> Q:
+    return Q(category__isnull=True) | Q(category__name__iexact=fallback_name())
+
+
+def _candidate_categories() -> List[Category]:
+    return list(Category.objects.filter(is_active=True).exclude(name__iexact=fallback_name()).order_by("id"))
+
+
+def prompt_prototypes(categories: List[Category], template: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """``(category_ids, prototypes)`` from CLIP text embeddings of the category names."""
+    template = template or getattr(settings, "PRODUCT_CATEGORIZE_PROMPT", "a photo of {name}")
+    if not categories:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.float32)
+    vectors = np.stack([l2_normalize(cached_text_embedding(template.format(name=c.name))) for c in categories])
+    return np.asarray([c.id for c in categories], dtype=np.int64), vectors
+
+
+def centroid_prototypes(
+    categories: List[Category], index: EmbeddingIndex, min_examples: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """``(category_ids, prototypes)`` from the mean indexed vector of each category."""
+    if min_examples is None:
+        min_examples = int(getattr(settings, "PRODUCT_CATEGORIZE_MIN_EXAMPLES", 3))
+    vectors, _ids, alive = index.arrays()
+    labels = index.attribute_arrays()["category"]
+    wanted = np.asarray([c.id for c in categories], dtype=np.int64)
+    rows = np.flatnonzero(alive & np.isin(labels, wanted))
+    if rows.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, index.dim), dtype=np.float32)
+    # Group rows by category and sum each run in one pass
+    rows = rows[np.argsort(labels[rows], kind="stable")]
+    category_ids, starts, counts = np.unique(labels[rows], return_index=True, return_counts=True)
+    sums = np.add.reduceat(vectors[rows], starts, axis=0)
+    keep = counts >= max(1, min_examples)
+    sums = sums[keep]
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    return category_ids[keep], (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def classify(vectors: np.ndarray, prototypes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Best prototype row and its softmax probability for each (normalized) vector."""
+    logits = _LOGIT_SCALE * (vectors @ prototypes.T)
+    logits -= logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    probs /= probs.sum(axis=1, keepdims=True)
+    best = probs.argmax(axis=1)
+    return best, probs[np.arange(best.shape[0]), best]
+
+
+def embed_missing(product_ids: Iterable[int], batch_size: int = 32, log: Callable[[str], None] = print) -> int:
+    """Embed the images of products without a current vector. Returns the number stored."""
+    import clip_service
+
+    from .backfill import store_embeddings
+    from .embeddings import current_model_name
+    from .image_io import open_product_image
+
+    model = current_model_name()
+    qs = (
+        Product.objects.filter(pk__in=list(product_ids), is_active=True)
+        .filter(Q(embedding__isnull=True) | ~Q(embedding_model=model))
+        .only("id", "image", "image_url", "category_id", "seller_id", "price", "stock")
+        .order_by("id")
+    )
+    products = list(qs)
+    stored = 0
+    for start in range(0, len(products), batch_size):
+        ready = []
+        for p in products[start:start + batch_size]:
+            try:
+                img = open_product_image(p)
+            except Exception:
+                img = None
+            if img is not None:
+                ready.append((p, img))
+        if not ready:
+            continue
+        try:
+            vectors = clip_service.get_image_embeddings([img for _, img in ready])
+        except Exception as e:
+            log(f"⚠️ Không embed được batch ảnh: {e}")
+            continue
+        finally:
+            for _, img in ready:
+                img.close()
+        for (p, _img), vec in zip(ready, vectors):
+            p.set_embedding(vec, model_name=model)
+        store_embeddings([p for p, _ in ready])
+        stored += len(ready)
+    return stored
+
+
+def categorize_products(
+    product_ids: Optional[Iterable[int]] = None,
+    method: Optional[str] = None,
+    threshold: Optional[float] = None,
+    dry_run: bool = False,
+    log: Callable[[str], None] = lambda _msg: None,
+) -> List[Prediction]:
+    """Predict (and unless ``dry_run``, assign) categories of uncategorized products.
+
+    ``product_ids`` narrows the run to those products; they are still only
+    touched if uncategorized. Products without an indexed vector are skipped.
+    """
+    method = method or getattr(settings, "PRODUCT_CATEGORIZE_METHOD", "prompt")
+    if method not in METHODS:
+        raise ValueError(f"method must be one of: {', '.join(METHODS)}")
+    threshold = min_confidence() if threshold is None else threshold
+
+    qs = Product.objects.filter(is_active=True).filter(uncategorized_filter())
+    if product_ids is not None:
+        qs = qs.filter(pk__in=list(product_ids))
+    targets = np.fromiter(qs.values_list("id", flat=True), dtype=np.int64)
+    if targets.size == 0:
+        return []
+
+    index = get_index()
+    categories = _candidate_categories()
+    if method == "centroid":
+        category_ids, prototypes = centroid_prototypes(categories, index)
+    else:
+        category_ids, prototypes = prompt_prototypes(categories)
+    if category_ids.size == 0:
+        log("⚠️ Không có danh mục nào để phân loại")
+        return []
+
+    vectors, ids, alive = index.arrays()
+    rows = np.flatnonzero(alive & np.isin(ids, targets))
+    if rows.size < targets.size:
+        log(f"⏭️  {targets.size - rows.size} sản phẩm chưa có embedding, bỏ qua")
+
+    predictions: List[Prediction] = []
+    for start in range(0, rows.size, _BLOCK_ROWS):
+        block = rows[start:start + _BLOCK_ROWS]
+        best, confidence = classify(vectors[block], prototypes)
+        predictions.extend(
+            Prediction(int(ids[r]), int(category_ids[b]), float(c), bool(c >= threshold))
+            for r, b, c in zip(block, best, confidence)
+        )
+
+    if not dry_run:
+        _assign([p for p in predictions if p.assigned])
+    log(
+        f"🏷️  {sum(p.assigned for p in predictions)}/{len(predictions)} sản phẩm được gán danh mục "
+        f"(method={method}, threshold={threshold})"
+    )
+    return predictions
+
+
+def _assign(predictions: List[Prediction]) -> None:
+    by_category: Dict[int, List[int]] = defaultdict(list)
+    for p in predictions:
+        by_category[p.category_id].append(p.product_id)
+    for category_id, pids in by_category.items():
+        Product.objects.filter(pk__in=pids).update(category_id=category_id, updated_at=timezone.now())
+        # update() skips post_save: keep the filter attributes (and their log) in step by hand
+        for pid in pids:
+            record_attributes(pid, {"category": category_id})
+    if predictions:
+        bump_catalog_version()
@@ -0,0 +1,307 @@
+"""Append-only log of embedding index changes, replayed over the snapshot.
+
+With snapshots enabled (``products.index_snapshot``), every change to the
+index is written as one JSON line to the current log file in
+``SEARCH_INDEX_SNAPSHOT_DIR``. The line is appended after the saving
+transaction commits, with a single ``O_APPEND`` write, and the change is
+applied to this worker's index in the same callback, so a rolled back save
+touches neither. Changes come from the product signals, the backfill and
+the categorizer:
+
+    {"op": "upsert", "id": 7, "v": "<base64 float32>", "a": {...}}
+    {"op": "attributes", "id": 7, "a": {"stock": 0, ...}}
+    {"op": "delete" | "deactivate", "id": 7}
+
+A snapshot records the log file and byte offset it includes. Every worker
+replays the log from there when it opens the snapshot, then applies new
+lines on each ``get_index()`` call, so an edit saved in one worker shows up
+in the others on their next search. The writer remembers the offsets of its
+own lines and skips them when it replays the log. Entries carry the full
+new state of a product, so replaying a line twice is harmless.
+
+Once a worker has applied ``SEARCH_INDEX_DELTA_MERGE_ENTRIES`` lines on top
+of its snapshot, it writes base + log as a new snapshot on a background
+thread (one worker at a time, guarded by a lock file) and publishes it.
+The other workers then swap to it and replay only the lines after its offset.
+
+``manage.py build_search_index`` starts a new log file ("epoch") before it
+reads the database, so the rebuilt snapshot replays from the start of the new
+file. Workers still on an older snapshot carry on into the newer files.
+Log files that no kept snapshot needs are pruned along with old snapshots.
+"""
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .index_snapshot import enabled, snapshot_dir
+from .search_cache import bump_catalog_version
+from .search_index import EmbeddingIndex, l2_normalize, peek_index
+
+logger = logging.getLogger(__name__)
+
+LOG_POINTER = "LOG"
+MERGE_LOCK = "MERGE.lock"
+_MERGE_LOCK_TTL = 900
+# Read at most this much of the log per call so one search never stalls for long
+_READ_BYTES = 8 * 1024 * 1024
+_NEXT_LOG_CHECK_INTERVAL = 1.0
+
+_apply_lock = threading.Lock()
+_next_log_checked = 0.0
+_merging = False
+
+
+# ---------------------------------------------------------------- log files
+def current_log(root: Optional[Path] = None) -> Optional[str]:
+    """Name of the log file new entries go to, or None before the first epoch."""
+    root = root or snapshot_dir()
+    try:
+        name = (root / LOG_POINTER).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    return name or None
+
+
+def start_epoch(root: Optional[Path] = None) -> str:
+    """Create a new, empty log file and point writers at it. Returns its name."""
+    root = root or snapshot_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    name = f"delta-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.log"
+    (root / name).touch()
+    tmp = root / f".{LOG_POINTER}.{os.getpid()}.tmp"
+    tmp.write_text(name, encoding="utf-8")
+    os.replace(tmp, root / LOG_POINTER)
+    return name
+
+
+def log_files(root: Optional[Path] = None) -> List[str]:
+    root = root or snapshot_dir()
+    return sorted(p.name for p in root.glob("delta-*.log"))
+
+
+def _next_log(root: Path, name: str) -> Optional[str]:
+    """The log file that follows ``name`` once writers moved on to a newer epoch."""
+    global _next_log_checked
+    now = time.monotonic()
+    if now - _next_log_checked < _NEXT_LOG_CHECK_INTERVAL:
+        return None
+    _next_log_checked = now
+    if current_log(root) == name:
+        return None
+    newer = [n for n in log_files(root) if n > name]
+    return newer[0] if newer else None
+
+
+# ------------------------------------------------------------------ writing
+def _encode(vector: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+
+def _write(entry: dict) -> Optional[Tuple[str, int, int]]:
+    """Append ``entry`` to the current log. Returns the log name and the line's start and end offsets."""
+    root = snapshot_dir()
+    name = current_log(root)
+    if name is None:
+        return None
+    line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+    try:
+        fd = os.open(root / name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            # O_APPEND leaves the position at the end of this line, whoever wrote before it
+            end = os.lseek(fd, 0, os.SEEK_CUR)
+        finally:
+            os.close(fd)
+    except OSError:
+        logger.exception("Could not append to the search index log %s", name)
+        return None
+    return name, end - len(line), end
+
+
+def _commit(entry: dict, apply: Callable[[EmbeddingIndex], None]) -> None:
+    """Log ``entry`` and apply it to this worker's index, once the transaction committed."""
+
+    def run():
+        with _apply_lock:
+            written = _write(entry) if enabled() else None
+            index = peek_index()
+            if index is None:
+                return
+            apply(index)
+            if written is None:
+                return
+            name, start, end = written
+            index.delta_entries += 1
+            if (name, start) == (index.log_name, index.log_offset):
+                index.log_offset = end
+            else:
+                # Other workers' lines come first: skip this one when the replay reaches it
+                index.own_log_lines.add((name, start))
+        _maybe_merge(index)
+
+    transaction.on_commit(run)
+
+
+def record_upsert(product_id: int, vector, attributes: Dict[str, float]) -> None:
+    """Insert or replace a product's vector in this worker's index and log it for the others."""
+    vec = l2_normalize(vector)
+    if vec is None:
+        record_remove(product_id)
+        return
+    _commit(
+        {"op": "upsert", "id": int(product_id), "v": _encode(vec), "a": attributes},
+        lambda index: index.upsert(product_id, vec, attributes),
+    )
+
+
+def record_attributes(product_id: int, attributes: Dict[str, float]) -> None:
+    _commit(
+        {"op": "attributes", "id": int(product_id), "a": attributes},
+        lambda index: index.set_attributes(product_id, attributes),
+    )
+
+
+def record_remove(product_id: int, op: str = "delete") -> None:
+    """Drop a product from the index (``op`` is "delete" or "deactivate", kept for auditing)."""
+    _commit({"op": op, "id": int(product_id)}, lambda index: index.remove(product_id))
+
+
+# ----------------------------------------------------------------- applying
+def _apply(index: EmbeddingIndex, entry: dict) -> None:
+    op = entry.get("op")
+    if op == "upsert":
+        index.upsert(entry["id"], _decode(entry["v"]), entry.get("a"))
+    elif op == "attributes":
+        index.set_attributes(entry["id"], entry.get("a") or {})
+    elif op in ("delete", "deactivate"):
+        index.remove(entry["id"])
+
+
+def apply_pending(index: EmbeddingIndex, wait: bool = False) -> int:
+    """Apply log lines written since ``index`` last caught up. Returns the number applied.
+
+    Without ``wait``, a call that finds another thread applying returns at
+    once; that thread brings the index up to date.
+    """
+    if index.log_name is None or not enabled():
+        return 0
+    if not _apply_lock.acquire(blocking=wait):
+        return 0
+    applied = 0
+    try:
+        root = snapshot_dir()
+        while True:
+            path = root / index.log_name
+            try:
+                size = path.stat().st_size
+            except OSError:
+                size = 0
+            if size <= index.log_offset:
+                following = _next_log(root, index.log_name)
+                if following is None:
+                    break
+                index.log_name, index.log_offset = following, 0
+                continue
+            with path.open("rb") as f:
+                f.seek(index.log_offset)
+                data = f.read(min(size - index.log_offset, _READ_BYTES))
+            # A line still being written stays for the next call
+            end = data.rfind(b"\n") + 1
+            if end == 0:
+                break
+            position = index.log_offset
+            for line in data[:end].splitlines(keepends=True):
+                start, position = position, position + len(line)
+                if (index.log_name, start) in index.own_log_lines:
+                    # Written and applied by this process already
+                    index.own_log_lines.discard((index.log_name, start))
+                    continue
+                try:
+                    _apply(index, json.loads(line))
+                    applied += 1
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Skipping malformed search index log line in %s", index.log_name)
+            index.log_offset += end
+            if not wait:
+                break
+        index.delta_entries += applied
+    finally:
+        _apply_lock.release()
+    if applied:
+        # Results cached before these changes (other workers' edits) must not be served again
+        bump_catalog_version()
+        _maybe_merge(index)
+    return applied
+
+
+# ------------------------------------------------------------------ merging
+def merge_threshold() -> int:
+    return int(getattr(settings, "SEARCH_INDEX_DELTA_MERGE_ENTRIES", 5000))
+
+
+def _take_merge_lock(root: Path) -> bool:
+    path = root / MERGE_LOCK
+    try:
+        if time.time() - path.stat().st_mtime > _MERGE_LOCK_TTL:
+            # Left behind by a worker that died mid-merge
+            path.unlink(missing_ok=True)
+    except OSError:
+        pass
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return False
+    os.write(fd, str(os.getpid()).encode("ascii"))
+    os.close(fd)
+    return True
+
+
+def _maybe_merge(index: EmbeddingIndex) -> None:
+    global _merging
+    if _merging or index.snapshot is None or index.delta_entries < merge_threshold():
+        return
+    if not _take_merge_lock(snapshot_dir()):
+        return
+    _merging = True
+    # Not a daemon: a process that exits mid-merge (e.g. a management command) finishes it first
+    threading.Thread(target=merge, args=(index,), name="index-delta-merge").start()
+
+
+def merge(index: EmbeddingIndex) -> Optional[str]:
+    """Write ``index`` (snapshot + applied log lines) as a new snapshot. Returns its name.
+
+    Runs with the merge lock held; releases it when done.
+    """
+    global _merging
+    from .index_snapshot import prune, write_snapshot
+
+    root = snapshot_dir()
+    try:
+        with _apply_lock:
+            log_name, offset = index.log_name, index.log_offset
+        # Lines applied while the rows are copied are replayed again from ``offset``
+        name = write_snapshot(index, log_name=log_name, log_offset=offset)
+        index.delta_entries = 0
+        prune()
+        logger.info("Merged the search index log into snapshot %s (%s:%s)", name, log_name, offset)
+        return name
+    except Exception:
+        logger.exception("Merging the search index log failed")
+        return None
+    finally:
+        (root / MERGE_LOCK).unlink(missing_ok=True)
+        _merging = False
@@ -0,0 +1,345 @@
+"""Near-duplicate product detection (the same item posted several times).
+
+Blocking: random-hyperplane LSH over the embedding index. CLIP vectors
+all sit in a narrow cone, so they are mean-centred first; otherwise most
+hyperplanes put every product on the same side and a few buckets hold most
+of the catalog. Each of ``bands`` tables then hashes a vector to the sign
+pattern of ``bits`` projections, and only products sharing a bucket in at
+least one table are compared. A bucket is scored with small matmuls of at
+most ``max_bucket`` x ``max_bucket`` rows (window against window, so no pair
+inside an oversized bucket is skipped), which keeps the job far below the
+all-pairs cost. ``sampled_recall`` checks the blocking against an exact scan
+for a random sample of products; ``find_duplicates`` logs it.
+
+Verification: a candidate pair is a duplicate when its image cosine is at
+least ``PRODUCT_DUPLICATE_IMAGE_THRESHOLD`` and the token Jaccard of the
+folded names is at least ``PRODUCT_DUPLICATE_NAME_THRESHOLD``. Pairs are
+joined into connected components, which are then split so that every
+member passes both thresholds against its representative: a chain A~B~C
+must not put A and C together when they are far apart. The oldest product
+(lowest id) left in a component is the representative of the next cluster.
+
+Clusters are written to ``DuplicateCluster``/``DuplicateMember`` for admin
+review. A rebuild keeps the row (and review status) of any cluster whose
+member set did not change. Search collapses results to one product per
+cluster unless the cluster was rejected by an admin.
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .lexical import tokenize
+from .models import DuplicateCluster, DuplicateMember, Product
+from .search_cache import bump_catalog_version, bump_duplicates_version, duplicates_version, shared_version_cache
+from .search_index import get_index
+
+
+class Member(NamedTuple):
+    product_id: int
+    score: float
+    name_score: float
+
+
+def name_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the folded name tokens."""
+    ta, tb = set(tokenize(a)), set(tokenize(b))
+    if not ta and not tb:
+        return 1.0
+    return len(ta & tb) / len(ta | tb)
+
+
+def _bucket_pairs(vectors: np.ndarray, rows: np.ndarray, threshold: float, max_bucket: int, found: Dict[int, float]) -> None:
+    """Add every pair of ``rows`` (one bucket) with cosine >= ``threshold`` to ``found``."""
+    n = vectors.shape[0]
+    rows = np.sort(rows)
+    for i in range(0, rows.shape[0], max_bucket):
+        left = rows[i:i + max_bucket]
+        block = vectors[left]
+        # Window against itself and every later window: pairs across windows count too
+        for j in range(i, rows.shape[0], max_bucket):
+            right = rows[j:j + max_bucket]
+            sims = block @ vectors[right].T
+            hits = sims >= threshold
+            if i == j:
+                hits = np.triu(hits, 1)
+            for a, b in zip(*np.nonzero(hits)):
+                found[int(left[a]) * n + int(right[b])] = float(sims[a, b])
+
+
+def candidate_pairs(
+    vectors: np.ndarray,
+    alive: np.ndarray,
+    threshold: float,
+    bands: int = 16,
+    bits: int = 8,
+    max_bucket: int = 2000,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Row pairs ``(a, b, cosine)`` with ``a < b`` and cosine >= ``threshold``, found via LSH buckets."""
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((vectors.shape[1], bands * bits)).astype(np.float32)
+    weights = np.left_shift(np.int64(1), np.arange(bits, dtype=np.int64))
+    found: Dict[int, float] = {}
+    n = vectors.shape[0]
+    # Mean of the live rows, without copying them out of the matrix
+    centre = (alive.astype(np.float32) @ vectors) / max(1, int(alive.sum()))
+    for band in range(bands):
+        band_planes = planes[:, band * bits:(band + 1) * bits]
+        keys = ((vectors @ band_planes) > centre @ band_planes) @ weights
+        order = np.argsort(keys, kind="stable")
+        order = order[alive[order]]
+        sorted_keys = keys[order]
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(sorted_keys)) + 1])
+        ends = np.append(starts[1:], order.shape[0])
+        # Singleton buckets have nothing to compare
+        shared = np.flatnonzero(ends - starts > 1)
+        for lo, hi in zip(starts[shared], ends[shared]):
+            _bucket_pairs(vectors, order[lo:hi], threshold, max_bucket, found)
+    if not found:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float32)
+    codes = np.fromiter(found.keys(), dtype=np.int64, count=len(found))
+    sims = np.fromiter(found.values(), dtype=np.float32, count=len(found))
+    return codes // n, codes % n, sims
+
+
+def sampled_recall(
+    vectors: np.ndarray,
+    alive: np.ndarray,
+    threshold: float,
+    rows_a: np.ndarray,
+    rows_b: np.ndarray,
+    sample: int = 200,
+    seed: int = 0,
+) -> Tuple[Optional[float], int]:
+    """Share of the exact pairs (cosine >= ``threshold``) of ``sample`` random live rows
+    that ``candidate_pairs`` found, and how many exact pairs that was.
+
+    Recall is None when the sample has no pair above the threshold.
+    """
+    live = np.flatnonzero(alive)
+    if live.shape[0] < 2 or sample <= 0:
+        return None, 0
+    picked = np.random.default_rng(seed).choice(live, min(sample, live.shape[0]), replace=False)
+    n = vectors.shape[0]
+    found = set((rows_a.astype(np.int64) * n + rows_b).tolist())
+    total = hits = 0
+    # Each step scores 32 rows against the whole matrix
+    for start in range(0, picked.shape[0], 32):
+        chunk = picked[start:start + 32]
+        sims = vectors[chunk] @ vectors.T
+        sims[:, ~alive] = -np.inf
+        sims[np.arange(chunk.shape[0]), chunk] = -np.inf
+        for row, other in zip(*np.nonzero(sims >= threshold)):
+            a, b = sorted((int(chunk[row]), int(other)))
+            total += 1
+            hits += (a * n + b) in found
+    return (hits / total if total else None), total
+
+
+def _names(product_ids: Sequence[int], chunk: int = 2000) -> Dict[int, str]:
+    names: Dict[int, str] = {}
+    for start in range(0, len(product_ids), chunk):
+        names.update(Product.objects.filter(pk__in=product_ids[start:start + chunk]).values_list("id", "name"))
+    return names
+
+
+def _components(pairs: Iterable[Tuple[int, int]]) -> List[List[int]]:
+    parent: Dict[int, int] = {}
+
+    def find(x: int) -> int:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for x in parent:
+        groups[find(x)].append(x)
+    return list(groups.values())
+
+
+def _split_component(
+    group: List[int], index, names: Dict[int, str], image_threshold: float, name_threshold: float
+) -> List[List[Member]]:
+    """Clusters of one component whose members all pass the thresholds against the representative.
+
+    The oldest product takes every member close enough to itself; the rest
+    are clustered again around the oldest of them.
+    """
+    clusters = []
+    remaining = sorted(group)
+    while len(remaining) > 1:
+        rep = remaining[0]
+        members, rest = [], []
+        for pid, score in zip(remaining, index.scores_for(index.vector(rep), remaining)):
+            name_score = name_similarity(names.get(rep, ""), names.get(pid, ""))
+            if pid == rep or (score >= image_threshold and name_score >= name_threshold):
+                members.append(Member(pid, float(score), name_score))
+            else:
+                rest.append(pid)
+        if len(members) > 1:
+            clusters.append(members)
+        remaining = rest
+    return clusters
+
+
+def find_duplicates(
+    image_threshold: Optional[float] = None,
+    name_threshold: Optional[float] = None,
+    bands: Optional[int] = None,
+    bits: Optional[int] = None,
+    max_bucket: int = 2000,
+    recall_sample: int = 200,
+    log: Callable[[str], None] = lambda _msg: None,
+) -> List[List[Member]]:
+    """Duplicate clusters among indexed products, representative first.
+
+    The LSH recall over ``recall_sample`` random products (0 skips it) is logged.
+    """
+    if image_threshold is None:
+        image_threshold = getattr(settings, "PRODUCT_DUPLICATE_IMAGE_THRESHOLD", 0.92)
+    if name_threshold is None:
+        name_threshold = getattr(settings, "PRODUCT_DUPLICATE_NAME_THRESHOLD", 0.5)
+    bands = bands or getattr(settings, "PRODUCT_DUPLICATE_LSH_BANDS", 16)
+    bits = bits or getattr(settings, "PRODUCT_DUPLICATE_LSH_BITS", 8)
+
+    index = get_index()
+    vectors, ids, alive = index.arrays()
+    rows_a, rows_b, sims = candidate_pairs(vectors, alive, image_threshold, bands, bits, max_bucket)
+    log(f"{sims.shape[0]} cặp ảnh gần giống (cosine >= {image_threshold})")
+    if recall_sample:
+        recall, exact = sampled_recall(vectors, alive, image_threshold, rows_a, rows_b, recall_sample)
+        if recall is None:
+            log(f"Recall LSH: không có cặp nào trong {recall_sample} sản phẩm mẫu")
+        else:
+            log(f"Recall LSH ≈ {recall:.1%} ({exact} cặp chính xác quanh {recall_sample} sản phẩm mẫu)")
+    if sims.size == 0:
+        return []
+
+    names = _names(np.unique(ids[np.concatenate([rows_a, rows_b])]).tolist())
+    accepted = [
+        (int(ids[a]), int(ids[b]))
+        for a, b in zip(rows_a, rows_b)
+        if name_similarity(names.get(int(ids[a]), ""), names.get(int(ids[b]), "")) >= name_threshold
+    ]
+    log(f"{len(accepted)} cặp khớp cả tên (Jaccard >= {name_threshold})")
+
+    clusters = []
+    for group in _components(accepted):
+        clusters.extend(_split_component(group, index, names, image_threshold, name_threshold))
+    return clusters
+
+
+def store_clusters(clusters: List[List[Member]]) -> Tuple[int, int]:
+    """Replace the duplicate tables with ``clusters``. Returns ``(kept, created)`` cluster counts."""
+    existing: Dict[frozenset, int] = {}
+    members_of: Dict[int, set] = defaultdict(set)
+    for cluster_id, pid in DuplicateMember.objects.values_list("cluster_id", "product_id"):
+        members_of[cluster_id].add(pid)
+    for cluster_id, pids in members_of.items():
+        existing[frozenset(pids)] = cluster_id
+
+    with transaction.atomic():
+        keep: Dict[int, List[Member]] = {}
+        new: List[List[Member]] = []
+        for members in clusters:
+            cluster_id = existing.get(frozenset(m.product_id for m in members))
+            if cluster_id is None:
+                new.append(members)
+            else:
+                keep[cluster_id] = members
+        DuplicateCluster.objects.exclude(pk__in=list(keep)).delete()
+        DuplicateMember.objects.filter(cluster_id__in=list(keep)).delete()
+
+        rows = DuplicateCluster.objects.bulk_create([
+            DuplicateCluster(size=len(members), score=min(m.score for m in members)) for members in new
+        ])
+        for cluster_id, members in keep.items():
+            DuplicateCluster.objects.filter(pk=cluster_id).update(
+                size=len(members), score=min(m.score for m in members)
+            )
+        pairs = list(keep.items()) + [(row.pk, members) for row, members in zip(rows, new)]
+        DuplicateMember.objects.bulk_create(
+            [
+                DuplicateMember(
+                    cluster_id=cluster_id,
+                    product_id=m.product_id,
+                    is_representative=i == 0,
+                    score=m.score,
+                    name_score=m.name_score,
+                )
+                for cluster_id, members in pairs
+                for i, m in enumerate(members)
+            ],
+            batch_size=2000,
+        )
+    bump_catalog_version()
+    bump_duplicates_version()
+    return len(keep), len(new)
+
+
+# ------------------------------------------------------------- query time
+_cluster_map: Tuple[Optional[int], float, Dict[int, int]] = (None, 0.0, {})
+_cluster_map_lock = threading.Lock()
+# Without a shared version, clusters stored by another process are only seen on reload
+_LOCAL_MAP_MAX_AGE = 60.0
+
+
+def _cluster_map_fresh(cached_version: Optional[int], loaded_at: float, version: int) -> bool:
+    if cached_version != version:
+        return False
+    return shared_version_cache() is not None or time.monotonic() - loaded_at < _LOCAL_MAP_MAX_AGE
+
+
+def cluster_map() -> Dict[int, int]:
+    """``product_id -> cluster_id`` for clusters that are not rejected.
+
+    Reloaded when the duplicates version moves (cluster writes and reviews
+    bump it, product saves do not). Without a shared cache the version only
+    counts this process's writes, so the map is also reloaded once a minute.
+    """
+    global _cluster_map
+    version = duplicates_version()
+    cached_version, loaded_at, mapping = _cluster_map
+    if not _cluster_map_fresh(cached_version, loaded_at, version):
+        with _cluster_map_lock:
+            cached_version, loaded_at, mapping = _cluster_map
+            if not _cluster_map_fresh(cached_version, loaded_at, version):
+                mapping = dict(
+                    DuplicateMember.objects.exclude(cluster__status=DuplicateCluster.STATUS_REJECTED)
+                    .values_list("product_id", "cluster_id")
+                )
+                _cluster_map = (version, time.monotonic(), mapping)
+    return mapping
+
+
+def collapse_overfetch() -> int:
+    return max(1, int(getattr(settings, "PRODUCT_SEARCH_COLLAPSE_OVERFETCH", 3)))
+
+
+def collapse_duplicates(hits: Iterable, k: int, key: Callable = lambda hit: hit[0]) -> list:
+    """First (best) hit of each duplicate cluster, at most ``k``; ``key`` gives a hit's product id."""
+    clusters = cluster_map()
+    seen = set()
+    out = []
+    for hit in hits:
+        cluster_id = clusters.get(key(hit))
+        if cluster_id is not None:
+            if cluster_id in seen:
+                continue
+            seen.add(cluster_id)
+        out.append(hit)
+        if len(out) >= k:
+            break
+    return out
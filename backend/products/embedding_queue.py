@@ -0,0 +1,114 @@
+"""Background CLIP embedding for products whose image changed.
+
+``signals.py`` enqueues a product id after the saving transaction commits; a
+single daemon thread per process loads the image, embeds it and stores the
+result with ``save(update_fields=EMBEDDING_SAVE_FIELDS)``. That save fires
+the regular post_save handler, which upserts the vector into the in-memory
+index, so the product becomes searchable without a backfill run. Other
+workers get the vector from the delta log with snapshots enabled, otherwise
+from their periodic database sync (the save bumps ``updated_at``).
+
+Ids are de-duplicated while pending: several saves of one product before the
+worker gets to it cost a single embedding. Jobs lost on process exit are
+picked up by ``manage.py backfill_embeddings``. Bulk imports wrap their saves
+in ``suspended()`` and embed the new products in batches themselves.
+"""
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+_local = threading.local()
+
+
+def enabled() -> bool:
+    return getattr(settings, "PRODUCT_EMBED_ON_SAVE", True) and not getattr(_local, "suspended", False)
+
+
+@contextmanager
+def suspended():
+    """Do not enqueue products saved in this thread for embedding while inside the block."""
+    previous = getattr(_local, "suspended", False)
+    _local.suspended = True
+    try:
+        yield
+    finally:
+        _local.suspended = previous
+
+
+class ProductJobQueue:
+    """De-duplicating queue of product ids drained by one daemon thread running ``handler``."""
+
+    def __init__(self, handler: Callable[[int], object], name: str):
+        self.handler = handler
+        self.name = name
+        self._queue: "queue.Queue[int]" = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.done = 0
+        self.failed = 0
+
+    def enqueue(self, product_id: int) -> None:
+        with self._lock:
+            if product_id in self._pending:
+                return
+            self._pending.add(product_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        self._queue.put(product_id)
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _run(self) -> None:
+        while True:
+            product_id = self._queue.get()
+            with self._lock:
+                self._pending.discard(product_id)
+            try:
+                self.handler(product_id)
+                self.done += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Background job %s failed for product %s", self.name, product_id)
+            finally:
+                # Long-lived thread: do not hold on to a stale DB connection
+                close_old_connections()
+
+
+def embed_product(product_id: int) -> bool:
+    """Compute and store the embedding of one product. Returns True if stored."""
+    import clip_service
+
+    from .image_io import open_product_image
+    from .models import Product
+
+    product = Product.objects.filter(pk=product_id).first()
+    if product is None:
+        return False
+    img = open_product_image(product)
+    if img is None:
+        if not (product.image or product.image_url) and product.embedding is not None:
+            # Image removed: drop the vector that described the old one
+            product.set_embedding(None)
+            product.save(update_fields=Product.EMBEDDING_SAVE_FIELDS)
+        return False
+    try:
+        vector = clip_service.get_image_embedding(img)
+    finally:
+        img.close()
+    product.set_embedding(vector)
+    product.save(update_fields=Product.EMBEDDING_SAVE_FIELDS)
+    return True
+
+
+embedding_queue = ProductJobQueue(embed_product, "product-embedder")
@@ -0,0 +1,63 @@
+"""Packing helpers for the binary ``Product.embedding`` column.
+
+Vectors are stored as raw little-endian float32 (or float16) bytes next to an
+``embedding_dim`` column; the element width is recovered from the blob length,
+so both widths can coexist while a table is being converted.
+"""
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+DEFAULT_CLIP_MODEL = "openai/clip-vit-base-patch32"
+# Appended to the model name of embeddings computed with CLIP_QUANTIZE on
+QUANTIZED_SUFFIX = "+int8"
+
+_DTYPES_BY_WIDTH = {
+    4: np.dtype("<f4"),
+    2: np.dtype("<f2"),
+}
+
+
+def checkpoint_name() -> str:
+    """Name of the CLIP checkpoint to load."""
+    return getattr(settings, "CLIP_MODEL_NAME", DEFAULT_CLIP_MODEL)
+
+
+def current_model_name() -> str:
+    """Name recorded with the embeddings this configuration computes.
+
+    The checkpoint, plus ``QUANTIZED_SUFFIX`` when ``CLIP_QUANTIZE`` is on:
+    quantized vectors differ slightly from fp32 ones, so switching the
+    setting makes ``backfill_embeddings`` re-embed the catalog instead of
+    mixing both kinds in one index.
+    """
+    name = checkpoint_name()
+    if getattr(settings, "CLIP_QUANTIZE", False):
+        name += QUANTIZED_SUFFIX
+    return name
+
+
+def storage_dtype() -> np.dtype:
+    name = getattr(settings, "PRODUCT_EMBEDDING_DTYPE", "float32")
+    dtype = np.dtype(name).newbyteorder("<")
+    if dtype.itemsize not in _DTYPES_BY_WIDTH:
+        raise ValueError(f"Unsupported PRODUCT_EMBEDDING_DTYPE: {name}")
+    return dtype
+
+
+def pack_embedding(values: Sequence[float], dtype=None) -> Tuple[bytes, int]:
+    """Return ``(blob, dim)`` for a flat vector."""
+    arr = np.asarray(values, dtype=dtype or storage_dtype()).reshape(-1)
+    return arr.tobytes(), int(arr.shape[0])
+
+
+def unpack_embedding(blob, dim: int) -> Optional[np.ndarray]:
+    """Zero-copy, read-only NumPy view over a stored blob (None if empty/corrupt)."""
+    if blob is None or not dim:
+        return None
+    width, rem = divmod(len(blob), dim)
+    dtype = _DTYPES_BY_WIDTH.get(width)
+    if dtype is None or rem:
+        return None
+    return np.frombuffer(blob, dtype=dtype, count=dim)
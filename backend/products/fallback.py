@@ -0,0 +1,69 @@
+"""Degraded search results for when CLIP cannot answer in time.
+
+The search endpoints give the embedding step a deadline
+(``PRODUCT_SEARCH_DEADLINE_MS``, see ``products.inference``). When it runs
+out, or the inference queue is full, they answer from here instead of
+waiting, and mark the response ``"degraded": true``:
+
+    text   BM25 over names/descriptions if this worker's lexical index is
+           loaded (it is never built on this path), else a name/description
+           ``icontains`` query on the database.
+    image  the newest active products matching the request's filters; there
+           is nothing to compare an image with without CLIP.
+
+Both honour the attribute filters of the request. Results are not cached.
+"""
+from functools import reduce
+from operator import and_
+from typing import List, Optional, Tuple
+
+from django.db.models import Q
+
+from .lexical import peek_lexical_index
+from .models import Product
+from .search_index import SearchFilters
+
+# Lexical hits fetched per requested result when filters may drop some
+_FILTER_OVERFETCH = 4
+_MAX_DB_TERMS = 8
+
+
+def _filtered(qs, filters: Optional[SearchFilters]):
+    qs = qs.filter(is_active=True)
+    if not filters:
+        return qs
+    if filters.categories:
+        qs = qs.filter(category_id__in=filters.categories)
+    if filters.seller is not None:
+        qs = qs.filter(seller_id=filters.seller)
+    if filters.min_price is not None:
+        qs = qs.filter(price__gte=filters.min_price)
+    if filters.max_price is not None:
+        qs = qs.filter(price__lte=filters.max_price)
+    if filters.in_stock:
+        qs = qs.filter(stock__gt=0)
+    return qs
+
+
+def _products():
+    return Product.objects.select_related('seller', 'category')
+
+
+def lexical_results(query: str, k: int, filters: Optional[SearchFilters] = None) -> List[Tuple[Optional[float], Product]]:
+    """``(bm25, product)`` pairs for ``query`` without CLIP, best first (bm25 None from the DB query)."""
+    lexical = peek_lexical_index()
+    if lexical is not None and len(lexical):
+        hits = lexical.search(query, k * _FILTER_OVERFETCH if filters else k)
+        products = _filtered(_products(), filters).in_bulk([pid for pid, _ in hits])
+        return [(score, products[pid]) for pid, score in hits if pid in products][:k]
+
+    terms = query.split()[:_MAX_DB_TERMS]
+    if not terms:
+        return []
+    match = reduce(and_, [Q(name__icontains=t) | Q(description__icontains=t) for t in terms])
+    return [(None, p) for p in _filtered(_products(), filters).filter(match).order_by('-created_at')[:k]]
+
+
+def recent_results(k: int, filters: Optional[SearchFilters] = None) -> List[Tuple[None, Product]]:
+    """The newest active products matching ``filters``."""
+    return [(None, p) for p in _filtered(_products(), filters).order_by('-created_at')[:k]]
@@ -0,0 +1,106 @@
+"""Hybrid text search: BM25 candidates re-scored with CLIP and fused.
+
+The lexical index proposes at most ``PRODUCT_SEARCH_LEXICAL_CANDIDATES``
+products; only those rows are scored against the CLIP query vector. If the
+query has too few lexical matches (e.g. an English query over Vietnamese
+names), the vector top-k is added to the pool so results never come up empty.
+
+Fusion:
+    weighted  ``w * bm25' + (1 - w) * cosine'`` where both scores are min-max
+              scaled over the candidate pool and ``w`` is the lexical weight.
+    rrf       reciprocal-rank fusion, ``sum 1 / (rrf_k + rank)``.
+"""
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from django.conf import settings
+
+from .lexical import get_lexical_index
+from .search_index import SearchFilters, get_index, top_k
+
+FUSIONS = ("weighted", "rrf")
+
+
+class HybridHit(NamedTuple):
+    product_id: int
+    score: float
+    bm25: float
+    similarity: Optional[float]
+
+
+def _scaled(values: np.ndarray) -> np.ndarray:
+    finite = np.isfinite(values)
+    out = np.zeros_like(values)
+    if not finite.any():
+        return out
+    lo, hi = values[finite].min(), values[finite].max()
+    out[finite] = (values[finite] - lo) / (hi - lo) if hi > lo else 1.0
+    return out
+
+
+def _ranks(values: np.ndarray) -> np.ndarray:
+    """1-based rank of each value (best = 1); missing values rank last."""
+    order = np.argsort(-np.where(np.isfinite(values), values, -np.inf), kind="stable")
+    ranks = np.empty(values.shape[0], dtype=np.float32)
+    ranks[order] = np.arange(1, values.shape[0] + 1)
+    return ranks
+
+
+def hybrid_search(
+    text: str,
+    query_vector,
+    k: int = 50,
+    fusion: Optional[str] = None,
+    lexical_weight: Optional[float] = None,
+    candidates: Optional[int] = None,
+    filters: Optional[SearchFilters] = None,
+    **options,
+) -> List[HybridHit]:
+    """Fuse BM25 over name/description with CLIP cosine; returns hits best first.
+
+    ``options`` go to the vector index when it has to top up the pool. With
+    ``filters``, candidates are checked against the index attribute arrays,
+    so only products present in the embedding index can match.
+    """
+    fusion = fusion or getattr(settings, "PRODUCT_SEARCH_HYBRID_FUSION", "weighted")
+    if fusion not in FUSIONS:
+        raise ValueError(f"fusion must be one of: {', '.join(FUSIONS)}")
+    if lexical_weight is None:
+        lexical_weight = getattr(settings, "PRODUCT_SEARCH_HYBRID_LEXICAL_WEIGHT", 0.3)
+    candidates = candidates or getattr(settings, "PRODUCT_SEARCH_LEXICAL_CANDIDATES", 1000)
+
+    index = get_index()
+    bm25: Dict[int, float] = dict(get_lexical_index().search(text, max(candidates, k)))
+    ids = np.fromiter(bm25.keys(), dtype=np.int64, count=len(bm25))
+    cosine = index.scores_for(query_vector, ids, filters)
+    if filters:
+        # Filtered-out (or unindexed) candidates come back as NaN
+        keep = np.isfinite(cosine)
+        ids, cosine = ids[keep], cosine[keep]
+    if ids.size < k:
+        seen = set(ids.tolist())
+        extra = [(pid, score) for pid, score in index.search(query_vector, k, filters=filters, **options) if pid not in seen]
+        if extra:
+            ids = np.concatenate([ids, np.asarray([pid for pid, _ in extra], dtype=np.int64)])
+            cosine = np.concatenate([cosine, np.asarray([score for _, score in extra], dtype=np.float32)])
+    if ids.size == 0:
+        return []
+    lexical = np.asarray([bm25.get(int(pid), 0.0) for pid in ids], dtype=np.float32)
+
+    if fusion == "rrf":
+        rrf_k = getattr(settings, "PRODUCT_SEARCH_RRF_K", 60)
+        lexical_ranks = np.where(lexical > 0, _ranks(lexical), np.inf)
+        fused = lexical_weight / (rrf_k + lexical_ranks) + (1.0 - lexical_weight) / (rrf_k + _ranks(cosine))
+    else:
+        fused = lexical_weight * _scaled(lexical) + (1.0 - lexical_weight) * _scaled(cosine)
+
+    best = top_k(fused, k)
+    return [
+        HybridHit(
+            int(ids[i]),
+            float(fused[i]),
+            float(lexical[i]),
+            float(cosine[i]) if np.isfinite(cosine[i]) else None,
+        )
+        for i in best
+    ]
@@ -0,0 +1,123 @@
+"""Loading images for CLIP: product images for embedding jobs (backfill,
+quantization checks) and uploaded search queries."""
+import math
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Tuple
+
+import requests
+from django.conf import settings
+from PIL import Image
+
+# CLIPImageProcessor resizes the shortest side to 224 before its center crop;
+# decoding at more than that only costs memory and CPU.
+CLIP_SIDE = 224
+# ROI crops smaller than this (in original pixels) are ignored
+MIN_ROI_SIDE = 10
+
+
+def open_product_image(product, timeout: float = 8) -> Optional[Image.Image]:
+    """Open PIL image from local file if exists else from image_url. Return Image or None."""
+    # Local file first
+    if product.image and product.image.name:
+        img_path = Path(product.image.path)
+        if img_path.exists():
+            return Image.open(img_path).convert("RGB")
+
+    # Fallback: download from image_url
+    url = (product.image_url or "").strip()
+    if not url:
+        return None
+
+    try:
+        resp = requests.get(url, timeout=timeout)
+        if resp.status_code != 200:
+            return None
+        return Image.open(BytesIO(resp.content)).convert("RGB")
+    except Exception:
+        return None
+
+
+def roi_box(roi, size):
+    """Pixel box (left, upper, right, lower) of ``roi`` on an image of ``size``."""
+    iw, ih = size
+    rx, ry, rw, rh = roi['x'], roi['y'], roi['w'], roi['h']
+    # detect normalized vs absolute: if values <=1 treat as normalized
+    if 0 <= rx <= 1 and 0 <= ry <= 1 and 0 <= rw <= 1 and 0 <= rh <= 1:
+        left = int(rx * iw)
+        upper = int(ry * ih)
+        right = int((rx + rw) * iw)
+        lower = int((ry + rh) * ih)
+    else:
+        left = int(rx)
+        upper = int(ry)
+        right = int(rx + rw)
+        lower = int(ry + rh)
+
+    # clamp to image bounds and ensure minimum ROI size (at least 10x10)
+    left = max(0, min(left, iw - 1))
+    upper = max(0, min(upper, ih - 1))
+    right = max(left + MIN_ROI_SIDE, min(right, iw))
+    lower = max(upper + MIN_ROI_SIDE, min(lower, ih))
+    return left, upper, right, lower
+
+
+def decode_search_image(data: bytes, roi=None) -> Tuple[Image.Image, Optional[Image.Image]]:
+    """Decode an uploaded query image at the smallest size CLIP can use.
+
+    Returns ``(full_image, roi_crop)`` in RGB; ``roi_crop`` is None without an
+    ROI or when it is smaller than ``MIN_ROI_SIDE``.
+
+    The header is read first: images above ``SEARCH_IMAGE_MAX_PIXELS`` are
+    rejected before any pixel is decoded, and the ROI box is resolved against
+    the original size. JPEGs are then decoded in draft mode at 1/2..1/8 scale
+    (DCT scaling, no full-size buffer); other formats are box-reduced right
+    after decoding. The scale keeps both the full image and the ROI crop at
+    least ``CLIP_SIDE`` pixels on their shortest side, within a decoded size
+    of ``SEARCH_IMAGE_DECODE_PIXELS``.
+
+    Raises ValueError for oversized images; PIL errors for undecodable data.
+    """
+    img = Image.open(BytesIO(data))
+    width, height = img.size
+    max_pixels = getattr(settings, "SEARCH_IMAGE_MAX_PIXELS", 40_000_000)
+    if width * height > max_pixels:
+        raise ValueError(f"Image too large: {width}x{height} exceeds {max_pixels} pixels")
+
+    box = None
+    if roi:
+        box = roi_box(roi, (width, height))
+        if box[2] - box[0] < MIN_ROI_SIDE or box[3] - box[1] < MIN_ROI_SIDE:
+            box = None
+
+    # Smallest scale that keeps every region CLIP will see >= CLIP_SIDE
+    scale = CLIP_SIDE / min(width, height)
+    if box is not None:
+        scale = max(scale, CLIP_SIDE / min(box[2] - box[0], box[3] - box[1]))
+    # ...but never decode more than the pixel budget (tiny ROIs would ask for full size)
+    budget = getattr(settings, "SEARCH_IMAGE_DECODE_PIXELS", 4_000_000)
+    scale = min(1.0, scale, max(CLIP_SIDE / min(width, height), math.sqrt(budget / (width * height))))
+
+    if img.format == "JPEG" and scale < 1.0:
+        img.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+    img.load()
+    factor = int(min(img.size) / (min(width, height) * scale))
+    if img.size[0] * img.size[1] > budget:
+        factor = max(factor, math.ceil(math.sqrt(img.size[0] * img.size[1] / budget)))
+    if factor >= 2:
+        if img.mode not in ("RGB", "RGBA", "L"):
+            # reduce() rejects palette and 1-bit images (GIFs, many PNGs)
+            img = img.convert("RGB")
+        img = img.reduce(factor)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    roi_crop = None
+    if box is not None:
+        sx, sy = img.size[0] / width, img.size[1] / height
+        roi_crop = img.crop((
+            int(box[0] * sx), int(box[1] * sy),
+            max(int(box[0] * sx) + 1, round(box[2] * sx)),
+            max(int(box[1] * sy) + 1, round(box[3] * sy)),
+        ))
+    return img, roi_crop
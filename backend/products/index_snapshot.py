@@ -0,0 +1,238 @@
+"""Versioned on-disk snapshots of the embedding index, shared through mmap.
+
+Layout of ``SEARCH_INDEX_SNAPSHOT_DIR``::
+
+    CURRENT              name of the published snapshot
+    <name>/meta.json     dim, rows, CLIP model, build time, delta log position
+    <name>/vectors.npy   float32 (capacity, dim), L2-normalized
+    <name>/ids.npy       int64 product ids
+    <name>/alive.npy     bool
+    <name>/<attr>.npy    one array per filter attribute (category, seller, ...)
+
+Every worker opens the arrays with ``numpy.load(mmap_mode="c")``: the pages
+come from the OS page cache and are shared by all processes on the host.
+Live updates from the product signals write copy-on-write, so a worker only
+holds private copies of the pages it changed. Each array has spare rows past
+``rows`` (see ``_spare_rows``) so new products do not force a copy of the
+whole matrix.
+
+A snapshot is written to a temporary directory, renamed into place and then
+published by replacing ``CURRENT`` (``os.replace`` is atomic). Workers poll
+``CURRENT`` and swap to the new snapshot without a restart (see
+``search_index.get_index``). Old snapshots are pruned; a worker that still
+maps one keeps its pages until it swaps.
+
+Changes made after a snapshot was written live in the delta log
+(``products.delta_log``) next to it, from the position stored in meta.json.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .search_index import ATTRIBUTES, EmbeddingIndex
+
+logger = logging.getLogger(__name__)
+
+CURRENT = "CURRENT"
+# Rows copied per step when writing, to bound the temporary gather buffer
+_WRITE_BLOCK_ROWS = 65536
+_STALE_TMP_SECONDS = 3600
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "SEARCH_INDEX_SNAPSHOT_DIR", None))
+
+
+def snapshot_dir() -> Path:
+    return Path(settings.SEARCH_INDEX_SNAPSHOT_DIR)
+
+
+def _spare_rows(rows: int) -> int:
+    return max(1024, rows // 10)
+
+
+def current_name(root: Optional[Path] = None) -> Optional[str]:
+    """Name of the published snapshot, or None if there is none."""
+    root = root or snapshot_dir()
+    try:
+        name = (root / CURRENT).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    return name or None
+
+
+def read_meta(path: Path) -> dict:
+    return json.loads((path / "meta.json").read_text(encoding="utf-8"))
+
+
+def open_snapshot(path: Path) -> EmbeddingIndex:
+    """Memory-map the snapshot in ``path`` as an ``EmbeddingIndex``."""
+    meta = read_meta(path)
+
+    def load(name):
+        return np.load(path / f"{name}.npy", mmap_mode="c")
+
+    # The liveness flags are tiny and flipped often: keep them in private memory
+    alive = np.array(load("alive"))
+    attrs = {name: load(name) for name in ATTRIBUTES}
+    index = EmbeddingIndex.from_arrays(load("vectors"), load("ids"), alive, attrs, meta["rows"], snapshot=path.name)
+    index.log_name, index.log_offset = meta.get("log"), meta.get("log_offset", 0)
+    return index
+
+
+def open_current() -> Optional[EmbeddingIndex]:
+    """Open the published snapshot, or None if snapshots are off, missing or for another model."""
+    from .embeddings import current_model_name
+
+    if not enabled():
+        return None
+    root = snapshot_dir()
+    name = current_name(root)
+    if name is None:
+        return None
+    path = root / name
+    try:
+        if read_meta(path).get("model") != current_model_name():
+            logger.warning("Search index snapshot %s was built for another CLIP model; ignoring it", name)
+            return None
+        return open_snapshot(path)
+    except (OSError, ValueError, KeyError):
+        logger.exception("Search index snapshot %s could not be opened", name)
+        return None
+
+
+def _write_array(path: Path, values: np.ndarray, rows: np.ndarray, capacity: int, fill) -> None:
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=values.dtype, shape=(capacity, *values.shape[1:]))
+    for start in range(0, rows.shape[0], _WRITE_BLOCK_ROWS):
+        block = rows[start:start + _WRITE_BLOCK_ROWS]
+        out[start:start + block.shape[0]] = values[block]
+    out[rows.shape[0]:] = fill
+    out.flush()
+    del out
+
+
+def write_snapshot(
+    index: EmbeddingIndex,
+    built_at: Optional[datetime] = None,
+    root: Optional[Path] = None,
+    log_name: Optional[str] = None,
+    log_offset: int = 0,
+) -> str:
+    """Write the live rows of ``index`` as a new snapshot and publish it. Returns its name.
+
+    ``log_name``/``log_offset`` is the delta log position the rows include.
+    """
+    from .embeddings import current_model_name
+
+    root = root or snapshot_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    vectors, ids, alive = index.arrays()
+    attrs = index.attribute_arrays()
+    live = np.flatnonzero(alive)
+    n = int(live.shape[0])
+    capacity = n + _spare_rows(n)
+
+    # Sortable by build time
+    name = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    tmp = root / f".{name}.tmp"
+    tmp.mkdir()
+    try:
+        _write_array(tmp / "vectors.npy", vectors, live, capacity, 0.0)
+        _write_array(tmp / "ids.npy", ids, live, capacity, 0)
+        _write_array(tmp / "alive.npy", alive, live, capacity, False)
+        for attr, (_dtype, fill) in ATTRIBUTES.items():
+            _write_array(tmp / f"{attr}.npy", attrs[attr], live, capacity, fill)
+        meta = {
+            "dim": index.dim,
+            "rows": n,
+            "capacity": capacity,
+            "model": current_model_name(),
+            "built_at": (built_at or timezone.now()).isoformat(),
+            "log": log_name,
+            "log_offset": log_offset,
+        }
+        (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, root / name)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    publish(name, root)
+    return name
+
+
+def publish(name: str, root: Optional[Path] = None) -> None:
+    """Point ``CURRENT`` at snapshot ``name`` (atomic rename)."""
+    root = root or snapshot_dir()
+    tmp = root / f".{CURRENT}.{os.getpid()}.tmp"
+    tmp.write_text(name, encoding="utf-8")
+    os.replace(tmp, root / CURRENT)
+
+
+def prune(keep: Optional[int] = None, root: Optional[Path] = None) -> int:
+    """Delete all but the newest ``keep`` snapshots (never the published one), and
+    the delta logs none of the remaining snapshots start from. Returns the count
+    of snapshots removed.
+    """
+    from .delta_log import current_log, log_files
+
+    root = root or snapshot_dir()
+    keep = keep or getattr(settings, "SEARCH_INDEX_KEEP_SNAPSHOTS", 3)
+    current = current_name(root)
+    names = sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+    removed = 0
+    for name in names[:-keep] if len(names) > keep else []:
+        if name == current:
+            continue
+        try:
+            shutil.rmtree(root / name)
+            removed += 1
+        except OSError:
+            # Still mapped by a worker on a platform that forbids deleting it
+            logger.warning("Could not remove old search index snapshot %s", name)
+
+    for path in root.glob(".*.tmp"):
+        # Left behind by a writer that was killed
+        if path.is_dir() and time.time() - path.stat().st_mtime > _STALE_TMP_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+
+    needed = [current_log(root)]
+    for path in root.iterdir():
+        if path.is_dir() and not path.name.startswith("."):
+            try:
+                needed.append(read_meta(path).get("log"))
+            except (OSError, ValueError):
+                continue
+    needed = [n for n in needed if n]
+    if needed:
+        oldest = min(needed)
+        for name in log_files(root):
+            if name < oldest:
+                (root / name).unlink(missing_ok=True)
+    return removed
+
+
+def build_snapshot(log: Callable[[str], None] = lambda _msg: None) -> str:
+    """Build the index from the database, publish it as a snapshot and prune old ones.
+
+    A new delta log is started first: everything committed after that point is
+    in the new log, everything before it is in the database read.
+    """
+    from .delta_log import start_epoch
+
+    started = timezone.now()
+    log_name = start_epoch()
+    index = EmbeddingIndex.from_database()
+    log(f"Loaded {len(index)} products from the database")
+    name = write_snapshot(index, built_at=started, log_name=log_name)
+    removed = prune()
+    log(f"Published snapshot {name} ({removed} old snapshots removed)")
+    return name
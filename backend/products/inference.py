@@ -0,0 +1,178 @@
+"""Bounded, deadline-aware CLIP inference for the search endpoints.
+
+The embedding step of every image/text search (image decode + forward pass,
+or the text forward pass) runs on a dedicated pool of
+``PRODUCT_SEARCH_INFERENCE_WORKERS`` threads. The sync views wait on the
+Future with a timeout (``call``); the async views await it (``run``), so
+``AsyncImageSearchView`` / ``AsyncTextSearchView`` never run CLIP on the
+event loop or park one of Django's sync threads. The threads feed
+``clip_service``'s micro-batcher as usual, so concurrent searches still
+share forward passes.
+
+At most ``PRODUCT_SEARCH_INFERENCE_MAX_PENDING`` embedding calls are
+admitted at a time (queued or running); past that ``InferenceBusy`` is
+raised at once. A call that does not finish within the request's deadline
+raises ``InferenceTimeout``; it is cancelled if still queued, otherwise it
+completes in the background and fills the embedding cache for a retry.
+Either way the view answers with a degraded result (``products.fallback``).
+
+``metrics()`` reports the queue depth with peak, rejection and timeout
+counters; it is part of the readiness report (``/api/search/ready/``).
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Optional
+
+from django.conf import settings
+
+
+class InferenceUnavailable(Exception):
+    """The query embedding is not available in time; ``reason`` says why."""
+
+    reason = "unavailable"
+
+
+class InferenceBusy(InferenceUnavailable):
+    """Too many embedding calls are already waiting."""
+
+    reason = "busy"
+
+
+class InferenceTimeout(InferenceUnavailable):
+    """The embedding call did not finish before the deadline."""
+
+    reason = "timeout"
+
+
+def default_deadline_ms() -> Optional[float]:
+    return getattr(settings, "PRODUCT_SEARCH_DEADLINE_MS", None)
+
+
+def deadline_after(ms: Optional[float]) -> Optional[float]:
+    """``time.monotonic()`` value ``ms`` milliseconds from now (None: no deadline)."""
+    return None if ms is None else time.monotonic() + ms / 1000.0
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left until ``deadline`` (None: no deadline)."""
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class InferenceGate:
+    """Admission limit in front of a bounded thread pool."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.peak = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.failed = 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="search-inference")
+        return self._executor
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Run ``fn(*args)`` on the pool. Raises InferenceBusy when the queue is full."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise InferenceBusy(f"{self._pending} embedding calls already queued")
+            self._pending += 1
+            self.admitted += 1
+            self.peak = max(self.peak, self._pending)
+        try:
+            future = self._pool().submit(self._call, fn, args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        # Also fires when a queued call is cancelled, so the count never leaks
+        future.add_done_callback(self._done)
+        return future
+
+    def call(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """Run ``fn(*args)`` on the pool and wait at most ``timeout`` seconds for it.
+
+        Raises InferenceBusy or InferenceTimeout; errors of ``fn`` propagate.
+        """
+        future = self._submit_within(timeout, fn, args)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            raise self._timeout(future) from None
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """``call`` for coroutines: awaits without holding a thread of the caller's."""
+        future = self._submit_within(timeout, fn, args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            raise self._timeout(future) from None
+
+    def _submit_within(self, timeout, fn, args) -> Future:
+        if timeout is not None and timeout <= 0:
+            # The budget went on parsing and cache lookups: do not queue work nobody waits for
+            with self._lock:
+                self.timed_out += 1
+            raise InferenceTimeout("no time left for the embedding call")
+        return self.submit(fn, *args)
+
+    def _timeout(self, future: Future) -> InferenceTimeout:
+        # Frees the slot if still queued; a running call finishes and fills the cache
+        future.cancel()
+        with self._lock:
+            self.timed_out += 1
+        return InferenceTimeout("embedding call exceeded the search deadline")
+
+    def _call(self, fn, args):
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            if not future.cancelled() and future.exception() is not None:
+                self.failed += 1
+
+    def depth(self) -> int:
+        """Admitted calls waiting for a worker thread."""
+        with self._lock:
+            return self._pending - self._running
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "running": self._running,
+                "queue_depth": self._pending - self._running,
+                "peak_pending": self.peak,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "failed": self.failed,
+            }
+
+
+inference_gate = InferenceGate(
+    workers=getattr(settings, "PRODUCT_SEARCH_INFERENCE_WORKERS", 16),
+    max_pending=getattr(settings, "PRODUCT_SEARCH_INFERENCE_MAX_PENDING", 64),
+)
@@ -0,0 +1,244 @@
+"""In-memory BM25 inverted index over product names and descriptions.
+
+Text is folded to lower-case ASCII (Vietnamese diacritics and ``đ`` removed)
+before tokenizing, so "ao thun" matches "Áo thun". Name tokens count
+``_NAME_WEIGHT`` times, a cheap stand-in for BM25F field weights.
+
+Postings are kept per term as ``{row: tf}`` for cheap incremental updates;
+each term's postings are turned into numpy arrays on first use and cached
+until the term changes, so a query is a few vectorized array operations.
+
+The index lives in each worker and the product signals only update the one
+of the process that saved; ``get_lexical_index()`` catches up with changes
+made elsewhere from the database (``products.catalog_sync``).
+"""
+import math
+import re
+import logging
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .search_index import top_k
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+_NAME_WEIGHT = 2
+
+
+def fold(text: str) -> str:
+    """Lower-case ``text`` and strip diacritics."""
+    text = unicodedata.normalize("NFKD", (text or "").casefold().replace("đ", "d"))
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(fold(text))
+
+
+def _document_terms(name: str, description: str) -> Counter:
+    terms = Counter(tokenize(description))
+    for token in tokenize(name):
+        terms[token] += _NAME_WEIGHT
+    return terms
+
+
+class LexicalIndex:
+    """BM25 scoring over active products; mutated in place by the product signals."""
+
+    def __init__(self, k1: Optional[float] = None, b: Optional[float] = None):
+        self.k1 = k1 if k1 is not None else getattr(settings, "PRODUCT_SEARCH_BM25_K1", 1.2)
+        self.b = b if b is not None else getattr(settings, "PRODUCT_SEARCH_BM25_B", 0.75)
+        self._lock = threading.RLock()
+        self._rows: Dict[int, int] = {}
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._n_rows = 0
+        self._doc_terms: List[Optional[Counter]] = []
+        self._free: List[int] = []
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._total_length = 0
+        # Products table signature as of the last database sync
+        self.db_signature: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @classmethod
+    def from_database(cls):
+        from .catalog_sync import signature
+        from .models import Product
+
+        index = cls()
+        # Taken first: changes saved while the rows are read are synced later
+        index.db_signature = signature()
+        rows = Product.objects.filter(is_active=True).values_list("id", "name", "description")
+        for pid, name, description in rows.iterator(chunk_size=2000):
+            index.upsert(pid, name, description)
+        return index
+
+    # --------------------------------------------------------------- mutation
+    def upsert(self, product_id: int, name: str, description: str = "") -> None:
+        terms = _document_terms(name, description)
+        product_id = int(product_id)
+        with self._lock:
+            row = self._rows.get(product_id)
+            if row is not None:
+                self._drop_postings(row)
+            else:
+                row = self._free.pop() if self._free else self._new_row()
+                self._rows[product_id] = row
+                self._ids[row] = product_id
+            self._doc_terms[row] = terms
+            length = sum(terms.values())
+            self._lengths[row] = length
+            self._total_length += length
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[row] = tf
+                self._arrays.pop(term, None)
+
+    def remove(self, product_id: int) -> None:
+        with self._lock:
+            row = self._rows.pop(int(product_id), None)
+            if row is None:
+                return
+            self._drop_postings(row)
+            self._doc_terms[row] = None
+            self._lengths[row] = 0
+            self._ids[row] = 0
+            self._free.append(row)
+
+    def product_ids(self) -> List[int]:
+        with self._lock:
+            return list(self._rows)
+
+    def _new_row(self) -> int:
+        row = self._n_rows
+        if row == self._ids.shape[0]:
+            capacity = max(1024, row * 2)
+            ids = np.zeros(capacity, dtype=np.int64)
+            ids[:row] = self._ids[:row]
+            lengths = np.zeros(capacity, dtype=np.float32)
+            lengths[:row] = self._lengths[:row]
+            self._ids, self._lengths = ids, lengths
+        self._doc_terms.append(None)
+        self._n_rows += 1
+        return row
+
+    def _drop_postings(self, row: int) -> None:
+        terms = self._doc_terms[row]
+        if not terms:
+            return
+        self._total_length -= sum(terms.values())
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(row, None)
+            if not postings:
+                del self._postings[term]
+            self._arrays.pop(term, None)
+
+    def _term_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        cached = self._arrays.get(term)
+        if cached is None:
+            postings = self._postings.get(term)
+            if not postings:
+                return None
+            rows = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tfs = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            cached = self._arrays[term] = (rows, tfs)
+        return cached
+
+    # ----------------------------------------------------------------- search
+    def search(self, text: str, k: int = 100) -> List[Tuple[int, float]]:
+        """Top ``k`` ``(product_id, bm25_score)`` pairs for ``text``, best first."""
+        terms = set(tokenize(text))
+        with self._lock:
+            n_docs = len(self._rows)
+            if not terms or n_docs == 0:
+                return []
+            avgdl = self._total_length / n_docs or 1.0
+            n_rows = self._n_rows
+            lengths = self._lengths[:n_rows]
+            ids = self._ids[:n_rows]
+            postings = [p for p in (self._term_arrays(t) for t in terms) if p is not None]
+
+        if not postings:
+            return []
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / avgdl)
+        scores = np.zeros(n_rows, dtype=np.float32)
+        for rows, tfs in postings:
+            df = rows.shape[0]
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tfs * (self.k1 + 1.0) / (tfs + norm[rows])
+        candidates = np.flatnonzero(scores)
+        best = candidates[top_k(scores[candidates], k)]
+        return [(int(ids[i]), float(scores[i])) for i in best]
+
+
+_index: Optional[LexicalIndex] = None
+_index_lock = threading.Lock()
+_sync_checked = 0.0
+_syncing = False
+
+
+def get_lexical_index() -> LexicalIndex:
+    """Return the shared lexical index, building it from the database on first use.
+
+    Every ``SEARCH_INDEX_CHECK_INTERVAL`` seconds it is synced with the
+    database on a background thread.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = LexicalIndex.from_database()
+    else:
+        _check_sync(_index)
+    return _index
+
+
+def _check_sync(index: LexicalIndex) -> None:
+    global _sync_checked, _syncing
+    now = time.monotonic()
+    if _syncing or now - _sync_checked < getattr(settings, "SEARCH_INDEX_CHECK_INTERVAL", 5):
+        return
+    _sync_checked = now
+    with _index_lock:
+        if _syncing:
+            return
+        _syncing = True
+    threading.Thread(target=_sync, args=(index,), name="lexical-database-sync", daemon=True).start()
+
+
+def _sync(index: LexicalIndex) -> None:
+    global _syncing
+    from django.db import connection
+
+    from .catalog_sync import sync_lexical
+
+    try:
+        sync_lexical(index)
+    except Exception:
+        logger.exception("Could not sync the lexical index with the database")
+    finally:
+        connection.close()
+        _syncing = False
+
+
+def peek_lexical_index() -> Optional[LexicalIndex]:
+    return _index
+
+
+def reset_lexical_index() -> None:
+    global _index
+    with _index_lock:
+        _index = None
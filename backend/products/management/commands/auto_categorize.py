@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from products.categorize import METHODS, categorize_products, embed_missing, min_confidence, uncategorized_filter
+from products.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign categories to uncategorized products zero-shot: product image embeddings "
+        "are matched against category prompt embeddings (or per-category centroids) and "
+        "only confident predictions are written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--method", choices=METHODS, default=None, help="Category prototypes (default: setting)")
+        parser.add_argument(
+            "--min-confidence", type=float, default=None,
+            help=f"Softmax probability needed to assign (default {min_confidence()})",
+        )
+        parser.add_argument("--embed-missing", action="store_true", help="Embed product images that have no vector yet")
+        parser.add_argument("--dry-run", action="store_true", help="Print predictions without saving them")
+
+    def handle(self, *args, **opts):
+        if opts["embed_missing"]:
+            pending = Product.objects.filter(is_active=True).filter(uncategorized_filter()).values_list("id", flat=True)
+            stored = embed_missing(list(pending), log=self.stdout.write)
+            self.stdout.write(f"Embedded {stored} products")
+        predictions = categorize_products(
+            method=opts["method"],
+            threshold=opts["min_confidence"],
+            dry_run=opts["dry_run"],
+            log=self.stdout.write,
+        )
+        if opts["dry_run"]:
+            names = dict(Category.objects.values_list("id", "name"))
+            for p in sorted(predictions, key=lambda p: -p.confidence)[:50]:
+                mark = "✓" if p.assigned else " "
+                self.stdout.write(f"  {mark} #{p.product_id} -> {names.get(p.category_id)} ({p.confidence:.2f})")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from products.backfill import EmbeddingBackfill, default_checkpoint_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute CLIP image embeddings for products in batches: images are loaded by a "
+        "thread pool while the previous batch runs through the model, and results are "
+        "written with bulk_update. Progress is checkpointed so an interrupted run resumes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Recompute every active product, not only missing/stale embeddings",
+        )
+        parser.add_argument("--batch-size", type=int, default=32, help="Images per forward pass")
+        parser.add_argument("--workers", type=int, default=8, help="Threads loading/decoding images")
+        parser.add_argument("--limit", type=int, help="Stop after this many products")
+        parser.add_argument(
+            "--checkpoint", default=None,
+            help=f"Checkpoint file (default: {default_checkpoint_path()})",
+        )
+        parser.add_argument("--reset", action="store_true", help="Ignore an existing checkpoint and start over")
+
+    def handle(self, *args, **opts):
+        backfill = EmbeddingBackfill(
+            only_missing=not opts["all"],
+            batch_size=opts["batch_size"],
+            workers=opts["workers"],
+            checkpoint=opts["checkpoint"],
+            resume=not opts["reset"],
+            limit=opts["limit"],
+            log=self.stdout.write,
+        )
+        state = backfill.run()
+        if state.failed_ids:
+            self.stderr.write(f"Failed product ids: {state.failed_ids[:50]}")
@@ -0,0 +1,118 @@
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from products.ann import ENGINES
+from products.benchmark import synthetic_embeddings
+from products.search_index import EmbeddingIndex, l2_normalize
+
+DEFAULT_SWEEPS = {
+    "nprobe": "1,2,4,8,16,32",
+    "rerank": "10,50,100,200,500",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Report recall@k, latency and memory per product of an approximate "
+        "search engine against the exact float32 scan. Memory is what each "
+        "worker holds privately: the engine plus the float32 rows it re-ranks "
+        "from, unless those are memory-mapped (--mmap)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--engine", default="ivf", choices=sorted(ENGINES))
+        parser.add_argument("--rows", type=int, default=50000, help="Synthetic catalog size")
+        parser.add_argument("--from-db", action="store_true", help="Use real product embeddings instead")
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument(
+            "--values",
+            help="Comma-separated values of the engine's tuning parameter "
+                 "(nprobe for ivf, rerank for int8)",
+        )
+        parser.add_argument(
+            "--mmap", action="store_true",
+            help="Memory-map the float32 rows from a file, as workers do with a "
+                 "published snapshot (SEARCH_INDEX_SNAPSHOT_DIR)",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        if opts["from_db"]:
+            index = EmbeddingIndex.from_database()
+        else:
+            data = synthetic_embeddings(opts["rows"], seed=opts["seed"])
+            index = EmbeddingIndex.from_items(enumerate(data, start=1))
+        if len(index) == 0:
+            raise CommandError("Index is empty")
+        with tempfile.TemporaryDirectory() as tmp:
+            if opts["mmap"]:
+                index = self._mapped(index, Path(tmp))
+            self._run(index, opts)
+
+    @staticmethod
+    def _mapped(index, root):
+        """Copy of ``index`` whose float32 rows are read from a memory-mapped file."""
+        vectors, ids, alive = index.arrays()
+        np.save(root / "vectors.npy", vectors)
+        mapped = np.load(root / "vectors.npy", mmap_mode="r")
+        return EmbeddingIndex.from_arrays(
+            mapped, ids.copy(), alive.copy(), index.attribute_arrays(), len(ids), snapshot="bench"
+        )
+
+    def _run(self, index, opts):
+        rng = np.random.default_rng(opts["seed"])
+
+        vectors, _ids, _alive = index.arrays()
+        picks = rng.choice(vectors.shape[0], min(opts["queries"], vectors.shape[0]), replace=False)
+        noise = 0.05 * rng.standard_normal((picks.shape[0], index.dim)).astype(np.float32)
+        queries = [l2_normalize(q) for q in vectors[picks] + noise]
+        k = opts["k"]
+        rows = len(index)
+
+        # float32 rows held in private memory; mapped pages are shared page cache
+        float32_bytes = 0 if isinstance(vectors, np.memmap) else vectors.nbytes
+        other_bytes = index.nbytes - index._vectors.nbytes
+        self.stdout.write(
+            f"rows={rows} dim={index.dim} queries={len(queries)} k={k} "
+            f"float32 rows {'memory-mapped (shared page cache, not counted)' if opts['mmap'] else 'in memory'}"
+        )
+        truth, exact_ms = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            hits = index.search(q, k, engine="exact")
+            exact_ms.append((time.perf_counter() - t0) * 1000)
+            truth.append({pid for pid, _ in hits})
+        self._report("exact", 1.0, exact_ms, (float32_bytes + other_bytes) / rows, 0, float32_bytes / rows)
+
+        engine_cls = ENGINES[opts["engine"]]
+        t0 = time.perf_counter()
+        engine = engine_cls.build(index, seed=opts["seed"])
+        self.stdout.write(f"{opts['engine']} build: {(time.perf_counter() - t0):.2f}s")
+
+        param = engine_cls.tuning_param
+        values = opts["values"] or DEFAULT_SWEEPS[param]
+        for value in (int(v) for v in values.split(",") if v):
+            recall, latency = [], []
+            for q, expected in zip(queries, truth):
+                t0 = time.perf_counter()
+                hits = engine.search(index, q, k, **{param: value})
+                latency.append((time.perf_counter() - t0) * 1000)
+                recall.append(len(expected & {pid for pid, _ in hits}) / max(1, len(expected)))
+            self._report(
+                f"{opts['engine']} {param}={value}", float(np.mean(recall)), latency,
+                (engine.nbytes + float32_bytes + other_bytes) / rows, engine.nbytes / rows, float32_bytes / rows,
+            )
+
+    def _report(self, label, recall, latency_ms, bytes_per_product, engine_bytes, float32_bytes):
+        lat = np.asarray(latency_ms)
+        self.stdout.write(
+            f"{label:<20} recall@k={recall:.3f} "
+            f"mean={lat.mean():.2f}ms p95={np.percentile(lat, 95):.2f}ms "
+            f"mem={bytes_per_product:.0f}B/product "
+            f"(engine {engine_bytes:.0f}B + float32 {float32_bytes:.0f}B)"
+        )
@@ -0,0 +1,241 @@
+import gc
+import io
+import itertools
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.test import override_settings
+from PIL import Image
+from rest_framework.test import APIRequestFactory
+
+from products import search_index
+from products.benchmark import environment, query_vectors, rss_bytes, stub_clip, summarize, synthetic_index
+from products.models import Product
+from products.search_cache import image_embedding_cache, search_result_cache
+from products.search_index import available_engines
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark search latency (p50/p95/p99) and memory per scoring engine on synthetic "
+        "catalogs of several sizes, with CLIP stubbed out. Results are written as JSON so "
+        "runs can be compared across commits (--compare)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="Comma-separated catalog sizes")
+        parser.add_argument("--engines", default=",".join(available_engines()), help="Comma-separated engines")
+        parser.add_argument("--queries", type=int, default=200, help="Timed index searches per engine and size")
+        parser.add_argument("--warmup", type=int, default=10, help="Untimed searches first (after the engine build)")
+        parser.add_argument("--k", type=int, default=50)
+        parser.add_argument(
+            "--views", action="store_true",
+            help="Also time TextSearchView/ImageSearchView end to end; products are seeded "
+                 "in a transaction that is rolled back afterwards",
+        )
+        parser.add_argument("--view-queries", type=int, default=50, help="Timed requests per view, engine and size")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="JSON results file (default: bench_results/search-<commit>-<time>.json)")
+        parser.add_argument("--compare", help="Earlier JSON results to compare p95 latency against")
+
+    def handle(self, *args, **opts):
+        sizes = [int(s) for s in opts["sizes"].split(",") if s]
+        engines = [e for e in opts["engines"].split(",") if e]
+        unknown = set(engines) - set(available_engines())
+        if unknown:
+            raise CommandError(f"Unknown engines: {', '.join(sorted(unknown))}")
+
+        meta = environment()
+        meta.update(
+            k=opts["k"], queries=opts["queries"], warmup=opts["warmup"], seed=opts["seed"],
+            ann_min_rows=getattr(settings, "PRODUCT_SEARCH_ANN_MIN_ROWS", 5000),
+        )
+        first_id = (Product.objects.aggregate(top=Max("id"))["top"] or 0) + 1
+        self.stdout.write("(* = below PRODUCT_SEARCH_ANN_MIN_ROWS, the engine falls back to the exact scan)")
+        results = []
+        # A published snapshot must not be swapped in under the synthetic index
+        with override_settings(SEARCH_INDEX_SNAPSHOT_DIR=None):
+            for rows in sizes:
+                started = time.perf_counter()
+                index = synthetic_index(rows, seed=opts["seed"], first_id=first_id)
+                self.stdout.write(
+                    f"rows={rows}: synthetic index {index.nbytes / 1e6:.1f} MB "
+                    f"in {time.perf_counter() - started:.1f}s"
+                )
+                queries = query_vectors(index, opts["queries"] + opts["warmup"], seed=opts["seed"])
+                previous = search_index._index
+                search_index._index = index
+                try:
+                    for engine in engines:
+                        results.append(self._bench_index(index, engine, queries, opts))
+                    if opts["views"]:
+                        results.extend(self._bench_views(index, engines, queries, opts))
+                finally:
+                    search_index._index = previous
+                del index, queries
+                gc.collect()
+
+        output = Path(opts["output"]) if opts["output"] else self._default_output(meta)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps({"meta": meta, "results": results}, indent=2), encoding="utf-8")
+        self.stdout.write(f"Results written to {output}")
+        if opts["compare"]:
+            self._compare(Path(opts["compare"]), results)
+
+    # ------------------------------------------------------------------ index
+    def _bench_index(self, index, engine, queries, opts):
+        k = opts["k"]
+        t0 = time.perf_counter()
+        # The first search builds the approximate engine
+        index.search(queries[0], k, engine=engine)
+        build_s = time.perf_counter() - t0
+        for q in queries[1:opts["warmup"]]:
+            index.search(q, k, engine=engine)
+        latency = []
+        for q in queries[opts["warmup"]:]:
+            t0 = time.perf_counter()
+            index.search(q, k, engine=engine)
+            latency.append((time.perf_counter() - t0) * 1000)
+        built = index._engines.get(engine)
+        result = {
+            "target": "index",
+            "rows": len(index),
+            "engine": engine,
+            # Below PRODUCT_SEARCH_ANN_MIN_ROWS approximate engines fall back to the exact scan
+            "ann": built is not None,
+            "build_s": round(build_s, 4),
+            "index_bytes": index.nbytes,
+            "engine_bytes": built.nbytes if built is not None else 0,
+            "rss_bytes": rss_bytes(),
+            **summarize(latency),
+        }
+        self._print(result)
+        return result
+
+    # ------------------------------------------------------------------ views
+    def _bench_views(self, index, engines, queries, opts):
+        from products.views import ImageSearchView, TextSearchView
+
+        factory = APIRequestFactory()
+        text_view, image_view = TextSearchView.as_view(), ImageSearchView.as_view()
+        upload = self._jpeg()
+        results = []
+        try:
+            with transaction.atomic():
+                self._seed_products(index)
+                with stub_clip(itertools.cycle(queries)):
+                    for engine in engines:
+                        params = f"k={opts['k']}&engine={engine}"
+
+                        def text(i):
+                            return text_view(factory.get(f"/api/search/text/?{params}&q=bench+{i}"))
+
+                        def image(i):
+                            image_embedding_cache.clear()
+                            body = {"file": SimpleUploadedFile("query.jpg", upload, content_type="image/jpeg")}
+                            return image_view(factory.post(f"/api/search/image/?{params}", body, format="multipart"))
+
+                        for target, call in (("text_view", text), ("image_view", image)):
+                            results.append(self._time_view(target, call, index, engine, opts))
+                raise _Rollback
+        except _Rollback:
+            pass
+        return results
+
+    def _time_view(self, target, call, index, engine, opts):
+        latency = []
+        for i in range(opts["warmup"] + opts["view_queries"]):
+            # Every request is a result-cache miss
+            search_result_cache.clear()
+            t0 = time.perf_counter()
+            response = call(i)
+            response.render()
+            elapsed = (time.perf_counter() - t0) * 1000
+            if response.status_code != 200:
+                raise CommandError(f"{target} returned {response.status_code}: {response.data}")
+            if i >= opts["warmup"]:
+                latency.append(elapsed)
+        result = {
+            "target": target,
+            "rows": len(index),
+            "engine": engine,
+            "ann": index._engines.get(engine) is not None,
+            "rss_bytes": rss_bytes(),
+            **summarize(latency),
+        }
+        self._print(result)
+        return result
+
+    def _seed_products(self, index):
+        """Insert one product per index row (ids match), inside the caller's transaction."""
+        started = time.perf_counter()
+        seller, _ = get_user_model().objects.get_or_create(
+            username="bench-seller", defaults={"email": "bench-seller@example.com"}
+        )
+        _vectors, ids, _alive = index.arrays()
+        attrs = index.attribute_arrays()
+        batch = 5000
+        for start in range(0, ids.shape[0], batch):
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        id=int(pid), seller=seller, name=f"Sản phẩm {pid}", price=float(price),
+                        stock=int(stock), is_active=True,
+                    )
+                    for pid, price, stock in zip(
+                        ids[start:start + batch], attrs["price"][start:start + batch], attrs["stock"][start:start + batch]
+                    )
+                ],
+                batch_size=batch,
+            )
+        self.stdout.write(f"  seeded {ids.shape[0]} products in {time.perf_counter() - started:.1f}s")
+
+    @staticmethod
+    def _jpeg() -> bytes:
+        rng = np.random.default_rng(0)
+        pixels = rng.integers(0, 256, (800, 800, 3), dtype="uint8")
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+        return buf.getvalue()
+
+    # ---------------------------------------------------------------- output
+    def _print(self, r):
+        memory = ""
+        if "index_bytes" in r:
+            memory = f" index={r['index_bytes'] / 1e6:.1f}MB engine={r['engine_bytes'] / 1e6:.1f}MB"
+        rss = f" rss={r['rss_bytes'] / 1e6:.0f}MB" if r.get("rss_bytes") else ""
+        self.stdout.write(
+            f"  {r['target']:<10} {r['engine']:<6}{'*' if r['engine'] != 'exact' and not r['ann'] else ' '} "
+            f"p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms p99={r['p99_ms']:.2f}ms{memory}{rss}"
+        )
+
+    @staticmethod
+    def _default_output(meta) -> Path:
+        commit = (meta.get("commit") or "nogit")[:10]
+        return Path(settings.BASE_DIR) / "bench_results" / f"search-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+
+    def _compare(self, path, results):
+        baseline = json.loads(path.read_text(encoding="utf-8"))
+        before = {(r["target"], r["rows"], r["engine"]): r for r in baseline.get("results", [])}
+        self.stdout.write(f"p95 vs {path} ({(baseline.get('meta') or {}).get('commit')}):")
+        for r in results:
+            old = before.get((r["target"], r["rows"], r["engine"]))
+            if old is None:
+                continue
+            change = (r["p95_ms"] / old["p95_ms"] - 1) * 100 if old["p95_ms"] else 0.0
+            self.stdout.write(
+                f"  {r['target']:<10} rows={r['rows']:<8} {r['engine']:<6} "
+                f"{old['p95_ms']:.2f} -> {r['p95_ms']:.2f}ms ({change:+.1f}%)"
+            )
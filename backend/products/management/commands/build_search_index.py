@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.index_snapshot import build_snapshot, enabled, snapshot_dir
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the on-disk embedding index snapshot from the database and publish it. "
+        "Running workers memory-map the new snapshot within SEARCH_INDEX_CHECK_INTERVAL "
+        "seconds, without a restart."
+    )
+
+    def handle(self, *args, **opts):
+        if not enabled():
+            raise CommandError("SEARCH_INDEX_SNAPSHOT_DIR is not set")
+        started = time.perf_counter()
+        name = build_snapshot(log=lambda msg: self.stdout.write(f"  {msg}"))
+        self.stdout.write(f"Snapshot {snapshot_dir() / name} ready in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.similar import build_similar_products, similar_count
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the \"similar products\" table: every active product's top-N "
+        "neighbours by embedding cosine, scored in memory-bounded blocks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=None, help=f"Neighbours per product (default {similar_count()})")
+        parser.add_argument(
+            "--block-rows", type=int, default=None,
+            help="Query rows per matmul block (default: from PRODUCT_SIMILAR_BLOCK_BYTES)",
+        )
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        total = build_similar_products(
+            count=opts["count"],
+            block_rows=opts["block_rows"],
+            log=lambda msg: self.stdout.write(f"  {msg}"),
+        )
+        self.stdout.write(f"Similar products: {total} products in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from products.image_io import open_product_image
+from products.models import Product
+from products.search_index import get_index, l2_normalize
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the dynamically int8-quantized CLIP model against fp32 on a sample "
+        "of catalog images: embedding cosine, top-k search overlap and latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sample", type=int, default=50, help="Number of catalog images")
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--batch-size", type=int, default=16)
+        parser.add_argument(
+            "--queries", default="áo thun,giày,túi xách,váy đầm,đồng hồ",
+            help="Comma-separated text queries to compare as well",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        import clip_service
+
+        ids = list(
+            Product.objects.filter(is_active=True)
+            .exclude(image="", image_url="")
+            .values_list("id", flat=True)
+        )
+        if not ids:
+            raise CommandError("No products with images")
+        rng = np.random.default_rng(opts["seed"])
+        picks = rng.choice(len(ids), min(opts["sample"], len(ids)), replace=False)
+
+        images = []
+        for p in Product.objects.filter(id__in=[ids[i] for i in picks]):
+            img = open_product_image(p)
+            if img is not None:
+                images.append(clip_service._to_rgb(img))
+        if not images:
+            raise CommandError("Could not load any sampled image")
+        self.stdout.write(f"Loaded {len(images)} images")
+
+        fp32, fp32_s = self._embed(clip_service._embed_images, images, False, opts["batch_size"])
+        int8, int8_s = self._embed(clip_service._embed_images, images, True, opts["batch_size"])
+        self._compare("image", fp32, int8, opts["k"])
+        self.stdout.write(
+            f"image latency per item: fp32={fp32_s / len(images) * 1000:.1f}ms "
+            f"int8={int8_s / len(images) * 1000:.1f}ms"
+        )
+
+        queries = [q.strip() for q in opts["queries"].split(",") if q.strip()]
+        if queries:
+            fp32, _ = self._embed(clip_service._embed_texts, queries, False, opts["batch_size"])
+            int8, _ = self._embed(clip_service._embed_texts, queries, True, opts["batch_size"])
+            self._compare("text", fp32, int8, opts["k"])
+
+    def _embed(self, fn, items, quantized, batch_size):
+        fn(items[:1], quantized=quantized)  # load + warm up
+        started = time.perf_counter()
+        out = []
+        for start in range(0, len(items), batch_size):
+            out.extend(fn(items[start:start + batch_size], quantized=quantized))
+        return [l2_normalize(v) for v in out], time.perf_counter() - started
+
+    def _compare(self, label, fp32, int8, k):
+        cosines = np.array([float(a @ b) for a, b in zip(fp32, int8)])
+        index = get_index()
+        overlaps = []
+        for a, b in zip(fp32, int8):
+            top_a = {pid for pid, _ in index.search(a, k, engine="exact")}
+            top_b = {pid for pid, _ in index.search(b, k, engine="exact")}
+            if top_a:
+                overlaps.append(len(top_a & top_b) / len(top_a))
+        overlap = f"{np.mean(overlaps):.3f}" if overlaps else "n/a (empty index)"
+        self.stdout.write(
+            f"{label}: cosine(fp32, int8) mean={cosines.mean():.4f} min={cosines.min():.4f}; "
+            f"top-{k} overlap={overlap}"
+        )
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a pool of CLIP embedding worker processes on a Unix socket. Web workers "
+        "reach it when CLIP_SERVICE_SOCKET points to the same path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=None, help="Socket path (default: CLIP_SERVICE_SOCKET)")
+        parser.add_argument("--processes", type=int, default=1, help="Worker processes, each with its own model")
+
+    def handle(self, *args, **opts):
+        path = opts["socket"] or getattr(settings, "CLIP_SERVICE_SOCKET", None)
+        if not path:
+            raise CommandError("Pass --socket or set CLIP_SERVICE_SOCKET")
+
+        # The workers must run the model themselves, not forward to the socket
+        settings.CLIP_SERVICE_SOCKET = None
+
+        from clip_remote import serve
+
+        self.stdout.write(f"Starting {opts['processes']} CLIP worker(s) on {path}")
+        serve(path, processes=opts["processes"])
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.duplicates import find_duplicates, store_clusters
+
+
+class Command(BaseCommand):
+    help = (
+        "Detect near-duplicate products (reposts of one item): LSH buckets over the "
+        "embedding index propose pairs, image cosine and name similarity confirm them, "
+        "and the resulting clusters are saved for review in the admin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--image-threshold", type=float, default=None, help="Minimum image cosine")
+        parser.add_argument("--name-threshold", type=float, default=None, help="Minimum name token Jaccard")
+        parser.add_argument("--bands", type=int, default=None, help="LSH tables")
+        parser.add_argument("--bits", type=int, default=None, help="Hyperplanes per LSH table")
+        parser.add_argument("--max-bucket", type=int, default=2000, help="Rows compared at once inside one bucket")
+        parser.add_argument(
+            "--recall-sample", type=int, default=200,
+            help="Random products whose exact pairs check the LSH recall (0 to skip)",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Report clusters without saving them")
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        clusters = find_duplicates(
+            image_threshold=opts["image_threshold"],
+            name_threshold=opts["name_threshold"],
+            bands=opts["bands"],
+            bits=opts["bits"],
+            max_bucket=opts["max_bucket"],
+            recall_sample=opts["recall_sample"],
+            log=lambda msg: self.stdout.write(f"  {msg}"),
+        )
+        products = sum(len(c) for c in clusters)
+        self.stdout.write(
+            f"Duplicates: {len(clusters)} clusters, {products} products "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        if opts["dry_run"]:
+            for members in clusters[:20]:
+                self.stdout.write("  " + ", ".join(f"{m.product_id} ({m.score:.3f})" for m in members))
+            return
+        kept, created = store_clusters(clusters)
+        self.stdout.write(f"Saved: {created} new clusters, {kept} unchanged (review status kept)")
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Download/load the CLIP model and run one forward pass, optionally building the "
+        "embedding index. Useful in image builds and deploy scripts to fail fast and "
+        "prime the Hugging Face cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", action="store_true", help="Also build the product embedding index")
+
+    def handle(self, *args, **opts):
+        import clip_service
+
+        seconds = clip_service.warm_up()
+        self.stdout.write(f"CLIP ready in {seconds:.2f}s ({clip_service.latency_stats()})")
+
+        if opts["index"]:
+            from products.search_index import get_index
+
+            started = time.perf_counter()
+            index = get_index()
+            self.stdout.write(
+                f"Index: {len(index)} products, {index.nbytes / 1e6:.1f} MB, "
+                f"built in {time.perf_counter() - started:.2f}s"
+            )
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-16 09:00
+
+import numpy as np
+from django.db import migrations, models
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+
+
+def json_to_binary(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    batch = []
+    qs = Product.objects.exclude(image_embedding__isnull=True).only("id", "image_embedding")
+    for p in qs.iterator(chunk_size=500):
+        try:
+            arr = np.asarray(p.image_embedding, dtype="<f4").reshape(-1)
+        except (TypeError, ValueError):
+            continue
+        if arr.size == 0:
+            continue
+        p.embedding = arr.tobytes()
+        p.embedding_dim = int(arr.size)
+        p.embedding_model = CLIP_MODEL_NAME
+        batch.append(p)
+        if len(batch) >= 500:
+            Product.objects.bulk_update(batch, ["embedding", "embedding_dim", "embedding_model"])
+            batch.clear()
+    if batch:
+        Product.objects.bulk_update(batch, ["embedding", "embedding_dim", "embedding_model"])
+
+
+def binary_to_json(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    batch = []
+    qs = Product.objects.exclude(embedding__isnull=True).only("id", "embedding", "embedding_dim")
+    for p in qs.iterator(chunk_size=500):
+        if not p.embedding_dim:
+            continue
+        width = len(p.embedding) // p.embedding_dim
+        dtype = "<f2" if width == 2 else "<f4"
+        p.image_embedding = np.frombuffer(p.embedding, dtype=dtype).astype(float).tolist()
+        batch.append(p)
+        if len(batch) >= 500:
+            Product.objects.bulk_update(batch, ["image_embedding"])
+            batch.clear()
+    if batch:
+        Product.objects.bulk_update(batch, ["image_embedding"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_alter_category_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='embedding_dim',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='embedding_model',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+        migrations.RemoveField(
+            model_name='product',
+            name='image_embedding',
+        ),
+    ]
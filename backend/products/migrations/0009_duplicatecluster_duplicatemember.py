@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-17 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_similarproduct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Chờ duyệt'), ('confirmed', 'Trùng lặp'), ('rejected', 'Không trùng')], default='pending', max_length=20)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('score', models.FloatField(default=0.0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-size', '-score'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DuplicateMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_representative', models.BooleanField(default=False)),
+                ('score', models.FloatField(default=1.0)),
+                ('name_score', models.FloatField(default=1.0)),
+                ('cluster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='products.duplicatecluster')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_membership', to='products.product')),
+            ],
+            options={
+                'ordering': ['cluster', '-is_representative', '-score'],
+            },
+        ),
+    ]
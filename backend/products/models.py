@@ -1,6 +1,9 @@
 from django.db import models
 from django.conf import settings
 from django.utils.text import slugify
+from django.utils import timezone
+
+from .embeddings import current_model_name, pack_embedding, unpack_embedding
 
 User = settings.AUTH_USER_MODEL
 
@@ -42,23 +45,87 @@ class Product(models.Model):
     size_options = models.JSONField(default=list, blank=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     image_url = models.URLField(max_length=500, blank=True)
-    image_embedding = models.JSONField(null=True, blank=True)
+    # CLIP embedding packed as raw float32/float16 bytes (see products.embeddings)
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
+    embedding_dim = models.PositiveSmallIntegerField(default=0, editable=False)
+    embedding_model = models.CharField(max_length=100, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    EMBEDDING_FIELDS = ['embedding', 'embedding_dim', 'embedding_model']
+    # Columns to write after set_embedding(): the updated_at bump is what lets
+    # other workers' database sync (products.catalog_sync) see the new vector
+    EMBEDDING_SAVE_FIELDS = [*EMBEDDING_FIELDS, 'updated_at']
+
     class Meta:
         ordering = ['-created_at']
 
     def __str__(self):
         return f'{self.name} ({self.seller})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Column values as loaded: the save signals compare against them to
+        # tell what changed without reading the row again (products.signals)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def save(self, *args, **kwargs):
         if self.price is None or self.price <= 0:
             raise ValueError("Price must be greater than zero.")
         if self.stock is not None and self.stock < 0:
             raise ValueError("Stock cannot be negative.")
         super().save(*args, **kwargs)
+        self._remember_db_values(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._remember_db_values(fields)
+
+    def _remember_db_values(self, names=None):
+        """Record the current values of the ``names`` columns (default: all
+        loaded ones) as what the database holds."""
+        if names is None:
+            deferred = self.get_deferred_fields()
+            fields = [f for f in self._meta.concrete_fields if f.attname not in deferred]
+            loaded = {}
+        else:
+            fields = [self._meta.get_field(name) for name in names]
+            loaded = getattr(self, '_loaded_values', {})
+        for field in fields:
+            value = getattr(self, field.attname)
+            loaded[field.attname] = value.name if field.attname == 'image' else value
+        self._loaded_values = loaded
+
+    @property
+    def embedding_vector(self):
+        """Zero-copy NumPy view of the stored embedding, or None."""
+        return unpack_embedding(self.embedding, self.embedding_dim)
+
+    def set_embedding(self, values, model_name=None):
+        """Pack ``values`` into the binary columns (None clears them).
+
+        Call ``save(update_fields=Product.EMBEDDING_SAVE_FIELDS)`` afterwards.
+        """
+        # Set here too because bulk_update() does not apply auto_now
+        self.updated_at = timezone.now()
+        if values is None or len(values) == 0:
+            self.embedding, self.embedding_dim, self.embedding_model = None, 0, ''
+            return
+        self.embedding, self.embedding_dim = pack_embedding(values)
+        self.embedding_model = model_name or current_model_name()
+
+    @property
+    def image_embedding(self):
+        """Embedding as a list of floats (kept for scripts written against the old JSON column)."""
+        vec = self.embedding_vector
+        return None if vec is None else vec.astype(float).tolist()
+
+    @image_embedding.setter
+    def image_embedding(self, values):
+        self.set_embedding(values)
 
 
 class WishlistItem(models.Model):
@@ -103,3 +170,60 @@ class SavedItem(models.Model):
 
     def __str__(self):
         return f"Saved {self.product} for {self.user}"
+
+
+class SimilarProduct(models.Model):
+    """One edge of the precomputed "similar products" kNN graph (see products.similar)."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_edges')
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=('product', 'rank'), name='uniq_similar_product_rank')
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.neighbor_id} (#{self.rank}, {self.score:.3f})"
+
+
+class DuplicateCluster(models.Model):
+    """Group of products detected as reposts of the same item (see products.duplicates)."""
+    STATUS_PENDING = 'pending'
+    STATUS_CONFIRMED = 'confirmed'
+    STATUS_REJECTED = 'rejected'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Chờ duyệt'),
+        (STATUS_CONFIRMED, 'Trùng lặp'),
+        (STATUS_REJECTED, 'Không trùng'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    size = models.PositiveIntegerField(default=0)
+    # Lowest image similarity of a member to the representative
+    score = models.FloatField(default=0.0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-size', '-score']
+
+    def __str__(self):
+        return f"Cluster #{self.pk} ({self.size} sản phẩm, {self.get_status_display()})"
+
+
+class DuplicateMember(models.Model):
+    cluster = models.ForeignKey(DuplicateCluster, on_delete=models.CASCADE, related_name='members')
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='duplicate_membership')
+    is_representative = models.BooleanField(default=False)
+    # Similarities to the cluster representative (1.0 for the representative itself)
+    score = models.FloatField(default=1.0)
+    name_score = models.FloatField(default=1.0)
+
+    class Meta:
+        ordering = ['cluster', '-is_representative', '-score']
+
+    def __str__(self):
+        return f"{self.product_id} in #{self.cluster_id} ({self.score:.3f})"
@@ -0,0 +1,271 @@
+"""Caches in front of CLIP inference and ranking for the search endpoints.
+
+``EmbeddingCache`` is a bounded in-process LRU with a per-entry TTL. When
+``SEARCH_EMBEDDING_CACHE_ALIAS`` names a Django cache (e.g. Redis/Memcached),
+misses fall through to that shared backend before running the model, so
+workers benefit from each other's work.
+
+``ResultCache`` holds serialized search results. Its keys include the
+catalog version, which the product signals bump whenever a change could
+alter a ranking or a listed field (activation, price, stock, embedding...),
+so stale entries are simply never looked up again. The version lives in
+``SEARCH_EMBEDDING_CACHE_ALIAS``, else in the ``default`` cache; if that
+cache is not shared between processes (local-memory or dummy backend) a
+change in one worker could not invalidate the others, so results are not
+cached at all.
+"""
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+
+from .embeddings import current_model_name
+
+
+class EmbeddingCache:
+    """Thread-safe LRU + TTL cache of float32 vectors with hit/miss counters."""
+
+    def __init__(self, name: str, max_entries: int, ttl: float, alias: Optional[str] = None):
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self.alias = alias
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def _shared(self):
+        if not self.alias:
+            return None
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    def _shared_key(self, key: str) -> str:
+        # Hash so arbitrary unicode queries are valid memcached keys
+        return f"search:{self.name}:{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str, shared: bool = True) -> Optional[np.ndarray]:
+        """Cached vector for ``key`` or None. ``shared=False`` only looks in this
+        process: no I/O, and a miss is not counted (the caller looks again)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+        if not shared:
+            return None
+
+        backend = self._shared()
+        if backend is not None:
+            blob = backend.get(self._shared_key(key))
+            if blob is not None:
+                value = np.frombuffer(blob, dtype=np.float32)
+                self._store(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value) -> np.ndarray:
+        value = np.asarray(value, dtype=np.float32).reshape(-1)
+        value.setflags(write=False)
+        self._store(key, value)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(self._shared_key(key), value.tobytes(), timeout=int(self.ttl))
+        return value
+
+    def _store(self, key: str, value: np.ndarray) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.shared_hits = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a search query: NFC, case-folded, single spaces.
+
+    CLIP's tokenizer lower-cases and collapses whitespace itself, so queries
+    that only differ in those respects share one embedding.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+
+text_embedding_cache = EmbeddingCache(
+    "text",
+    max_entries=getattr(settings, "SEARCH_TEXT_CACHE_SIZE", 2048),
+    ttl=getattr(settings, "SEARCH_TEXT_CACHE_TTL", 3600),
+    alias=getattr(settings, "SEARCH_EMBEDDING_CACHE_ALIAS", None),
+)
+
+
+image_embedding_cache = EmbeddingCache(
+    "image",
+    max_entries=getattr(settings, "SEARCH_IMAGE_CACHE_SIZE", 512),
+    ttl=getattr(settings, "SEARCH_IMAGE_CACHE_TTL", 3600),
+    alias=getattr(settings, "SEARCH_EMBEDDING_CACHE_ALIAS", None),
+)
+
+
+def image_cache_key(data: bytes, roi: Optional[dict]) -> str:
+    """Key of an uploaded image search: model, SHA-256 of the bytes and the ROI."""
+    digest = hashlib.sha256(data).hexdigest()
+    roi_part = "full" if not roi else ",".join(f"{roi[c]:.6g}" for c in ("x", "y", "w", "h"))
+    return f"{current_model_name()}|{digest}|{roi_part}"
+
+
+def text_cache_key(query: str) -> str:
+    return f"{current_model_name()}|{normalize_query(query)}"
+
+
+def cached_text_embedding(query: str) -> np.ndarray:
+    """CLIP text embedding for ``query``, skipping the model on repeat queries."""
+    key = text_cache_key(query)
+    vector = text_embedding_cache.get(key)
+    if vector is None:
+        from clip_service import get_text_embedding
+
+        vector = text_embedding_cache.set(key, get_text_embedding(normalize_query(query)))
+    return vector
+
+
+class ResultCache(EmbeddingCache):
+    """Process-local LRU + TTL of serialized search results (any value).
+
+    Disabled (every lookup misses, nothing is stored) while there is no
+    shared catalog version, see ``shared_version_cache``.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float):
+        super().__init__(name, max_entries, ttl, alias=None)
+
+    def get(self, key: str, shared: bool = True):
+        if shared_version_cache() is None:
+            return None
+        return super().get(key, shared)
+
+    def set(self, key: str, value):
+        if shared_version_cache() is not None:
+            self._store(key, value)
+        return value
+
+
+search_result_cache = ResultCache(
+    "results",
+    max_entries=getattr(settings, "SEARCH_RESULT_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "SEARCH_RESULT_CACHE_TTL", 300),
+)
+
+_CATALOG_VERSION_KEY = "search:catalog-version"
+_catalog_version = 0
+_DUPLICATES_VERSION_KEY = "search:duplicates-version"
+_duplicates_version = 0
+_catalog_lock = threading.Lock()
+
+
+def shared_version_cache():
+    """Django cache holding the catalog version, or None if no cache is shared between workers.
+
+    ``SEARCH_EMBEDDING_CACHE_ALIAS`` when set, else ``default``; a local-memory
+    or dummy backend does not count as shared.
+    """
+    from django.core.cache import caches
+    from django.core.cache.backends.dummy import DummyCache
+    from django.core.cache.backends.locmem import LocMemCache
+
+    cache = caches[getattr(settings, "SEARCH_EMBEDDING_CACHE_ALIAS", None) or "default"]
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        return None
+    return cache
+
+
+def _read_version(key: str, local: int) -> int:
+    shared = shared_version_cache()
+    if shared is not None:
+        return int(shared.get_or_set(key, 0, timeout=None))
+    return local
+
+
+def _bump_shared_version(key: str) -> None:
+    shared = shared_version_cache()
+    if shared is not None:
+        try:
+            shared.incr(key)
+        except ValueError:
+            shared.set(key, 1, timeout=None)
+
+
+def catalog_version() -> int:
+    """Counter bumped on every search-relevant product change.
+
+    Lives in ``shared_version_cache()`` so a change in one worker invalidates
+    cached results in all of them; without a shared cache it only counts
+    this process's changes (and the result cache is off).
+    """
+    return _read_version(_CATALOG_VERSION_KEY, _catalog_version)
+
+
+def bump_catalog_version() -> None:
+    global _catalog_version
+    with _catalog_lock:
+        _catalog_version += 1
+    _bump_shared_version(_CATALOG_VERSION_KEY)
+
+
+def duplicates_version() -> int:
+    """Counter bumped when duplicate clusters are rebuilt or reviewed.
+
+    Kept apart from the catalog version, which every product save moves, so
+    the in-process cluster map is not reloaded on unrelated writes. Stored
+    like ``catalog_version``.
+    """
+    return _read_version(_DUPLICATES_VERSION_KEY, _duplicates_version)
+
+
+def bump_duplicates_version() -> None:
+    global _duplicates_version
+    with _catalog_lock:
+        _duplicates_version += 1
+    _bump_shared_version(_DUPLICATES_VERSION_KEY)
+
+
+def result_cache_key(kind: str, vector: np.ndarray, k: int, *parts) -> str:
+    """Key of a ranked result list: query vector fingerprint, ``k``, filters and
+    options (``parts``, reprs must be stable) and the catalog version."""
+    fingerprint = hashlib.blake2b(np.ascontiguousarray(vector, dtype=np.float32).tobytes(), digest_size=16).hexdigest()
+    return "|".join([kind, current_model_name(), fingerprint, str(k), *map(repr, parts), str(catalog_version())])
@@ -0,0 +1,600 @@
+"""Process-wide CLIP embedding index for product search.
+
+Every active product's embedding lives in one contiguous, L2-normalized float32
+matrix with a parallel array of product ids, so a search is a single
+matrix-vector product followed by an ``argpartition`` top-k instead of loading
+and scoring each row from the database on every request.
+
+``search`` runs the exact scan by default. Approximate engines from
+``products.ann`` can be picked per call or through ``PRODUCT_SEARCH_ENGINE``.
+
+Filterable attributes (category, seller, price, stock) are kept in arrays
+parallel to the matrix, so ``SearchFilters`` become a boolean row mask that is
+applied inside the scoring step instead of as extra database queries.
+
+With ``SEARCH_INDEX_SNAPSHOT_DIR`` set, the index is opened from the current
+on-disk snapshot (``products.index_snapshot``) instead of the database, and a
+newer snapshot is picked up in the background once it is published. Changes
+logged by other workers since the snapshot (``products.delta_log``) are
+applied on every ``get_index()`` call. Without snapshots, the index is built
+from the database and periodically caught up with it instead
+(``products.catalog_sync``).
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EXACT_ENGINE = "exact"
+
+
+def l2_normalize(vector) -> Optional[np.ndarray]:
+    """Return ``vector`` as a flat, L2-normalized float32 array (None if empty/zero)."""
+    if vector is None:
+        return None
+    arr = np.asarray(vector, dtype=np.float32).reshape(-1)
+    if arr.size == 0:
+        return None
+    norm = float(np.linalg.norm(arr))
+    if not np.isfinite(norm) or norm == 0.0:
+        return None
+    return arr / norm
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` largest scores, best first."""
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+# name -> (dtype, value for rows without the attribute)
+ATTRIBUTES = {
+    "category": (np.int64, -1),
+    "seller": (np.int64, -1),
+    "price": (np.float64, np.nan),
+    "stock": (np.int64, 0),
+}
+
+
+def product_attributes(product) -> Dict[str, float]:
+    """Filterable attribute values of a ``Product`` instance."""
+    return {
+        "category": product.category_id if product.category_id is not None else -1,
+        "seller": product.seller_id if product.seller_id is not None else -1,
+        "price": float(product.price) if product.price is not None else np.nan,
+        "stock": product.stock or 0,
+    }
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    """Attribute constraints for a search; all given constraints must hold."""
+
+    categories: Tuple[int, ...] = ()
+    seller: Optional[int] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    in_stock: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.categories) or self.in_stock or any(
+            v is not None for v in (self.seller, self.min_price, self.max_price)
+        )
+
+    def mask(self, attrs: Dict[str, np.ndarray]) -> np.ndarray:
+        """Boolean mask over index rows that satisfy every constraint."""
+        n = attrs["category"].shape[0]
+        mask = np.ones(n, dtype=bool)
+        if self.categories:
+            mask &= np.isin(attrs["category"], np.asarray(self.categories, dtype=np.int64))
+        if self.seller is not None:
+            mask &= attrs["seller"] == self.seller
+        if self.min_price is not None:
+            mask &= attrs["price"] >= self.min_price
+        if self.max_price is not None:
+            mask &= attrs["price"] <= self.max_price
+        if self.in_stock:
+            mask &= attrs["stock"] > 0
+        return mask
+
+
+class EmbeddingIndex:
+    """In-memory matrix of normalized product embeddings.
+
+    Rows are appended on insert and updated in place; deletes only flip the
+    ``alive`` flag and the matrix is compacted once enough dead rows pile up.
+    ``generation`` changes whenever rows move so derived structures know to
+    rebuild, ``version`` changes on every mutation.
+    """
+
+    _INITIAL_CAPACITY = 1024
+    _COMPACT_MIN_DEAD = 1024
+
+    def __init__(self, dim: int):
+        self.dim = int(dim)
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._attrs = {name: np.zeros(0, dtype=dtype) for name, (dtype, _fill) in ATTRIBUTES.items()}
+        self._size = 0
+        self._dead = 0
+        self._rows: dict[int, int] = {}
+        self.generation = 0
+        self.version = 0
+        # Snapshot name when opened from disk; mapped arrays are never compacted
+        self.snapshot: Optional[str] = None
+        self._mapped = False
+        # Position in the delta log up to which changes have been applied
+        self.log_name: Optional[str] = None
+        self.log_offset = 0
+        self.delta_entries = 0
+        # (log name, offset) of lines this process wrote and already applied
+        self.own_log_lines: set = set()
+        # (row count, latest updated_at) of the products table as of the last
+        # database sync; None for snapshot-backed indexes
+        self.db_signature: Optional[tuple] = None
+        self._engines: dict = {}
+        self._engine_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the vector, id, liveness and attribute arrays (including spare capacity)."""
+        return (
+            self._vectors.nbytes + self._ids.nbytes + self._alive.nbytes
+            + sum(a.nbytes for a in self._attrs.values())
+        )
+
+    # ------------------------------------------------------------------ build
+    @classmethod
+    def from_items(cls, items: Iterable[tuple], dim: Optional[int] = None):
+        """Build an index from ``(product_id, embedding)`` or
+        ``(product_id, embedding, attributes)`` tuples.
+
+        Rows whose embedding is empty, zero or of a different dimension than
+        the first valid row are skipped.
+        """
+        ids: List[int] = []
+        vectors: List[np.ndarray] = []
+        attrs: Dict[str, list] = {name: [] for name in ATTRIBUTES}
+        for item in items:
+            pid, emb = item[0], item[1]
+            values = item[2] if len(item) > 2 else {}
+            vec = l2_normalize(emb)
+            if vec is None:
+                continue
+            if dim is None:
+                dim = vec.shape[0]
+            if vec.shape[0] != dim:
+                continue
+            ids.append(int(pid))
+            vectors.append(vec)
+            for name, (_dtype, fill) in ATTRIBUTES.items():
+                attrs[name].append(values.get(name, fill))
+
+        index = cls(dim or 0)
+        if vectors:
+            index._vectors = np.ascontiguousarray(np.vstack(vectors), dtype=np.float32)
+            index._ids = np.asarray(ids, dtype=np.int64)
+            index._alive = np.ones(len(ids), dtype=bool)
+            index._attrs = {
+                name: np.asarray(attrs[name], dtype=dtype) for name, (dtype, _fill) in ATTRIBUTES.items()
+            }
+            index._size = len(ids)
+            index._rows = {pid: row for row, pid in enumerate(ids)}
+        return index
+
+    @classmethod
+    def from_arrays(
+        cls,
+        vectors: np.ndarray,
+        ids: np.ndarray,
+        alive: np.ndarray,
+        attrs: Dict[str, np.ndarray],
+        size: int,
+        snapshot: Optional[str] = None,
+    ):
+        """Wrap prepared (e.g. memory-mapped) arrays without copying them.
+
+        Rows from ``size`` up to the array length are spare capacity that
+        ``upsert`` fills before it has to grow the arrays.
+        """
+        index = cls(vectors.shape[1])
+        index._vectors, index._ids, index._alive, index._attrs = vectors, ids, alive, attrs
+        index._size = int(size)
+        rows = np.flatnonzero(alive[:size])
+        index._rows = dict(zip(ids[rows].tolist(), rows.tolist()))
+        index._dead = int(size) - len(index._rows)
+        index.snapshot = snapshot
+        index._mapped = snapshot is not None
+        return index
+
+    @classmethod
+    def from_database(cls):
+        """Load every active product embedded with the current CLIP model."""
+        from .embeddings import current_model_name, unpack_embedding
+        from .models import Product
+
+        rows = (
+            Product.objects.filter(is_active=True, embedding_model=current_model_name())
+            .exclude(embedding__isnull=True)
+            .values_list("id", "embedding", "embedding_dim", "category_id", "seller_id", "price", "stock")
+        )
+        return cls.from_items(
+            (
+                pid,
+                unpack_embedding(blob, dim),
+                {
+                    "category": category if category is not None else -1,
+                    "seller": seller,
+                    "price": float(price),
+                    "stock": stock,
+                },
+            )
+            for pid, blob, dim, category, seller, price, stock in rows.iterator(chunk_size=2000)
+        )
+
+    # --------------------------------------------------------------- mutation
+    def upsert(self, product_id: int, embedding, attributes: Optional[Dict[str, float]] = None) -> bool:
+        """Insert or replace one product's vector (and filter attributes).
+
+        Returns False if the vector was rejected.
+        """
+        vec = l2_normalize(embedding)
+        product_id = int(product_id)
+        with self._lock:
+            if vec is None or (self.dim and vec.shape[0] != self.dim):
+                self.remove(product_id)
+                return False
+            if not self.dim:
+                self.dim = vec.shape[0]
+                self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+            row = self._rows.get(product_id)
+            if row is None:
+                row = self._append_row()
+                self._ids[row] = product_id
+                self._alive[row] = True
+                self._rows[product_id] = row
+                for name, (_dtype, fill) in ATTRIBUTES.items():
+                    self._attrs[name][row] = fill
+            self._vectors[row] = vec
+            if attributes:
+                self._set_attributes(row, attributes)
+            self.version += 1
+            return True
+
+    def set_attributes(self, product_id: int, attributes: Dict[str, float]) -> bool:
+        """Update filter attributes of an indexed product without touching its vector."""
+        with self._lock:
+            row = self._rows.get(int(product_id))
+            if row is None:
+                return False
+            self._set_attributes(row, attributes)
+            self.version += 1
+            return True
+
+    def _set_attributes(self, row: int, attributes: Dict[str, float]) -> None:
+        for name, value in attributes.items():
+            if name in self._attrs:
+                self._attrs[name][row] = value
+
+    def remove(self, product_id: int) -> None:
+        with self._lock:
+            row = self._rows.pop(int(product_id), None)
+            if row is None:
+                return
+            self._alive[row] = False
+            self._dead += 1
+            self.version += 1
+            # Compacting would copy mapped rows into private memory; the next snapshot drops them
+            if not self._mapped and self._dead >= self._COMPACT_MIN_DEAD and self._dead * 4 > self._size:
+                self._compact()
+
+    def _append_row(self) -> int:
+        if self._size == self._vectors.shape[0]:
+            capacity = max(self._INITIAL_CAPACITY, self._size * 2)
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            vectors[: self._size] = self._vectors[: self._size]
+            ids = np.zeros(capacity, dtype=np.int64)
+            ids[: self._size] = self._ids[: self._size]
+            alive = np.zeros(capacity, dtype=bool)
+            alive[: self._size] = self._alive[: self._size]
+            attrs = {}
+            for name, values in self._attrs.items():
+                attrs[name] = np.zeros(capacity, dtype=values.dtype)
+                attrs[name][: self._size] = values[: self._size]
+            # Swap in fresh arrays so readers holding the old views stay valid.
+            self._vectors, self._ids, self._alive, self._attrs = vectors, ids, alive, attrs
+        row = self._size
+        self._size += 1
+        return row
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self._alive[: self._size])
+        self._vectors = np.ascontiguousarray(self._vectors[keep])
+        self._ids = self._ids[keep].copy()
+        self._alive = np.ones(keep.shape[0], dtype=bool)
+        self._attrs = {name: values[keep].copy() for name, values in self._attrs.items()}
+        self._size = keep.shape[0]
+        self._dead = 0
+        self._rows = {int(pid): row for row, pid in enumerate(self._ids)}
+        self.generation += 1
+
+    # ----------------------------------------------------------------- search
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Consistent ``(vectors, ids, alive)`` views over the used rows."""
+        with self._lock:
+            n = self._size
+            return self._vectors[:n], self._ids[:n], self._alive[:n]
+
+    def attribute_arrays(self) -> Dict[str, np.ndarray]:
+        """Views of the filter attribute arrays over the used rows (parallel to ``arrays()``)."""
+        with self._lock:
+            n = self._size
+            return {name: values[:n] for name, values in self._attrs.items()}
+
+    def vector(self, product_id: int) -> Optional[np.ndarray]:
+        """Copy of the indexed (normalized) vector of ``product_id``, or None."""
+        with self._lock:
+            row = self._rows.get(int(product_id))
+            return None if row is None else self._vectors[row].copy()
+
+    def allowed_rows(self, filters: Optional[SearchFilters] = None) -> np.ndarray:
+        """Mask of live rows that pass ``filters``."""
+        with self._lock:
+            n = self._size
+            alive = self._alive[:n]
+            attrs = {name: values[:n] for name, values in self._attrs.items()}
+        if not filters:
+            return alive.copy()
+        return alive & filters.mask(attrs)
+
+    def search(
+        self,
+        query,
+        k: int = 50,
+        engine: Optional[str] = None,
+        filters: Optional[SearchFilters] = None,
+        **params,
+    ) -> List[Tuple[int, float]]:
+        """Return up to ``k`` ``(product_id, cosine_similarity)`` pairs, best first.
+
+        ``engine`` defaults to ``PRODUCT_SEARCH_ENGINE``; extra ``params`` (e.g.
+        ``nprobe``) are passed to the approximate engine. With ``filters`` only
+        matching rows are scored; selective filters (few matching rows) use an
+        exact scan of just those rows, since probing a few IVF lists could
+        miss them.
+        """
+        q = l2_normalize(query)
+        if q is None or q.shape[0] != self.dim:
+            return []
+        mask = self.allowed_rows(filters) if filters else None
+        if mask is not None:
+            allowed = int(np.count_nonzero(mask))
+            if allowed == 0:
+                return []
+            if allowed <= max(k, getattr(settings, "PRODUCT_SEARCH_FILTER_EXACT_ROWS", 20000)):
+                return self._search_rows(q, k, np.flatnonzero(mask))
+        engine = engine or default_engine()
+        if engine != EXACT_ENGINE:
+            searcher = self._engine(engine)
+            if searcher is not None:
+                return searcher.search(self, q, k, mask=mask, **params)
+        return self._search_exact(q, k, mask)
+
+    def _search_exact(self, q: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        vectors, ids, alive = self.arrays()
+        if mask is not None:
+            # Rows appended after the mask was taken are left out
+            vectors, alive = vectors[: mask.shape[0]], mask[: vectors.shape[0]]
+        if vectors.shape[0] == 0:
+            return []
+        scores = vectors @ q
+        scores[~alive] = -np.inf
+        best = top_k(scores, k)
+        return [(int(ids[i]), float(scores[i])) for i in best if np.isfinite(scores[i])]
+
+    def _search_rows(self, q: np.ndarray, k: int, rows: np.ndarray) -> List[Tuple[int, float]]:
+        """Exact scores over a subset of rows (gathered, then one matvec)."""
+        vectors, ids, _alive = self.arrays()
+        rows = rows[rows < vectors.shape[0]]
+        scores = vectors[rows] @ q
+        best = top_k(scores, k)
+        return [(int(ids[rows[i]]), float(scores[i])) for i in best]
+
+    def scores_for(self, query, product_ids: Sequence[int], filters: Optional[SearchFilters] = None) -> np.ndarray:
+        """Cosine similarity of ``query`` to each of ``product_ids``.
+
+        NaN for products that are not indexed or fail ``filters``. Only the
+        requested rows are scored, e.g. lexical candidates in hybrid search.
+        """
+        out = np.full(len(product_ids), np.nan, dtype=np.float32)
+        q = l2_normalize(query)
+        if q is None or q.shape[0] != self.dim:
+            return out
+        mask = self.allowed_rows(filters) if filters else None
+        with self._lock:
+            rows = [self._rows.get(int(pid), -1) for pid in product_ids]
+            vectors = self._vectors[: self._size]
+        rows = np.asarray(rows, dtype=np.int64)
+        found = rows >= 0
+        if mask is not None:
+            found[found] = mask[rows[found]]
+        if found.any():
+            out[found] = vectors[rows[found]] @ q
+        return out
+
+    def _engine(self, name: str):
+        """Return an up-to-date approximate engine, or None to fall back to exact.
+
+        Small indexes always use the exact scan. While one thread (re)builds an
+        engine, concurrent searches use the exact scan instead of waiting.
+        """
+        from .ann import ENGINES
+
+        engine_cls = ENGINES.get(name)
+        if engine_cls is None:
+            raise ValueError(f"Unknown search engine: {name}")
+        if self._size < getattr(settings, "PRODUCT_SEARCH_ANN_MIN_ROWS", 5000):
+            return None
+
+        current = self._engines.get(name)
+        if current is not None and not current.is_stale(self):
+            return current
+        if not self._engine_lock.acquire(blocking=False):
+            return None
+        try:
+            current = self._engines.get(name)
+            if current is None or current.is_stale(self):
+                current = engine_cls.build(self)
+                self._engines[name] = current
+            return current
+        finally:
+            self._engine_lock.release()
+
+
+def available_engines() -> List[str]:
+    from .ann import ENGINES
+
+    return [EXACT_ENGINE, *ENGINES]
+
+
+def default_engine() -> str:
+    return getattr(settings, "PRODUCT_SEARCH_ENGINE", EXACT_ENGINE)
+
+
+_index: Optional[EmbeddingIndex] = None
+_index_lock = threading.Lock()
+_refresh_checked = 0.0
+_refreshing = False
+
+
+def _load_index() -> EmbeddingIndex:
+    from .catalog_sync import signature
+    from .delta_log import apply_pending
+    from .index_snapshot import open_current
+
+    index = open_current()
+    if index is None:
+        # Taken first: changes saved while the rows are read are synced later
+        db_signature = signature()
+        index = EmbeddingIndex.from_database()
+        index.db_signature = db_signature
+        return index
+    apply_pending(index, wait=True)
+    return index
+
+
+def get_index() -> EmbeddingIndex:
+    """Return the shared index, building it on first use.
+
+    It is opened from the current snapshot when snapshots are configured,
+    otherwise built from the database (and synced with it, see ``_check_refresh``).
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _load_index()
+    else:
+        from .delta_log import apply_pending
+
+        _check_refresh(_index)
+        apply_pending(_index)
+    return _index
+
+
+def _check_refresh(index: EmbeddingIndex) -> None:
+    """Every ``SEARCH_INDEX_CHECK_INTERVAL`` seconds, look for changes made elsewhere.
+
+    With snapshots, a newer published snapshot is opened on a background
+    thread and swapped in; without, the index is synced with the database on
+    a background thread. Searches keep using the index meanwhile.
+    """
+    global _refresh_checked
+    from .index_snapshot import current_name, enabled
+
+    now = time.monotonic()
+    if _refreshing or now - _refresh_checked < getattr(settings, "SEARCH_INDEX_CHECK_INTERVAL", 5):
+        return
+    _refresh_checked = now
+    if not enabled():
+        if index.db_signature is not None:
+            _start_refresh(_sync_database, index, "index-database-sync")
+        return
+    name = current_name()
+    if name is None or name == index.snapshot:
+        return
+    _start_refresh(_swap_snapshot, None, "index-snapshot-swap")
+
+
+def _start_refresh(target, index, name: str) -> None:
+    global _refreshing
+    with _index_lock:
+        if _refreshing:
+            return
+        _refreshing = True
+    threading.Thread(target=target, args=(index,) if index is not None else (), name=name, daemon=True).start()
+
+
+def _sync_database(index: EmbeddingIndex) -> None:
+    global _refreshing
+    from django.db import connection
+
+    from .catalog_sync import sync_index
+
+    try:
+        sync_index(index)
+    except Exception:
+        logger.exception("Could not sync the search index with the database")
+    finally:
+        connection.close()
+        _refreshing = False
+
+
+def _swap_snapshot() -> None:
+    global _index, _refreshing
+    from .delta_log import apply_pending
+    from .index_snapshot import open_current
+    from .search_cache import bump_catalog_version
+
+    try:
+        index = open_current()
+        if index is not None:
+            # Catch up with the log before serving from it
+            apply_pending(index, wait=True)
+            with _index_lock:
+                _index = index
+            # The new snapshot may rank differently from what the result cache holds
+            bump_catalog_version()
+    except Exception:
+        logger.exception("Could not open the search index snapshot")
+    finally:
+        _refreshing = False
+
+
+def peek_index() -> Optional[EmbeddingIndex]:
+    """Return the shared index only if it has already been built."""
+    return _index
+
+
+def reset_index() -> None:
+    """Drop the shared index; the next search rebuilds it."""
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,159 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import delta_log, embedding_queue, similar
+from .embeddings import current_model_name
+from .lexical import peek_lexical_index
+from .models import DuplicateCluster, Product
+from .search_cache import bump_catalog_version, bump_duplicates_version
+from .search_index import product_attributes
+
+
+IMAGE_FIELDS = ('image', 'image_url')
+# Saves touching any of these may add, replace or drop the indexed vector
+VECTOR_FIELDS = (*Product.EMBEDDING_FIELDS, 'is_active')
+# Fields that show up in search results or filters
+SEARCH_FIELDS = ('is_active', 'price', 'stock', 'category', 'seller', 'name', 'description')
+
+
+def _search_state(product):
+    return (
+        product.is_active, product.price, product.stock, product.category_id,
+        product.seller_id, product.name, product.description,
+    )
+
+
+def _image_source(product):
+    return (product.image.name if product.image else '', (product.image_url or '').strip())
+
+
+# Column names of _search_state(), in order
+_SEARCH_COLUMNS = ('is_active', 'price', 'stock', 'category_id', 'seller_id', 'name', 'description')
+
+
+def _loaded_state(instance):
+    """``(image source, search state)`` of the row as last loaded or saved, or
+    None when the instance does not carry those values (e.g. loaded with only())."""
+    loaded = getattr(instance, '_loaded_values', None)
+    if not loaded or any(name not in loaded for name in (*IMAGE_FIELDS, *_SEARCH_COLUMNS)):
+        return None
+    image = (loaded['image'] or '', (loaded['image_url'] or '').strip())
+    return image, tuple(loaded[name] for name in _SEARCH_COLUMNS)
+
+
+@receiver(pre_save, sender=Product)
+def store_previous_image(sender, instance, update_fields=None, **kwargs):
+    """Cache the previous image source (and, on full saves, the search-relevant
+    fields) so the post_save handlers can tell what changed."""
+    instance._previous_search_state = None  # type: ignore[attr-defined]
+    if update_fields is not None and not set(update_fields) & set(IMAGE_FIELDS):
+        instance._previous_image = _image_source(instance)  # type: ignore[attr-defined]
+        return
+    if not instance.pk:
+        instance._previous_image = None  # type: ignore[attr-defined]
+        return
+    loaded = _loaded_state(instance)
+    if loaded is not None:
+        instance._previous_image, instance._previous_search_state = loaded  # type: ignore[attr-defined]
+        return
+    # Not loaded from the database with these columns: read them
+    previous = sender.objects.filter(pk=instance.pk).only(*IMAGE_FIELDS, *SEARCH_FIELDS).first()
+    instance._previous_image = _image_source(previous) if previous else None  # type: ignore[attr-defined]
+    if previous is not None:
+        instance._previous_search_state = _search_state(previous)  # type: ignore[attr-defined]
+
+
+@receiver(post_save, sender=Product)
+def bump_catalog_version_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """Invalidate cached search results when the product's ranking or listed fields moved."""
+    if created:
+        changed = True
+    elif update_fields is not None:
+        changed = bool(set(update_fields) & {*SEARCH_FIELDS, *VECTOR_FIELDS})
+    else:
+        previous = getattr(instance, '_previous_search_state', None)
+        # The image URL is part of the serialized results too
+        changed = previous is None or previous != _search_state(instance) or bool(
+            getattr(instance, '_previous_image', None) != _image_source(instance)
+        )
+    if changed:
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+def enqueue_embedding_on_image_change(sender, instance, created, **kwargs):
+    """Embed new/changed images on the background worker, after commit."""
+    if not embedding_queue.enabled():
+        return
+    current = _image_source(instance)
+    if created:
+        if not any(current):
+            return
+    elif getattr(instance, '_previous_image', None) == current:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: embedding_queue.embedding_queue.enqueue(pk))
+
+
+@receiver(post_save, sender=Product)
+def sync_search_index_on_save(sender, instance, update_fields=None, **kwargs):
+    """Keep the embedding index in step with the saved product.
+
+    Applied to this process's index and, with snapshots enabled, logged for
+    the other workers once the transaction commits.
+    """
+    if update_fields is not None and not set(update_fields) & set(VECTOR_FIELDS):
+        # e.g. a stock decrement at checkout: only the filter attributes moved
+        delta_log.record_attributes(instance.pk, product_attributes(instance))
+        return
+    vector = instance.embedding_vector
+    if instance.is_active and vector is not None and instance.embedding_model == current_model_name():
+        delta_log.record_upsert(instance.pk, vector, product_attributes(instance))
+    else:
+        delta_log.record_remove(instance.pk, 'delete' if instance.is_active else 'deactivate')
+
+
+@receiver(post_save, sender=Product)
+def enqueue_similar_on_vector_change(sender, instance, created, update_fields=None, **kwargs):
+    """Patch the "similar products" graph once the product's vector or activation changed."""
+    if created or not similar.enabled():
+        return
+    if update_fields is not None:
+        changed = bool(set(update_fields) & set(VECTOR_FIELDS))
+    else:
+        previous = getattr(instance, '_previous_search_state', None)
+        changed = previous is None or previous[0] != instance.is_active
+    if changed:
+        pk = instance.pk
+        transaction.on_commit(lambda: similar.queue_update(pk))
+
+
+@receiver(post_save, sender=Product)
+def sync_lexical_index_on_save(sender, instance, update_fields=None, **kwargs):
+    index = peek_lexical_index()
+    if index is None:
+        return
+    if update_fields is not None and not set(update_fields) & {'name', 'description', 'is_active'}:
+        return
+    if instance.is_active:
+        index.upsert(instance.pk, instance.name, instance.description)
+    else:
+        index.remove(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def sync_search_index_on_delete(sender, instance, **kwargs):
+    delta_log.record_remove(instance.pk)
+    lexical = peek_lexical_index()
+    if lexical is not None:
+        lexical.remove(instance.pk)
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=DuplicateCluster)
+@receiver(post_delete, sender=DuplicateCluster)
+def bump_catalog_version_on_review(sender, **kwargs):
+    # Reviews change which results are collapsed; cached result pages and the cluster map must go
+    bump_catalog_version()
+    bump_duplicates_version()
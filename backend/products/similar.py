@@ -0,0 +1,191 @@
+"""Precomputed "similar products" kNN graph stored in ``SimilarProduct``.
+
+``build_similar_products`` scores the embedding index against itself in
+blocks of query rows, so only a ``block_rows x N`` score matrix exists at a
+time (sized from ``PRODUCT_SIMILAR_BLOCK_BYTES``), keeps each row's top-N
+with ``argpartition`` and rewrites that block's edges.
+
+``update_similar`` keeps the graph current between batch runs. It runs on a
+background queue after a product's vector changes: the product's own list
+is recomputed with one matrix-vector product, and the lists of nearby
+products (plus those that already pointed at it) are patched with its new
+score. A product that left the index loses its list and incoming edges, and
+the affected lists are recomputed.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .embedding_queue import ProductJobQueue
+from .models import SimilarProduct
+from .search_index import EmbeddingIndex, get_index
+
+Edges = Dict[int, List[Tuple[int, float]]]
+
+
+def similar_count() -> int:
+    return int(getattr(settings, "PRODUCT_SIMILAR_COUNT", 20))
+
+
+def enabled() -> bool:
+    return getattr(settings, "PRODUCT_SIMILAR_ON_SAVE", True)
+
+
+def store_edges(edges: Edges) -> None:
+    """Replace the neighbour lists of the products in ``edges``."""
+    if not edges:
+        return
+    rows = [
+        SimilarProduct(product_id=pid, neighbor_id=nid, rank=rank, score=score)
+        for pid, neighbors in edges.items()
+        for rank, (nid, score) in enumerate(neighbors)
+    ]
+    with transaction.atomic():
+        SimilarProduct.objects.filter(product_id__in=list(edges)).delete()
+        SimilarProduct.objects.bulk_create(rows, batch_size=2000)
+
+
+def _block_rows(n_rows: int) -> int:
+    budget = getattr(settings, "PRODUCT_SIMILAR_BLOCK_BYTES", 256 * 1024 * 1024)
+    return max(1, min(n_rows, budget // (4 * max(1, n_rows))))
+
+
+def compute_neighbors(index: EmbeddingIndex, rows: np.ndarray, count: int) -> Edges:
+    """Top ``count`` live neighbours (excluding itself) for each index row in ``rows``."""
+    vectors, ids, alive = index.arrays()
+    scores = vectors[rows] @ vectors.T
+    scores[:, ~alive] = -np.inf
+    scores[np.arange(rows.shape[0]), rows] = -np.inf
+    n = min(count, max(0, vectors.shape[0] - 1))
+    if n == 0:
+        return {int(ids[r]): [] for r in rows}
+    if n < scores.shape[1]:
+        best = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    else:
+        best = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    best = np.take_along_axis(best, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    edges: Edges = {}
+    for i, row in enumerate(rows):
+        finite = np.isfinite(best_scores[i])
+        edges[int(ids[row])] = [(int(ids[c]), float(s)) for c, s in zip(best[i][finite], best_scores[i][finite])]
+    return edges
+
+
+def build_similar_products(
+    count: Optional[int] = None,
+    block_rows: Optional[int] = None,
+    log: Callable[[str], None] = lambda _msg: None,
+) -> int:
+    """Recompute the whole graph from the embedding index. Returns the number of products."""
+    count = count or similar_count()
+    index = get_index()
+    _vectors, _ids, alive = index.arrays()
+    live = np.flatnonzero(alive)
+    block = block_rows or _block_rows(alive.shape[0])
+    for start in range(0, live.shape[0], block):
+        store_edges(compute_neighbors(index, live[start:start + block], count))
+        log(f"{min(start + block, live.shape[0])}/{live.shape[0]}")
+    # Products that left the index since the last build
+    SimilarProduct.objects.filter(
+        Q(product__is_active=False) | Q(product__embedding__isnull=True)
+    ).delete()
+    return int(live.shape[0])
+
+
+def _patched(current: List[Tuple[int, float]], product_id: int, score: Optional[float], count: int):
+    """``current`` without ``product_id``, then with it re-inserted if ``score`` still makes the cut."""
+    neighbors = [(nid, s) for nid, s in current if nid != product_id]
+    if score is not None and (len(neighbors) < count or score > neighbors[-1][1]):
+        neighbors.append((product_id, score))
+        neighbors.sort(key=lambda edge: -edge[1])
+    return neighbors[:count]
+
+
+def _current_lists(product_ids: Iterable[int]) -> Edges:
+    lists: Edges = defaultdict(list)
+    rows = (
+        SimilarProduct.objects.filter(product_id__in=list(product_ids))
+        .order_by("product_id", "rank")
+        .values_list("product_id", "neighbor_id", "score")
+    )
+    for pid, nid, score in rows:
+        lists[pid].append((nid, score))
+    return lists
+
+
+def update_similar(product_id: int) -> None:
+    """Bring the graph in line with the current index entry of one product."""
+    index = get_index()
+    count = similar_count()
+    incoming = set(
+        SimilarProduct.objects.filter(neighbor_id=product_id).values_list("product_id", flat=True)
+    )
+    vector = index.vector(product_id)
+
+    if vector is None:
+        SimilarProduct.objects.filter(Q(product_id=product_id) | Q(neighbor_id=product_id)).delete()
+        _vectors, ids, _alive = index.arrays()
+        rows = np.flatnonzero(np.isin(ids, np.fromiter(incoming, dtype=np.int64, count=len(incoming))))
+        live = rows[index.allowed_rows()[rows]]
+        if live.size:
+            store_edges(compute_neighbors(index, live, count))
+        return
+
+    # Products close to this one are the ones whose lists it may enter
+    hits = [(pid, s) for pid, s in index.search(vector, count * 4 + 1, engine="exact") if pid != product_id]
+    edges: Edges = {product_id: hits[:count]}
+    affected = sorted({pid for pid, _ in hits} | incoming)
+    if affected:
+        scores = index.scores_for(vector, affected)
+        current = _current_lists(affected)
+        for pid, score in zip(affected, scores):
+            if pid not in current:
+                # No list yet; it is computed when that product itself is updated
+                continue
+            score = float(score) if np.isfinite(score) else None
+            patched = _patched(current[pid], product_id, score, count)
+            if patched != current[pid]:
+                edges[pid] = patched
+    store_edges(edges)
+
+
+similar_queue = ProductJobQueue(update_similar, "similar-products")
+
+# Products queued because their list was read while empty. A read does not
+# queue them again until their vector changes, so a list that stays empty
+# (e.g. the product has no neighbours yet) costs one update, not one per GET.
+_READ_REQUESTS_MAX = 100_000
+_read_requests: "OrderedDict[int, None]" = OrderedDict()
+_read_lock = threading.Lock()
+
+
+def queue_update(product_id: int) -> None:
+    """Queue a graph update after the product's vector or activation changed."""
+    with _read_lock:
+        _read_requests.pop(product_id, None)
+    similar_queue.enqueue(product_id)
+
+
+def queue_update_for_read(product_id: int) -> None:
+    """Queue a graph update for a product whose list was read before it existed.
+
+    Does nothing with ``PRODUCT_SIMILAR_ON_SAVE`` off or if a read already
+    queued the product since its last vector change.
+    """
+    if not enabled():
+        return
+    with _read_lock:
+        if product_id in _read_requests:
+            return
+        _read_requests[product_id] = None
+        if len(_read_requests) > _READ_REQUESTS_MAX:
+            _read_requests.popitem(last=False)
+    similar_queue.enqueue(product_id)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from django.contrib.auth import get_user_model
+
+from products import lexical, search_index
+from products.models import Product
+from products.search_cache import image_embedding_cache, search_result_cache, text_embedding_cache
+
+
+@pytest.fixture(autouse=True)
+def search_state(settings):
+    """Every test starts without a loaded index, snapshots or cached embeddings."""
+    settings.SEARCH_INDEX_SNAPSHOT_DIR = None
+    settings.PRODUCT_EMBED_ON_SAVE = False
+    settings.PRODUCT_SIMILAR_ON_SAVE = False
+
+    def reset():
+        search_index.reset_index()
+        lexical.reset_lexical_index()
+        for cache in (text_embedding_cache, image_embedding_cache, search_result_cache):
+            cache.clear()
+
+    reset()
+    yield
+    reset()
+
+
+@pytest.fixture
+def seller(db):
+    return get_user_model().objects.create(username="seller", email="seller@example.com")
+
+
+@pytest.fixture
+def make_product(seller):
+    def make(name, vector=None, **fields):
+        fields.setdefault("price", 1000)
+        fields.setdefault("stock", 1)
+        product = Product(seller=seller, name=name, **fields)
+        if vector is not None:
+            product.set_embedding(np.asarray(vector, dtype=np.float32).tolist())
+        product.save()
+        return product
+
+    return make
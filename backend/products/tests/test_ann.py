@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from products.ann import Int8Index, IVFIndex
+from products.benchmark import query_vectors, synthetic_index
+from products.search_index import SearchFilters
+
+ENGINES = ["ivf", "int8"]
+
+
+@pytest.fixture
+def index(settings):
+    settings.PRODUCT_SEARCH_ANN_MIN_ROWS = 1000
+    # Send filtered searches to the approximate engines instead of the exact scan
+    settings.PRODUCT_SEARCH_FILTER_EXACT_ROWS = 0
+    return synthetic_index(3000, dim=32)
+
+
+@pytest.fixture
+def query(index):
+    return query_vectors(index, 1)[0]
+
+
+def _rows(index, hits):
+    return [index._rows[pid] for pid, _score in hits]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engine_finds_the_exact_nearest_neighbour(index, query, engine):
+    exact = index.search(query, 1, engine="exact")
+    approx = index.search(query, 10, engine=engine)
+
+    assert index._engines.get(engine) is not None
+    assert exact[0][0] in [pid for pid, _score in approx]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_filtered_search_only_returns_matching_rows(index, query, engine):
+    filters = SearchFilters(categories=(3, 7), in_stock=True)
+
+    hits = index.search(query, 20, engine=engine, filters=filters)
+
+    attrs = index.attribute_arrays()
+    rows = _rows(index, hits)
+    assert hits
+    assert set(attrs["category"][rows].tolist()) <= {3, 7}
+    assert (attrs["stock"][rows] > 0).all()
+
+
+def test_selective_filters_use_an_exact_scan_of_the_matching_rows(index, query, settings):
+    settings.PRODUCT_SEARCH_FILTER_EXACT_ROWS = 20000
+    filters = SearchFilters(categories=(3,))
+
+    assert index.search(query, 10, engine="ivf", filters=filters) == index.search(
+        query, 10, engine="exact", filters=filters
+    )
+    assert "ivf" not in index._engines
+
+
+@pytest.mark.parametrize("engine_cls", [IVFIndex, Int8Index])
+def test_mask_shorter_than_the_engine_leaves_the_other_rows_out(index, query, engine_cls):
+    engine = engine_cls.build(index)
+    mask = np.ones(engine.built_size - 500, dtype=bool)
+
+    hits = engine.search(index, query, 20, mask=mask)
+
+    assert hits
+    assert max(_rows(index, hits)) < mask.shape[0]
+
+
+def test_int8_codes_take_a_quarter_of_the_float_rows(index, query):
+    engine = Int8Index.build(index)
+    vectors, _ids, _alive = index.arrays()
+
+    assert engine.codes.nbytes * 4 == vectors.nbytes
+    approx = engine.approximate_scores(query)
+    np.testing.assert_allclose(approx, vectors @ query, atol=0.02)
+
+
+def test_small_indexes_use_the_exact_scan(index, query, settings):
+    settings.PRODUCT_SEARCH_ANN_MIN_ROWS = 5000
+
+    assert index.search(query, 5, engine="ivf") == index.search(query, 5, engine="exact")
+    assert "ivf" not in index._engines
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_rows_added_after_the_build_are_searched(index, query, engine):
+    index.search(query, 1, engine=engine)
+    index.upsert(999_999, query, {"category": 3, "seller": 1, "price": 1.0, "stock": 1})
+
+    assert not index._engines[engine].is_stale(index)
+    assert index.search(query, 1, engine=engine)[0][0] == 999_999
+    filtered = index.search(query, 1, engine=engine, filters=SearchFilters(categories=(3,)))
+    assert filtered[0][0] == 999_999
+
+
+@pytest.mark.parametrize("engine_cls", [IVFIndex, Int8Index])
+def test_engine_is_stale_once_the_index_has_fewer_rows(index, engine_cls):
+    engine = engine_cls.build(index)
+    engine.built_size += 10
+
+    assert engine.is_stale(index)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_removed_products_are_not_returned(index, query, engine):
+    best = index.search(query, 1, engine=engine)[0][0]
+    index.remove(best)
+
+    assert best not in [pid for pid, _score in index.search(query, 20, engine=engine)]
+
+
+def test_unknown_engine_is_rejected(index, query):
+    with pytest.raises(ValueError):
+        index.search(query, 5, engine="hnsw")
@@ -0,0 +1,80 @@
+import asyncio
+import io
+
+import pytest
+from django.test import AsyncClient
+from PIL import Image
+
+import clip_service
+from products.benchmark import synthetic_embeddings
+
+# The views reach the database from sync_to_async threads
+pytestmark = pytest.mark.django_db(transaction=True)
+
+VECTORS = synthetic_embeddings(3, dim=16, clusters=3)
+
+
+@pytest.fixture
+def catalog(make_product):
+    return [make_product(f"Áo {i}", vector) for i, vector in enumerate(VECTORS)]
+
+
+@pytest.fixture
+def clip(monkeypatch):
+    monkeypatch.setattr(clip_service, "is_loaded", lambda: True)
+    monkeypatch.setattr(clip_service, "get_text_embedding", lambda _text: VECTORS[1].tolist())
+    monkeypatch.setattr(clip_service, "get_image_embeddings", lambda images: [VECTORS[2].tolist() for _ in images])
+
+
+@pytest.fixture
+def jpeg():
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), "red").save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def _ids(response):
+    return [item["id"] for item in response.json()["results"]]
+
+
+def test_async_text_search_ranks_the_catalog(catalog, clip):
+    response = asyncio.run(AsyncClient().get("/api/search/text/async/", {"q": "áo", "k": 2}))
+
+    assert response.status_code == 200
+    assert response.json()["degraded"] is False
+    assert _ids(response)[0] == catalog[1].id
+
+
+def test_async_text_search_needs_a_query(clip):
+    response = asyncio.run(AsyncClient().get("/api/search/text/async/"))
+
+    assert response.status_code == 400
+
+
+def test_async_image_search_ranks_the_upload(catalog, clip, jpeg):
+    upload = io.BytesIO(jpeg)
+    upload.name = "query.jpg"
+
+    response = asyncio.run(AsyncClient().post("/api/search/image/async/?k=1", {"file": upload}))
+
+    assert response.status_code == 200
+    assert _ids(response) == [catalog[2].id]
+
+
+def test_async_image_search_needs_a_file(clip):
+    response = asyncio.run(AsyncClient().post("/api/search/image/async/", {}))
+
+    assert response.status_code == 400
+
+
+def test_async_image_search_rejects_bodies_it_cannot_parse(clip):
+    client = AsyncClient()
+
+    wrong_type = asyncio.run(client.post("/api/search/image/async/", {"file": "x"}, content_type="application/json"))
+    malformed = asyncio.run(
+        client.post("/api/search/image/async/", b"--nope", content_type="multipart/form-data; boundary=")
+    )
+
+    assert wrong_type.status_code == 415
+    assert "error" in wrong_type.json()
+    assert malformed.status_code == 400
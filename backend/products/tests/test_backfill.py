@@ -0,0 +1,110 @@
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import clip_service
+from products import backfill
+from products.backfill import BackfillState, EmbeddingBackfill
+from products.embeddings import current_model_name
+from products.models import Product
+from products.search_index import get_index
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def images(monkeypatch):
+    """Product images are 8x8 squares whose grey level is in the image URL."""
+
+    def open_image(product):
+        if not product.image_url:
+            raise FileNotFoundError(product.pk)
+        return Image.new("L", (8, 8), int(product.image_url.rsplit("/", 1)[1]))
+
+    monkeypatch.setattr(backfill, "open_product_image", open_image)
+
+
+@pytest.fixture
+def clip(monkeypatch):
+    batches = []
+
+    def embed(images):
+        levels = [img.getpixel((0, 0)) for img in images]
+        batches.append(levels)
+        if 13 in levels:
+            raise ValueError("bad image")
+        return [[1.0, float(level), 0.0] for level in levels]
+
+    monkeypatch.setattr(clip_service, "get_image_embeddings", embed)
+    return batches
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return tmp_path / "backfill.json"
+
+
+def _backfill(checkpoint, **options):
+    options.setdefault("batch_size", 2)
+    options.setdefault("workers", 2)
+    return EmbeddingBackfill(checkpoint=checkpoint, log=lambda _line: None, **options)
+
+
+def _level(product):
+    vector = Product.objects.get(pk=product.pk).embedding_vector
+    return None if vector is None else float(vector[1])
+
+
+def test_missing_and_stale_embeddings_are_filled_in_batches(
+    make_product, images, clip, checkpoint, django_capture_on_commit_callbacks
+):
+    done = make_product("done", [1, 99, 0], image_url="http://img/99")
+    stale = make_product("stale", [1, 1, 0], image_url="http://img/20")
+    Product.objects.filter(pk=stale.pk).update(embedding_model="some/other-model")
+    missing = [make_product(f"p{level}", image_url=f"http://img/{level}") for level in (30, 40, 50)]
+    index = get_index()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        state = _backfill(checkpoint).run()
+
+    assert clip == [[20, 30], [40, 50]]
+    assert (state.processed, state.updated, state.skipped, state.errors) == (4, 4, 0, 0)
+    assert [_level(p) for p in (done, stale, *missing)] == [99, 20, 30, 40, 50]
+    assert Product.objects.get(pk=stale.pk).embedding_model == current_model_name()
+    # Written with bulk_update, so the index is updated by hand once committed
+    np.testing.assert_allclose(index.vector(missing[0].pk)[1], 30 / np.hypot(1, 30), rtol=1e-5)
+    assert not checkpoint.exists()
+
+
+def test_an_interrupted_run_resumes_after_the_checkpoint(make_product, images, clip, checkpoint):
+    first, second = (make_product(f"p{level}", image_url=f"http://img/{level}") for level in (10, 20))
+    BackfillState(model=current_model_name(), only_missing=True, last_id=first.pk, processed=1).save(checkpoint)
+
+    state = _backfill(checkpoint).run()
+
+    assert clip == [[20]]
+    assert state.processed == 2
+    assert (_level(first), _level(second)) == (None, 20)
+
+
+def test_a_checkpoint_of_another_model_is_ignored(make_product, images, clip, checkpoint):
+    first = make_product("p10", image_url="http://img/10")
+    checkpoint.write_text(json.dumps({"model": "some/other-model", "only_missing": True, "last_id": first.pk}))
+
+    _backfill(checkpoint).run()
+
+    assert _level(first) == 10
+
+
+def test_a_bad_image_fails_alone(make_product, images, clip, checkpoint):
+    good = make_product("good", image_url="http://img/10")
+    bad = make_product("bad", image_url="http://img/13")
+    unreadable = make_product("no image")
+
+    state = _backfill(checkpoint, batch_size=3).run()
+
+    assert clip == [[10, 13], [10], [13]]
+    assert (state.updated, state.skipped, state.errors, state.failed_ids) == (1, 1, 1, [bad.pk])
+    assert (_level(good), _level(bad), _level(unreadable)) == (10, None, None)
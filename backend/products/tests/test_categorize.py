@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+import clip_service
+from products.categorize import categorize_products, classify
+from products.models import Category, Product
+from products.search_index import get_index
+
+pytestmark = pytest.mark.django_db
+
+# Prompts reach CLIP normalized (case-folded) by the text embedding cache
+PROMPTS = {
+    "a photo of áo": [1.0, 0.0, 0.0],
+    "a photo of giày": [0.0, 1.0, 0.0],
+    "a photo of uncategorized": [0.0, 0.0, 1.0],
+}
+
+
+@pytest.fixture
+def clip(monkeypatch):
+    monkeypatch.setattr(clip_service, "get_text_embedding", lambda text: PROMPTS[text])
+
+
+@pytest.fixture
+def categories(db):
+    return {name: Category.objects.create(name=name) for name in ("Áo", "Giày", "Uncategorized")}
+
+
+@pytest.fixture
+def products(make_product, categories):
+    return {
+        "shirt": make_product("shirt", [0.9, 0.1, 0.0]),
+        "shoe": make_product("shoe", [0.1, 0.9, 0.3], category=categories["Uncategorized"]),
+        "unsure": make_product("unsure", [1.0, 1.0, 0.0]),
+        "filed": make_product("filed", [0.0, 1.0, 0.0], category=categories["Áo"]),
+    }
+
+
+def _category(product):
+    category = Product.objects.get(pk=product.pk).category
+    return category.name if category else None
+
+
+def test_classify_returns_the_best_prototype_and_its_probability():
+    prototypes = np.eye(2, dtype=np.float32)
+
+    best, confidence = classify(np.asarray([[1.0, 0.0], [0.70, 0.71]], dtype=np.float32), prototypes)
+
+    assert best.tolist() == [0, 1]
+    assert confidence[0] > 0.99
+    assert 0.5 < confidence[1] < 1.0
+
+
+def test_confident_predictions_are_assigned(clip, products, categories, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        predictions = categorize_products(method="prompt", threshold=0.9)
+
+    assigned = {p.product_id: p.assigned for p in predictions}
+    assert assigned == {products["shirt"].pk: True, products["shoe"].pk: True, products["unsure"].pk: False}
+    assert [_category(products[name]) for name in ("shirt", "shoe", "unsure", "filed")] == [
+        "Áo", "Giày", None, "Áo",
+    ]
+    # The search filters see the new category without a rebuild
+    index = get_index()
+    row = index._rows[products["shirt"].pk]
+    assert index.attribute_arrays()["category"][row] == categories["Áo"].pk
+
+
+def test_the_placeholder_category_is_never_predicted(clip, products, categories):
+    predictions = categorize_products(method="prompt", threshold=0.0)
+
+    assert categories["Uncategorized"].pk not in {p.category_id for p in predictions}
+
+
+def test_dry_run_writes_nothing(clip, products):
+    predictions = categorize_products(method="prompt", threshold=0.9, dry_run=True)
+
+    assert any(p.assigned for p in predictions)
+    assert _category(products["shirt"]) is None
+
+
+def test_centroids_of_categorized_products_are_prototypes(make_product, categories, settings):
+    settings.PRODUCT_CATEGORIZE_MIN_EXAMPLES = 2
+    for vector in ([1.0, 0.1, 0.0], [1.0, 0.0, 0.1]):
+        make_product("shirt", vector, category=categories["Áo"])
+    # One example only: left out
+    make_product("shoe", [0.0, 1.0, 0.0], category=categories["Giày"])
+    target = make_product("new", [0.2, 1.0, 0.0])
+
+    predictions = categorize_products(method="centroid", threshold=0.0)
+
+    assert [(p.product_id, p.category_id) for p in predictions] == [(target.pk, categories["Áo"].pk)]
+
+
+def test_unknown_methods_are_rejected():
+    with pytest.raises(ValueError):
+        categorize_products(method="knn")
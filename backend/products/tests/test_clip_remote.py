@@ -0,0 +1,181 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import clip_remote
+import clip_service
+from clip_remote import RemoteEmbedder, recv_frame, send_frame
+
+
+@pytest.fixture
+def pair():
+    left, right = socket.socketpair()
+    yield left, right
+    left.close()
+    right.close()
+
+
+@pytest.fixture
+def clip(monkeypatch):
+    """In-process CLIP stand-in: a vector derived from each input."""
+    seen = []
+
+    def image_embeddings(images):
+        seen.extend(images)
+        return [[float(img.size[0]), float(img.size[1]), float(np.asarray(img).mean())] for img in images]
+
+    monkeypatch.setattr(clip_service, "get_image_embeddings", image_embeddings)
+    monkeypatch.setattr(clip_service, "get_text_embedding", lambda text: [float(len(text)), 0.0, 1.0])
+    return seen
+
+
+@pytest.fixture
+def worker(tmp_path, clip):
+    """A worker answering on a Unix socket, one thread per connection."""
+    path = str(tmp_path / "clip.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(8)
+
+    def accept():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=clip_remote._serve_connection, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield path
+    listener.close()
+
+
+def test_frames_carry_a_json_header_and_a_binary_payload(pair):
+    payload = bytes(range(256)) * 10
+
+    send_frame(pair[0], {"op": "image", "images": [[4, 2]]}, payload)
+    header, data = recv_frame(pair[1])
+
+    assert header == {"op": "image", "images": [[4, 2]], "payload": len(payload)}
+    assert data == payload
+
+
+def test_a_closed_connection_is_reported(pair):
+    pair[0].sendall(clip_remote._HEADER.pack(100) + b"{")
+    pair[0].close()
+
+    with pytest.raises(ConnectionError):
+        recv_frame(pair[1])
+
+
+def test_unknown_ops_get_an_error_reply(clip):
+    reply, data = clip_remote._handle_request({"op": "video"}, b"")
+
+    assert reply["ok"] is False and "video" in reply["error"]
+    assert data == b""
+
+
+def test_client_embeds_texts_and_images_through_the_worker(worker):
+    client = RemoteEmbedder(worker, timeout=5)
+    images = [Image.new("RGB", (40, 30), (255, 0, 0)), Image.new("L", (20, 10), 128)]
+
+    assert client.ping()
+    assert client.embed_texts(["áo", "quần jean"]) == [[2.0, 0.0, 1.0], [9.0, 0.0, 1.0]]
+    vectors = client.embed_images(images)
+
+    assert [v[:2] for v in vectors] == [[40.0, 30.0], [20.0, 10.0]]
+    assert vectors[0][2] == pytest.approx(85.0)
+    assert vectors[1][2] == pytest.approx(128.0)
+
+
+def test_worker_errors_are_raised_to_the_caller(worker, monkeypatch):
+    def fail(_text):
+        raise ValueError("model exploded")
+
+    monkeypatch.setattr(clip_service, "get_text_embedding", fail)
+
+    with pytest.raises(RuntimeError, match="model exploded"):
+        RemoteEmbedder(worker, timeout=5).embed_texts(["áo"])
+
+
+def test_ping_is_false_without_a_worker(tmp_path):
+    assert RemoteEmbedder(str(tmp_path / "missing.sock"), timeout=1).ping() is False
+
+
+def test_a_stale_connection_is_replaced_before_sending(worker, pair):
+    client = RemoteEmbedder(worker, timeout=5)
+    stale, peer = pair
+    peer.close()
+    client._local.sock = stale
+
+    assert client.embed_texts(["áo"]) == [[2.0, 0.0, 1.0]]
+
+
+def test_a_request_is_not_sent_twice_after_a_read_timeout(tmp_path):
+    path = str(tmp_path / "slow.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(8)
+    received, connections = [], []
+
+    def slow_worker():
+        # Reads requests but never answers, like a pool busy past the timeout
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            connections.append(conn)
+            try:
+                received.append(recv_frame(conn)[0]["op"])
+            except OSError:
+                pass
+
+    threading.Thread(target=slow_worker, daemon=True).start()
+    try:
+        with pytest.raises(socket.timeout):
+            RemoteEmbedder(path, timeout=0.2).embed_texts(["áo"])
+    finally:
+        listener.close()
+
+    assert received == ["text"]
+
+
+def test_pool_replaces_a_worker_that_died(tmp_path, monkeypatch):
+    pids = iter(range(100, 200))
+    spawned, killed = [], []
+    exits = iter([(100, 9)])
+
+    def spawn(_listener):
+        spawned.append(next(pids))
+        return spawned[-1]
+
+    def wait():
+        # One worker is killed, then the pool is asked to stop
+        for exit in exits:
+            return exit
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(clip_remote, "_spawn", spawn)
+    monkeypatch.setattr(clip_remote, "_RESPAWN_DELAY", 0)
+    monkeypatch.setattr(clip_remote.os, "wait", wait)
+    monkeypatch.setattr(clip_remote.os, "kill", lambda pid, sig: killed.append(pid))
+    monkeypatch.setattr(clip_remote.signal, "signal", lambda *args: None)
+
+    clip_remote.serve(str(tmp_path / "pool.sock"), processes=2)
+
+    assert spawned == [100, 101, 102]
+    assert sorted(killed) == [101, 102]
+    assert not (tmp_path / "pool.sock").exists()
+
+
+def test_images_reach_the_worker_unresized(worker, clip):
+    image = Image.new("RGB", (800, 600), (10, 20, 30))
+
+    RemoteEmbedder(worker, timeout=5).embed_images([image])
+
+    assert clip[0].size == (800, 600)
+    assert clip[0].tobytes() == image.tobytes()
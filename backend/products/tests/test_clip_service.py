@@ -0,0 +1,33 @@
+import threading
+import time
+
+import clip_service
+
+
+def test_concurrent_cold_calls_load_the_model_once(monkeypatch):
+    built = []
+
+    def build(quantized):
+        time.sleep(0.05)
+        built.append(quantized)
+        return object(), object(), "cpu"
+
+    monkeypatch.setattr(clip_service, "_models", {})
+    monkeypatch.setattr(clip_service, "_build_model", build)
+    start = threading.Barrier(8)
+    loaded = []
+
+    def load():
+        start.wait()
+        loaded.append(clip_service._load_model(False))
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert built == [False]
+    assert len(loaded) == 8 and all(models is loaded[0] for models in loaded)
+    assert clip_service._load_model(True) is not loaded[0]
+    assert built == [False, True]
@@ -0,0 +1,172 @@
+import asyncio
+import io
+import threading
+import time
+
+import pytest
+from django.test import AsyncClient
+from PIL import Image
+from rest_framework.test import APIClient
+
+import clip_service
+from products import lexical, views
+from products.benchmark import synthetic_embeddings
+from products.inference import InferenceGate
+from products.models import Category
+
+pytestmark = pytest.mark.django_db
+
+VECTORS = synthetic_embeddings(6, dim=16, clusters=3)
+
+
+@pytest.fixture
+def category(db):
+    return Category.objects.create(name="Áo")
+
+
+@pytest.fixture
+def catalog(make_product, category):
+    return [
+        make_product("Áo thun cotton", VECTORS[0], category=category),
+        make_product("Áo thun trơn", VECTORS[1], stock=0, category=category),
+        make_product("Quần jean", VECTORS[2]),
+        make_product("Giày thể thao", VECTORS[3], category=category),
+    ]
+
+
+@pytest.fixture
+def clip(monkeypatch):
+    """CLIP stand-in whose forward pass takes ``delay[0]`` seconds."""
+    delay = [0.0]
+
+    def embed(_item):
+        time.sleep(delay[0])
+        return VECTORS[0].tolist()
+
+    monkeypatch.setattr(clip_service, "is_loaded", lambda: True)
+    monkeypatch.setattr(clip_service, "get_text_embedding", embed)
+    monkeypatch.setattr(clip_service, "get_image_embeddings", lambda images: [embed(i) for i in images])
+    return delay
+
+
+@pytest.fixture
+def jpeg():
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), "red").save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def _ids(response):
+    return [item["id"] for item in response.json()["results"]]
+
+
+def test_text_search_is_not_degraded_when_clip_answers_in_time(catalog, clip):
+    response = APIClient().get("/api/search/text/", {"q": "áo thun", "k": 2, "deadline_ms": 2000})
+
+    body = response.json()
+    assert response.status_code == 200
+    assert body["degraded"] is False
+    assert body["results"][0]["id"] == catalog[0].id
+    assert body["results"][0]["similarity"] is not None
+
+
+def test_text_search_falls_back_to_the_database_past_the_deadline(catalog, clip):
+    clip[0] = 0.5
+
+    # SQLite only folds the case of ASCII letters, so the DB query sticks to those
+    response = APIClient().get("/api/search/text/", {"q": "thun", "k": 5, "deadline_ms": 50})
+
+    body = response.json()
+    assert response.status_code == 200
+    assert (body["degraded"], body["degraded_reason"], body["mode"]) == (True, "timeout", "lexical")
+    assert sorted(_ids(response)) == sorted([catalog[0].id, catalog[1].id])
+    assert all(item["similarity"] is None and "bm25" not in item for item in body["results"])
+    # Never built on the degraded path
+    assert lexical.peek_lexical_index() is None
+
+
+def test_degraded_text_search_uses_bm25_when_loaded(catalog, clip):
+    lexical.get_lexical_index()
+    clip[0] = 0.5
+
+    response = APIClient().get("/api/search/text/", {"q": "ao thun cotton", "k": 5, "deadline_ms": 50})
+
+    body = response.json()
+    assert body["degraded"] is True
+    assert _ids(response)[0] == catalog[0].id
+    assert body["results"][0]["bm25"] > 0
+
+
+def test_degraded_text_search_honours_filters(catalog, clip, category):
+    clip[0] = 0.5
+
+    response = APIClient().get(
+        "/api/search/text/",
+        {"q": "thun", "k": 5, "deadline_ms": 50, "category": category.id, "in_stock": "true"},
+    )
+
+    assert response.json()["degraded"] is True
+    assert _ids(response) == [catalog[0].id]
+
+
+def test_full_inference_queue_degrades_at_once(catalog, clip, monkeypatch):
+    gate = InferenceGate(workers=1, max_pending=1)
+    release = threading.Event()
+    gate.submit(release.wait, 5)
+    monkeypatch.setattr(views, "inference_gate", gate)
+    try:
+        response = APIClient().get("/api/search/text/", {"q": "quần", "k": 5, "deadline_ms": 2000})
+    finally:
+        release.set()
+
+    body = response.json()
+    assert (body["degraded"], body["degraded_reason"]) == (True, "busy")
+    assert _ids(response) == [catalog[2].id]
+
+
+def test_image_search_falls_back_to_the_newest_matching_products(catalog, clip, category, jpeg):
+    clip[0] = 0.5
+
+    response = APIClient().post(
+        f"/api/search/image/?k=5&deadline_ms=50&category={category.id}",
+        {"file": io.BytesIO(jpeg)},
+        format="multipart",
+    )
+
+    body = response.json()
+    assert response.status_code == 200
+    assert (body["degraded"], body["degraded_reason"]) == (True, "timeout")
+    assert _ids(response) == [catalog[3].id, catalog[1].id, catalog[0].id]
+
+
+def test_k_is_clamped_on_the_degraded_path(catalog, clip, jpeg):
+    clip[0] = 0.5
+
+    text = APIClient().get("/api/search/text/", {"q": "thun", "k": -1, "deadline_ms": 50})
+    image = APIClient().post(
+        "/api/search/image/?k=0&deadline_ms=50", {"file": io.BytesIO(jpeg)}, format="multipart"
+    )
+
+    assert (text.status_code, text.json()["degraded"]) == (200, True)
+    assert len(_ids(text)) == 1
+    assert (image.status_code, image.json()["degraded"]) == (200, True)
+    assert _ids(image) == [catalog[3].id]
+
+
+def test_deadline_must_be_a_number(catalog, clip):
+    response = APIClient().get("/api/search/text/", {"q": "áo", "deadline_ms": "soon"})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_text_search_degrades_too(catalog, clip):
+    clip[0] = 0.5
+
+    response = asyncio.run(
+        AsyncClient().get("/api/search/text/async/", {"q": "quần", "k": 5, "deadline_ms": 50})
+    )
+
+    body = response.json()
+    assert (body["degraded"], body["degraded_reason"]) == (True, "timeout")
+    assert _ids(response) == [catalog[2].id]
@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pytest
+from django.db import transaction
+
+from products import delta_log
+from products.benchmark import synthetic_embeddings
+from products.delta_log import apply_pending, merge, record_attributes, record_remove, record_upsert, start_epoch
+from products.index_snapshot import current_name, open_current, read_meta, write_snapshot
+from products.search_cache import catalog_version
+from products.search_index import EmbeddingIndex, get_index
+
+pytestmark = pytest.mark.django_db
+
+VECTORS = synthetic_embeddings(4, dim=8, clusters=4)
+
+
+def _attrs(category=1, price=1000.0, stock=1):
+    return {"category": category, "seller": 1, "price": price, "stock": stock}
+
+
+def _ids(index):
+    _vectors, ids, alive = index.arrays()
+    return sorted(ids[alive].tolist())
+
+
+@pytest.fixture
+def snapshot_dir(settings, tmp_path, monkeypatch):
+    settings.SEARCH_INDEX_SNAPSHOT_DIR = str(tmp_path)
+    settings.SEARCH_INDEX_CHECK_INTERVAL = 0
+    # Look for a newer log file on every call, not once a second
+    monkeypatch.setattr(delta_log, "_NEXT_LOG_CHECK_INTERVAL", 0.0)
+    base = EmbeddingIndex.from_items([(1, VECTORS[0], _attrs()), (2, VECTORS[1], _attrs(category=2))])
+    write_snapshot(base, root=tmp_path, log_name=start_epoch(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def logged(django_capture_on_commit_callbacks):
+    """Run the block's log writes as if its transaction had committed."""
+    return lambda: django_capture_on_commit_callbacks(execute=True)
+
+
+def test_replay_applies_changes_logged_by_another_worker(snapshot_dir, logged):
+    worker = open_current()
+    assert _ids(worker) == [1, 2]
+
+    with logged():
+        record_upsert(3, VECTORS[2], _attrs(stock=0))
+        record_attributes(1, {"stock": 0})
+        record_remove(2)
+    version = catalog_version()
+
+    assert apply_pending(worker, wait=True) == 3
+    assert _ids(worker) == [1, 3]
+    stock = worker.attribute_arrays()["stock"]
+    assert stock[worker._rows[1]] == 0
+    # Cached results from before the replay must not be served again
+    assert catalog_version() > version
+    assert apply_pending(worker, wait=True) == 0
+
+
+def test_replay_waits_for_a_complete_line(snapshot_dir, logged):
+    worker = open_current()
+    with logged():
+        record_upsert(3, VECTORS[2], _attrs())
+    log = snapshot_dir / worker.log_name
+    line = log.read_bytes()
+    log.write_bytes(line + line[:10])
+
+    assert apply_pending(worker, wait=True) == 1
+    assert worker.log_offset == len(line)
+
+
+def test_replaying_a_line_twice_is_harmless(snapshot_dir, logged):
+    worker = open_current()
+    with logged():
+        record_upsert(3, VECTORS[2], _attrs())
+    apply_pending(worker, wait=True)
+    worker.log_offset = 0
+
+    assert apply_pending(worker, wait=True) == 1
+    assert _ids(worker) == [1, 2, 3]
+
+
+def test_merge_writes_a_snapshot_that_starts_after_the_applied_lines(snapshot_dir, logged):
+    worker = open_current()
+    first = worker.snapshot
+    with logged():
+        record_upsert(3, VECTORS[2], _attrs())
+        record_remove(1)
+    apply_pending(worker, wait=True)
+
+    name = merge(worker)
+
+    assert name is not None and name != first
+    assert current_name() == name
+    meta = read_meta(snapshot_dir / name)
+    assert (meta["log"], meta["log_offset"]) == (worker.log_name, worker.log_offset)
+    merged = open_current()
+    assert _ids(merged) == [2, 3]
+    assert apply_pending(merged, wait=True) == 0
+
+
+def test_merge_starts_in_the_background_past_the_threshold(snapshot_dir, logged, settings):
+    settings.SEARCH_INDEX_DELTA_MERGE_ENTRIES = 2
+    worker = open_current()
+    first = worker.snapshot
+    with logged():
+        record_upsert(3, VECTORS[2], _attrs())
+        record_upsert(4, VECTORS[3], _attrs())
+
+    apply_pending(worker, wait=True)
+    for thread in threading.enumerate():
+        if thread.name == "index-delta-merge":
+            thread.join(10)
+
+    assert current_name() != first
+    assert _ids(open_current()) == [1, 2, 3, 4]
+
+
+def test_worker_follows_the_log_into_a_new_epoch(snapshot_dir, logged):
+    worker = open_current()
+    old_log = worker.log_name
+    with logged():
+        record_upsert(3, VECTORS[2], _attrs())
+    # e.g. build_search_index started, but this worker has not swapped snapshots yet
+    time.sleep(0.001)
+    new_log = start_epoch()
+    assert new_log > old_log
+    with logged():
+        record_remove(1)
+
+    assert apply_pending(worker, wait=True) == 2
+    assert worker.log_name == new_log
+    assert _ids(worker) == [2, 3]
+
+
+
+def test_a_rolled_back_change_is_neither_applied_nor_logged(snapshot_dir, logged):
+    index = get_index()
+    log = snapshot_dir / index.log_name
+
+    with logged(), pytest.raises(RuntimeError):
+        with transaction.atomic():
+            record_upsert(3, VECTORS[2], _attrs())
+            raise RuntimeError("rollback")
+
+    assert _ids(index) == [1, 2]
+    assert log.read_bytes() == b""
+
+
+def test_the_writer_does_not_replay_its_own_lines(snapshot_dir, logged):
+    index = get_index()
+    with logged():
+        record_upsert(3, VECTORS[2], _attrs())
+    version = catalog_version()
+
+    assert _ids(index) == [1, 2, 3]
+    assert apply_pending(index, wait=True) == 0
+    assert index.delta_entries == 1
+    assert catalog_version() == version
+
+
+def test_own_lines_behind_other_workers_lines_are_skipped(snapshot_dir, logged):
+    index = get_index()
+    # Another worker's line lands first
+    delta_log._write({"op": "delete", "id": 2})
+    with logged():
+        record_upsert(3, VECTORS[2], _attrs())
+
+    assert apply_pending(index, wait=True) == 1
+    assert _ids(index) == [1, 3]
+    assert index.own_log_lines == set()
+    assert index.delta_entries == 2
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from products.duplicates import (
+    Member,
+    candidate_pairs,
+    collapse_duplicates,
+    find_duplicates,
+    name_similarity,
+    sampled_recall,
+    store_clusters,
+)
+from products.models import DuplicateCluster, DuplicateMember, Product
+
+pytestmark = pytest.mark.django_db
+
+
+def _unit(*values):
+    v = np.asarray(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def _planted(n=400, dim=32, copies=40, seed=1):
+    """Random unit rows where rows ``n .. n + copies`` are near copies of rows ``0 .. copies``."""
+    rng = np.random.default_rng(seed)
+    base = rng.standard_normal((n, dim)).astype(np.float32)
+    noisy = base[:copies] + 0.05 * rng.standard_normal((copies, dim)).astype(np.float32)
+    vectors = np.concatenate([base, noisy])
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _exact_pairs(vectors, threshold):
+    sims = np.triu(vectors @ vectors.T, 1)
+    return set(zip(*(axis.tolist() for axis in np.nonzero(sims >= threshold))))
+
+
+def test_name_similarity_folds_case_and_accents():
+    assert name_similarity("Áo Thun Trắng", "ao thun trang") == 1.0
+    assert name_similarity("áo thun", "áo khoác") == pytest.approx(1 / 3)
+    assert name_similarity("", "") == 1.0
+
+
+@pytest.mark.parametrize("max_bucket", [2000, 7])
+def test_lsh_finds_the_planted_pairs(max_bucket):
+    vectors = _planted()
+    alive = np.ones(vectors.shape[0], dtype=bool)
+
+    rows_a, rows_b, sims = candidate_pairs(vectors, alive, 0.9, bands=16, bits=4, max_bucket=max_bucket)
+
+    assert set(zip(rows_a.tolist(), rows_b.tolist())) == _exact_pairs(vectors, 0.9)
+    assert np.all(sims >= 0.9)
+    recall, exact = sampled_recall(vectors, alive, 0.9, rows_a, rows_b, sample=vectors.shape[0])
+    assert recall == 1.0 and exact == 2 * 40
+
+
+def test_dead_rows_are_never_paired():
+    vectors = _planted()
+    alive = np.ones(vectors.shape[0], dtype=bool)
+    alive[:20] = False
+
+    rows_a, rows_b, _sims = candidate_pairs(vectors, alive, 0.9, bands=16, bits=4)
+
+    assert rows_a.min() >= 20
+    assert len(rows_a) == 20
+
+
+def test_clusters_need_a_close_image_and_a_similar_name(make_product):
+    first = make_product("Áo thun trắng", _unit(1, 0, 0))
+    repost = make_product("áo thun trắng size M", _unit(1, 0.01, 0))
+    other_item = make_product("Giày thể thao", _unit(1, 0, 0.01))
+    make_product("Áo thun đen", _unit(0, 1, 0))
+
+    clusters = find_duplicates(image_threshold=0.99, name_threshold=0.5, bands=4, bits=2)
+
+    assert len(clusters) == 1
+    rep, member = clusters[0]
+    assert (rep.product_id, member.product_id) == (first.pk, repost.pk)
+    assert rep.score == pytest.approx(1.0) and rep.name_score == 1.0
+    assert member.name_score == pytest.approx(0.6)
+    assert other_item.pk not in {m.product_id for m in clusters[0]}
+
+
+def test_chains_are_split_around_the_representative(make_product):
+    angles = (0.0, 0.1, 0.2, 0.21)
+    a, b, c, d = (make_product("Áo thun", _unit(np.cos(t), np.sin(t), 0)).pk for t in angles)
+    make_product("Áo khoác", _unit(0, 0, 1))
+
+    clusters = find_duplicates(image_threshold=0.99, name_threshold=0.5, bands=32, bits=1)
+
+    # b~c links a to c/d, but cos(a, c) < 0.99
+    assert [[m.product_id for m in members] for members in clusters] == [[a, b], [c, d]]
+    assert all(m.score >= 0.99 for members in clusters for m in members)
+
+
+def test_rebuilds_keep_the_review_status_of_unchanged_clusters(make_product):
+    a, b, c, d, e = (make_product(name).pk for name in "abcde")
+    kept, created = store_clusters([
+        [Member(a, 1.0, 1.0), Member(b, 0.95, 0.8)],
+        [Member(c, 1.0, 1.0), Member(d, 0.97, 1.0)],
+    ])
+    assert (kept, created) == (0, 2)
+    reviewed = DuplicateCluster.objects.get(members__product_id=a)
+    reviewed.status = DuplicateCluster.STATUS_REJECTED
+    reviewed.save()
+
+    kept, created = store_clusters([
+        [Member(a, 1.0, 1.0), Member(b, 0.96, 0.8)],
+        [Member(c, 1.0, 1.0), Member(e, 0.93, 1.0)],
+    ])
+
+    assert (kept, created) == (1, 1)
+    reviewed.refresh_from_db()
+    assert reviewed.status == DuplicateCluster.STATUS_REJECTED
+    assert reviewed.score == pytest.approx(0.96)
+    assert DuplicateCluster.objects.count() == 2
+    assert not DuplicateMember.objects.filter(product_id=d).exists()
+    assert DuplicateMember.objects.get(product_id=c).is_representative
+
+
+def test_search_keeps_the_best_hit_of_each_cluster_unless_rejected(make_product):
+    a, b, c, d = (make_product(name).pk for name in "abcd")
+    store_clusters([[Member(a, 1.0, 1.0), Member(b, 0.95, 1.0)], [Member(c, 1.0, 1.0), Member(d, 0.95, 1.0)]])
+    hits = [(b, 0.9), (a, 0.8), (d, 0.7), (c, 0.6)]
+
+    assert collapse_duplicates(hits, 10) == [(b, 0.9), (d, 0.7)]
+    assert collapse_duplicates(hits, 1) == [(b, 0.9)]
+
+    rejected = DuplicateCluster.objects.get(members__product_id=c)
+    rejected.status = DuplicateCluster.STATUS_REJECTED
+    rejected.save()
+
+    assert collapse_duplicates(hits, 10) == [(b, 0.9), (d, 0.7), (c, 0.6)]
+
+
+def test_product_saves_do_not_reload_the_cluster_map(make_product):
+    a, b = (make_product(name).pk for name in "ab")
+    store_clusters([[Member(a, 1.0, 1.0), Member(b, 0.95, 1.0)]])
+    hits = [(b, 0.9), (a, 0.8)]
+    collapse_duplicates(hits, 10)
+
+    product = Product.objects.get(pk=a)
+    product.price = 2000
+    product.save()
+    make_product("c")
+    with CaptureQueriesContext(connection) as queries:
+        assert collapse_duplicates(hits, 10) == [(b, 0.9)]
+
+    assert queries.captured_queries == []
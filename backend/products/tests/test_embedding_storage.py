@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from products.embeddings import pack_embedding, unpack_embedding
+
+BEFORE = [("products", "0006_alter_category_name")]
+AFTER = [("products", "0007_product_embedding_binary")]
+
+
+def _migrate(targets):
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(targets)
+    # Other apps stay migrated; take their latest state too
+    return executor.loader.project_state([*targets, *executor.loader.graph.leaf_nodes("users")]).apps
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_pack_round_trip(settings, dtype):
+    settings.PRODUCT_EMBEDDING_DTYPE = dtype
+    values = np.linspace(-1, 1, 512)
+
+    blob, dim = pack_embedding(values)
+
+    assert (len(blob), dim) == (512 * np.dtype(dtype).itemsize, 512)
+    np.testing.assert_allclose(unpack_embedding(blob, dim), values, atol=1e-3)
+
+
+def test_unpack_rejects_blobs_of_the_wrong_length():
+    blob, dim = pack_embedding([1.0, 2.0, 3.0])
+
+    assert unpack_embedding(blob[:-1], dim) is None
+    assert unpack_embedding(blob, 0) is None
+    assert unpack_embedding(None, dim) is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_0007_converts_json_embeddings_both_ways():
+    apps = _migrate(BEFORE)
+    seller = apps.get_model("users", "User").objects.create(username="seller", email="seller@example.com")
+    Product = apps.get_model("products", "Product")
+    values = [0.25, -0.5, 1.0]
+    embedded = Product.objects.create(seller=seller, name="a", price=1, image_embedding=values)
+    blank = Product.objects.create(seller=seller, name="b", price=1)
+
+    try:
+        Product = _migrate(AFTER).get_model("products", "Product")
+        row = Product.objects.get(pk=embedded.pk)
+        assert row.embedding_dim == 3
+        assert row.embedding_model == "openai/clip-vit-base-patch32"
+        np.testing.assert_array_equal(unpack_embedding(bytes(row.embedding), 3), values)
+        assert Product.objects.get(pk=blank.pk).embedding is None
+
+        Product = _migrate(BEFORE).get_model("products", "Product")
+        assert Product.objects.get(pk=embedded.pk).image_embedding == values
+        assert Product.objects.get(pk=blank.pk).image_embedding is None
+    finally:
+        _migrate(MigrationExecutor(connection).loader.graph.leaf_nodes("products"))
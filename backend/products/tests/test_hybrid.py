@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from products import hybrid
+from products.lexical import LexicalIndex, fold
+from products.search_index import EmbeddingIndex, SearchFilters
+
+
+def _unit(*values):
+    v = np.asarray(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture
+def lexical():
+    index = LexicalIndex(k1=1.2, b=0.75)
+    index.upsert(1, "Áo thun cotton", "áo thun nam")
+    index.upsert(2, "Quần jean", "phối với áo thun")
+    index.upsert(3, "Giày thể thao", "")
+    return index
+
+
+@pytest.fixture
+def vectors(monkeypatch, lexical):
+    index = EmbeddingIndex.from_items([
+        (1, _unit(1, 0, 0), {"category": 1}),
+        (2, _unit(0, 1, 0), {"category": 2}),
+        (3, _unit(0, 0, 1), {"category": 2}),
+    ])
+    monkeypatch.setattr(hybrid, "get_index", lambda: index)
+    monkeypatch.setattr(hybrid, "get_lexical_index", lambda: lexical)
+    return index
+
+
+def test_fold_strips_vietnamese_diacritics():
+    assert fold("Đầm Áo") == "dam ao"
+
+
+def test_bm25_matches_without_diacritics_and_weights_names(lexical):
+    hits = lexical.search("ao thun", 10)
+
+    assert [pid for pid, _score in hits] == [1, 2]
+    assert hits[0][1] > hits[1][1] > 0
+
+
+def test_bm25_forgets_removed_and_replaced_documents(lexical):
+    lexical.remove(1)
+    lexical.upsert(3, "Áo khoác", "")
+
+    assert [pid for pid, _score in lexical.search("ao", 10)] == [3, 2]
+    assert lexical.search("giay", 10) == []
+    assert len(lexical) == 2
+
+
+def test_lexical_weight_moves_the_ranking(vectors):
+    # The query words match product 1 best; its vector is closest to product 2
+    query = _unit(0.1, 1, 0)
+
+    lexical_first = hybrid.hybrid_search("ao thun", query, k=2, lexical_weight=1.0)
+    vector_first = hybrid.hybrid_search("ao thun", query, k=2, lexical_weight=0.0)
+
+    assert [hit.product_id for hit in lexical_first] == [1, 2]
+    assert [hit.product_id for hit in vector_first] == [2, 1]
+    assert lexical_first[0].bm25 > 0 and lexical_first[0].similarity is not None
+
+
+def test_rrf_ranks_a_product_strong_in_both_lists_first(vectors):
+    hits = hybrid.hybrid_search("ao thun", _unit(1, 0.2, 0), k=3, fusion="rrf", lexical_weight=0.5)
+
+    assert hits[0].product_id == 1
+    assert [h.score for h in hits] == sorted((h.score for h in hits), reverse=True)
+
+
+def test_vector_results_top_up_too_few_lexical_matches(vectors):
+    hits = hybrid.hybrid_search("giay", _unit(0, 1, 0), k=3)
+
+    assert {hit.product_id for hit in hits} == {1, 2, 3}
+    assert hits[0].product_id in (2, 3)
+
+
+def test_filters_drop_lexical_candidates_outside_the_index_attributes(vectors):
+    hits = hybrid.hybrid_search("ao thun", _unit(1, 0, 0), k=3, filters=SearchFilters(categories=(2,)))
+
+    assert 1 not in {hit.product_id for hit in hits}
+    assert hits and hits[0].product_id == 2
+
+
+def test_unknown_fusion_is_rejected(vectors):
+    with pytest.raises(ValueError):
+        hybrid.hybrid_search("ao", _unit(1, 0, 0), fusion="max")
@@ -0,0 +1,85 @@
+import io
+
+import pytest
+from PIL import Image, UnidentifiedImageError
+
+from products.image_io import CLIP_SIDE, decode_search_image, roi_box
+
+
+def _encode(image, fmt, **options):
+    buf = io.BytesIO()
+    image.save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+def _gradient(size):
+    return Image.linear_gradient("L").resize(size).convert("RGB")
+
+
+def test_large_jpegs_are_decoded_reduced_but_not_below_clip_size():
+    data = _encode(_gradient((2400, 1600)), "JPEG")
+
+    full, crop = decode_search_image(data)
+
+    assert crop is None
+    assert full.mode == "RGB"
+    assert CLIP_SIDE <= min(full.size) < 1600 // 2
+    assert full.size[0] / full.size[1] == pytest.approx(1.5, rel=0.02)
+
+
+def test_small_images_are_kept_at_full_size():
+    full, _crop = decode_search_image(_encode(_gradient((300, 200)), "PNG"))
+
+    assert full.size == (300, 200)
+
+
+def test_a_roi_keeps_enough_pixels_for_its_own_crop():
+    data = _encode(_gradient((4000, 4000)), "JPEG")
+    roi = {"x": 0.25, "y": 0.25, "w": 0.25, "h": 0.25}
+
+    full, crop = decode_search_image(data, roi)
+
+    assert min(crop.size) >= CLIP_SIDE
+    assert min(full.size) >= 4 * CLIP_SIDE
+    assert crop.size[0] == pytest.approx(full.size[0] / 4, abs=2)
+
+
+def test_decoded_size_stays_within_the_pixel_budget(settings):
+    settings.SEARCH_IMAGE_DECODE_PIXELS = 1_000_000
+    data = _encode(_gradient((3000, 3000)), "PNG")
+    # A 20-pixel ROI would need the full resolution to reach CLIP_SIDE
+    roi = {"x": 100, "y": 100, "w": 20, "h": 20}
+
+    full, crop = decode_search_image(data, roi)
+
+    assert full.size[0] * full.size[1] <= 1_000_000
+    assert crop is not None and min(crop.size) >= 1
+
+
+@pytest.mark.parametrize("mode", ["P", "1", "RGBA", "CMYK"])
+def test_every_mode_comes_back_as_rgb(mode):
+    image = _gradient((1200, 900)).convert(mode)
+    fmt = "JPEG" if mode == "CMYK" else "PNG"
+
+    full, _crop = decode_search_image(_encode(image, fmt))
+
+    assert full.mode == "RGB"
+    assert min(full.size) >= CLIP_SIDE
+
+
+def test_oversized_images_are_rejected_before_decoding(settings):
+    settings.SEARCH_IMAGE_MAX_PIXELS = 1_000_000
+    data = _encode(_gradient((1200, 1000)), "JPEG")
+
+    with pytest.raises(ValueError, match="too large"):
+        decode_search_image(data)
+
+
+def test_undecodable_data_raises():
+    with pytest.raises(UnidentifiedImageError):
+        decode_search_image(b"not an image")
+
+
+def test_roi_box_accepts_normalized_and_pixel_coordinates():
+    assert roi_box({"x": 0.5, "y": 0, "w": 0.5, "h": 0.5}, (200, 100)) == (100, 0, 200, 50)
+    assert roi_box({"x": 10, "y": 20, "w": 30, "h": 40}, (200, 100)) == (10, 20, 40, 60)
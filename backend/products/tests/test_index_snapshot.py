@@ -0,0 +1,98 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from products import search_index
+from products.benchmark import synthetic_embeddings
+from products.index_snapshot import current_name, open_current, prune, write_snapshot
+from products.search_cache import catalog_version
+from products.search_index import EmbeddingIndex, get_index
+
+pytestmark = pytest.mark.django_db
+
+VECTORS = synthetic_embeddings(4, dim=8, clusters=4)
+
+
+def _attrs(category=1, price=1000.0, stock=1):
+    return {"category": category, "seller": 1, "price": price, "stock": stock}
+
+
+def _ids(index):
+    _vectors, ids, alive = index.arrays()
+    return sorted(ids[alive].tolist())
+
+
+@pytest.fixture
+def snapshot_dir(settings, tmp_path):
+    settings.SEARCH_INDEX_SNAPSHOT_DIR = str(tmp_path)
+    settings.SEARCH_INDEX_CHECK_INTERVAL = 0
+    base = EmbeddingIndex.from_items([(1, VECTORS[0], _attrs()), (2, VECTORS[1], _attrs(category=2))])
+    write_snapshot(base, root=tmp_path)
+    return tmp_path
+
+
+def test_a_snapshot_opens_memory_mapped_with_its_rows_and_attributes(snapshot_dir):
+    index = open_current()
+
+    assert index._mapped and index.snapshot == current_name()
+    assert _ids(index) == [1, 2]
+    assert index.attribute_arrays()["category"][index._rows[2]] == 2
+    hits = index.search(VECTORS[1], 1)
+    assert hits[0][0] == 2
+
+
+def test_a_snapshot_of_another_model_is_ignored(snapshot_dir):
+    meta_path = snapshot_dir / current_name() / "meta.json"
+    meta = json.loads(meta_path.read_text())
+    meta_path.write_text(json.dumps({**meta, "model": "another-model"}))
+
+    assert open_current() is None
+
+
+def test_get_index_swaps_to_a_newly_published_snapshot(snapshot_dir):
+    index = get_index()
+    first = index.snapshot
+    assert index._mapped and _ids(index) == [1, 2]
+
+    rebuilt = EmbeddingIndex.from_items([(5, VECTORS[2], _attrs()), (6, VECTORS[3], _attrs())])
+    second = write_snapshot(rebuilt)
+    assert second != first
+    version = catalog_version()
+
+    get_index()
+    for _ in range(100):
+        if search_index.peek_index().snapshot == second:
+            break
+        time.sleep(0.05)
+
+    swapped = get_index()
+    assert swapped.snapshot == second
+    assert _ids(swapped) == [5, 6]
+    assert catalog_version() > version
+
+
+def test_live_updates_do_not_touch_the_snapshot_files(snapshot_dir):
+    index = open_current()
+    path = snapshot_dir / index.snapshot / "vectors.npy"
+    before = path.read_bytes()
+
+    index.upsert(1, VECTORS[3], _attrs())
+
+    assert path.read_bytes() == before
+    np.testing.assert_allclose(index.vector(1), VECTORS[3] / np.linalg.norm(VECTORS[3]), rtol=1e-5)
+
+
+def test_prune_keeps_the_newest_snapshots(snapshot_dir):
+    index = open_current()
+    names = [index.snapshot]
+    for _ in range(3):
+        time.sleep(0.001)
+        names.append(write_snapshot(index))
+
+    assert prune(keep=2) == 2
+
+    remaining = sorted(p.name for p in snapshot_dir.iterdir() if p.is_dir())
+    assert remaining == names[-2:]
+    assert current_name() == names[-1]
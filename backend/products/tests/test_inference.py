@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from products.inference import InferenceBusy, InferenceGate, InferenceTimeout, deadline_after, remaining
+
+
+@pytest.fixture
+def gate():
+    return InferenceGate(workers=1, max_pending=2)
+
+
+@pytest.fixture
+def blocked(gate):
+    """Occupy the gate's only worker until the test ends."""
+    release = threading.Event()
+    future = gate.submit(release.wait, 5)
+    yield future
+    release.set()
+    future.result(5)
+
+
+def _settle(gate):
+    for _ in range(100):
+        if gate.metrics()["running"] == 0 and gate.metrics()["queue_depth"] == 0:
+            return
+        time.sleep(0.01)
+
+
+def test_call_returns_the_result(gate):
+    assert gate.call(pow, 2, 10, timeout=1) == 1024
+    assert gate.metrics()["admitted"] == 1
+
+
+def test_calls_past_max_pending_are_rejected_at_once(gate, blocked):
+    gate.submit(time.sleep, 0)
+
+    started = time.monotonic()
+    with pytest.raises(InferenceBusy) as error:
+        gate.submit(time.sleep, 0)
+
+    assert time.monotonic() - started < 0.5
+    assert error.value.reason == "busy"
+    assert gate.metrics()["rejected"] == 1
+
+
+def test_deadline_cancels_a_call_still_queued(gate, blocked):
+    ran = []
+
+    with pytest.raises(InferenceTimeout) as error:
+        gate.call(ran.append, 1, timeout=0.05)
+
+    assert error.value.reason == "timeout"
+    assert gate.metrics()["timed_out"] == 1
+    # The cancelled call gave its slot back and never runs
+    assert gate.metrics()["queue_depth"] == 0
+    assert ran == []
+
+
+def test_a_call_past_its_deadline_finishes_in_the_background(gate):
+    done = threading.Event()
+
+    def slow():
+        time.sleep(0.2)
+        done.set()
+
+    with pytest.raises(InferenceTimeout):
+        gate.call(slow, timeout=0.05)
+
+    assert done.wait(2)
+    _settle(gate)
+    assert gate.metrics()["queue_depth"] == 0
+
+
+def test_no_time_left_fails_without_queueing(gate):
+    with pytest.raises(InferenceTimeout):
+        gate.call(pow, 2, 2, timeout=0)
+
+    assert gate.metrics()["admitted"] == 0
+
+
+def test_errors_of_the_call_propagate(gate):
+    with pytest.raises(ZeroDivisionError):
+        gate.call(divmod, 1, 0, timeout=1)
+
+    _settle(gate)
+    assert gate.metrics()["failed"] == 1
+
+
+def test_run_awaits_on_the_pool(gate):
+    assert asyncio.run(gate.run(pow, 3, 3, timeout=1)) == 27
+
+
+def test_run_times_out(gate):
+    async def search():
+        return await gate.run(time.sleep, 0.5, timeout=0.05)
+
+    with pytest.raises(InferenceTimeout):
+        asyncio.run(search())
+
+
+def test_deadline_helpers():
+    assert remaining(deadline_after(None)) is None
+    left = remaining(deadline_after(1000))
+    assert 0.9 < left <= 1.0
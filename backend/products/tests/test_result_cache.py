@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from rest_framework.test import APIClient
+
+import clip_service
+from products.models import Product
+from products.search_cache import bump_catalog_version, catalog_version, result_cache_key, search_result_cache
+
+pytestmark = pytest.mark.django_db
+
+VECTOR = np.asarray([1.0, 0.0, 0.0], dtype=np.float32)
+
+
+@pytest.fixture
+def shared_cache(settings, tmp_path):
+    """A cache every worker would see (file based, here)."""
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "search": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": str(tmp_path)},
+    }
+    settings.SEARCH_EMBEDDING_CACHE_ALIAS = "search"
+
+
+@pytest.fixture
+def clip(monkeypatch):
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        return VECTOR.tolist()
+
+    monkeypatch.setattr(clip_service, "is_loaded", lambda: True)
+    monkeypatch.setattr(clip_service, "get_text_embedding", embed)
+    return calls
+
+
+def _search():
+    response = APIClient().get("/api/search/text/", {"q": "áo", "k": 5})
+    assert response.status_code == 200
+    return response.json()["results"]
+
+
+def test_results_are_not_cached_without_a_shared_version():
+    key = result_cache_key("text", VECTOR, 5)
+
+    search_result_cache.set(key, ["hit"])
+
+    assert search_result_cache.get(key) is None
+
+
+def test_a_version_bump_moves_every_result_key(shared_cache):
+    key = result_cache_key("text", VECTOR, 5, None)
+    search_result_cache.set(key, ["hit"])
+    assert search_result_cache.get(key) == ["hit"]
+
+    bump_catalog_version()
+
+    assert result_cache_key("text", VECTOR, 5, None) != key
+
+
+def test_listed_field_changes_invalidate_cached_results(shared_cache, clip, make_product):
+    product = make_product("Áo thun", VECTOR, price=1000)
+    assert [float(item["price"]) for item in _search()] == [1000.0]
+    # Served from the result cache: update() sends no signal
+    Product.objects.filter(pk=product.pk).update(price=1200)
+    assert [float(item["price"]) for item in _search()] == [1000.0]
+
+    product.price = 1500
+    product.save()
+
+    assert [float(item["price"]) for item in _search()] == [1500.0]
+
+
+def test_unrelated_saves_keep_cached_results(shared_cache, make_product):
+    product = make_product("Áo thun", VECTOR)
+    version = catalog_version()
+
+    product.color_options = ["đỏ"]
+    product.save(update_fields=["color_options"])
+    Product.objects.get(pk=product.pk).save()
+
+    assert catalog_version() == version
+
+
+def test_deletes_invalidate_cached_results(shared_cache, make_product):
+    product = make_product("Áo thun", VECTOR)
+    version = catalog_version()
+
+    product.delete()
+
+    assert catalog_version() > version
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from products.catalog_sync import sync_index
+from products.models import Product
+from products.search_index import EmbeddingIndex, get_index
+
+pytestmark = pytest.mark.django_db
+
+
+def _unit(*values):
+    v = np.asarray(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture
+def catalog(make_product):
+    return [
+        make_product("red", _unit(1, 0, 0)),
+        make_product("green", _unit(0, 1, 0)),
+        make_product("blue", _unit(0, 0, 1)),
+    ]
+
+
+def test_search_ranks_by_cosine_similarity():
+    index = EmbeddingIndex.from_items([(1, [1, 0, 0]), (2, [1, 1, 0]), (3, [0, 0, 1])])
+
+    hits = index.search([2, 0, 0], 2, engine="exact")
+
+    assert [pid for pid, _score in hits] == [1, 2]
+    assert hits[0][1] == pytest.approx(1.0)
+    assert hits[1][1] == pytest.approx(np.sqrt(0.5))
+
+
+def test_invalid_vectors_are_skipped_or_rejected():
+    index = EmbeddingIndex.from_items([(1, [1, 0, 0]), (2, [0, 0, 0]), (3, [1, 0])])
+
+    assert len(index) == 1
+    assert not index.upsert(4, [1, 0])
+    assert index.search([1, 0], 5) == []
+
+
+def test_upsert_and_remove_update_the_rows_in_place():
+    index = EmbeddingIndex.from_items([(1, [1, 0, 0]), (2, [0, 1, 0])])
+
+    index.upsert(1, [0, 0, 1])
+    index.upsert(3, [1, 0, 0])
+    index.remove(2)
+
+    assert len(index) == 2
+    assert [pid for pid, _score in index.search([0, 0, 1], 1)] == [1]
+    assert 2 not in [pid for pid, _score in index.search([0, 1, 0], 5)]
+
+
+def test_index_is_built_from_active_products_of_the_current_model(catalog, make_product):
+    make_product("no vector")
+    make_product("hidden", _unit(1, 1, 0), is_active=False)
+    stale = make_product("old model", _unit(1, 1, 1))
+    Product.objects.filter(pk=stale.pk).update(embedding_model="some/other-model")
+
+    index = get_index()
+
+    _vectors, ids, alive = index.arrays()
+    assert sorted(ids[alive].tolist()) == sorted(p.id for p in catalog)
+    assert index.search(_unit(0, 1, 0.1), 1)[0][0] == catalog[1].id
+
+
+def test_database_sync_picks_up_changes_made_elsewhere(catalog, make_product):
+    index = get_index()
+    added = make_product("yellow", _unit(1, 1, 0))
+    # queryset.update() and deletes from other processes bypass this worker's signals
+    Product.objects.filter(pk=catalog[0].pk).update(is_active=False)
+    Product.objects.filter(pk=catalog[1].pk).delete()
+    index.upsert(catalog[1].pk, _unit(0, 1, 0))
+
+    assert sync_index(index) > 0
+
+    _vectors, ids, alive = index.arrays()
+    assert sorted(ids[alive].tolist()) == [catalog[2].id, added.id]
+    assert sync_index(index) == 0
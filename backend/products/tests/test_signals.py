@@ -0,0 +1,96 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from products import embedding_queue
+from products.models import Product
+from products.search_cache import catalog_version
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def enqueued(settings, monkeypatch):
+    """Ids handed to the embedding worker by saves inside ``saving()``."""
+    settings.PRODUCT_EMBED_ON_SAVE = True
+    ids = []
+    monkeypatch.setattr(embedding_queue.embedding_queue, "enqueue", ids.append)
+    return ids
+
+
+@pytest.fixture
+def saving(django_capture_on_commit_callbacks):
+    return lambda: django_capture_on_commit_callbacks(execute=True)
+
+
+@pytest.fixture
+def product(make_product):
+    return make_product("Áo thun", image_url="http://img/1.jpg")
+
+
+def _selects(queries):
+    return [q["sql"] for q in queries if q["sql"].startswith("SELECT") and "products_product" in q["sql"]]
+
+
+def test_a_new_product_with_an_image_is_embedded(make_product, enqueued, saving):
+    with saving():
+        created = make_product("Áo thun", image_url="http://img/1.jpg")
+        make_product("Quần jean")
+
+    assert enqueued == [created.pk]
+
+
+def test_saving_a_loaded_product_does_not_read_it_again(product, enqueued, saving):
+    loaded = Product.objects.get(pk=product.pk)
+    loaded.stock = 5
+
+    with saving(), CaptureQueriesContext(connection) as queries:
+        loaded.save()
+
+    assert _selects(queries.captured_queries) == []
+    assert enqueued == []
+
+
+def test_an_image_change_is_detected_without_a_query(product, enqueued, saving):
+    loaded = Product.objects.get(pk=product.pk)
+    loaded.image_url = "http://img/2.jpg"
+
+    with saving(), CaptureQueriesContext(connection) as queries:
+        loaded.save(update_fields=["image_url"])
+
+    assert _selects(queries.captured_queries) == []
+    assert enqueued == [product.pk]
+
+
+def test_repeated_saves_compare_with_the_last_saved_values(product, enqueued, saving):
+    with saving():
+        product.image_url = "http://img/2.jpg"
+        product.save()
+        product.name = "Áo thun trơn"
+        product.save()
+
+    assert enqueued == [product.pk]
+
+
+def test_unchanged_saves_keep_cached_results(product):
+    version = catalog_version()
+    loaded = Product.objects.get(pk=product.pk)
+
+    loaded.save()
+    assert catalog_version() == version
+
+    loaded.price = 2000
+    loaded.save()
+    assert catalog_version() > version
+
+
+def test_an_instance_built_by_hand_is_compared_with_the_row(product, enqueued, saving):
+    detached = Product(
+        pk=product.pk, seller_id=product.seller_id, name=product.name, price=product.price,
+        stock=product.stock, image_url="http://img/3.jpg", created_at=product.created_at,
+    )
+
+    with saving():
+        detached.save()
+
+    assert enqueued == [product.pk]
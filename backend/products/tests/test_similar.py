@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from rest_framework.test import APIClient
+
+from products import similar
+from products.models import SimilarProduct
+from products.search_index import get_index
+from products.similar import build_similar_products, update_similar
+
+pytestmark = pytest.mark.django_db
+
+
+def _unit(*values):
+    v = np.asarray(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture
+def catalog(make_product, settings):
+    settings.PRODUCT_SIMILAR_COUNT = 2
+    return [
+        make_product("a", _unit(1, 0, 0)),
+        make_product("b", _unit(1, 0.2, 0)),
+        make_product("c", _unit(1, 0.5, 0)),
+        make_product("d", _unit(0.1, 0, 1)),
+    ]
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    ids = []
+    monkeypatch.setattr(similar.similar_queue, "enqueue", ids.append)
+    monkeypatch.setattr(similar, "_read_requests", similar.OrderedDict())
+    return ids
+
+
+def _lists():
+    lists = {}
+    for edge in SimilarProduct.objects.order_by("product_id", "rank"):
+        lists.setdefault(edge.product_id, []).append(edge.neighbor_id)
+    return lists
+
+
+def test_build_stores_the_top_neighbours_of_every_product(catalog):
+    a, b, c, d = (p.pk for p in catalog)
+
+    assert build_similar_products(block_rows=3) == 4
+
+    assert _lists() == {a: [b, c], b: [a, c], c: [b, a], d: [a, b]}
+
+
+def test_a_new_product_gets_a_list_and_enters_its_neighbours_lists(catalog, make_product):
+    build_similar_products()
+    a, b, c, _d = (p.pk for p in catalog)
+    new = make_product("e", _unit(1, 0.05, 0))
+    get_index().upsert(new.pk, _unit(1, 0.05, 0))
+
+    update_similar(new.pk)
+
+    lists = _lists()
+    assert lists[new.pk] == [a, b]
+    assert lists[a] == [new.pk, b]
+    assert lists[b] == [new.pk, a]
+    assert lists[c] == [b, new.pk]
+
+
+def test_a_removed_product_leaves_every_list(catalog):
+    build_similar_products()
+    a, b, c, d = (p.pk for p in catalog)
+    get_index().remove(b)
+
+    update_similar(b)
+
+    lists = _lists()
+    assert b not in lists
+    assert lists[a] == [c, d] and lists[c] == [a, d]
+
+
+def test_the_endpoint_serves_the_stored_list(catalog):
+    build_similar_products()
+    a, b, c, _d = catalog
+
+    body = APIClient().get(f"/api/products/{a.pk}/similar/", {"limit": 1}).json()
+
+    assert [item["id"] for item in body["results"]] == [b.pk]
+    assert body["results"][0]["similarity"] == pytest.approx(float(_unit(1, 0, 0) @ _unit(1, 0.2, 0)))
+
+
+def test_a_missing_list_is_scored_live_without_queueing_when_disabled(catalog, queued):
+    a, b, c, _d = catalog
+
+    body = APIClient().get(f"/api/products/{a.pk}/similar/").json()
+
+    assert [item["id"] for item in body["results"]] == [b.pk, c.pk]
+    assert queued == []
+
+
+def test_a_missing_list_is_queued_once(catalog, queued, settings):
+    settings.PRODUCT_SIMILAR_ON_SAVE = True
+    a = catalog[0]
+
+    for _ in range(3):
+        APIClient().get(f"/api/products/{a.pk}/similar/")
+
+    assert queued == [a.pk]
+
+    # A vector change lets the next read queue it again
+    similar.queue_update(a.pk)
+    APIClient().get(f"/api/products/{a.pk}/similar/")
+    assert queued == [a.pk, a.pk, a.pk]
@@ -0,0 +1,37 @@
+import pytest
+
+from products import warmup
+
+
+@pytest.fixture
+def started(monkeypatch):
+    """Names of the warm-up threads ``warm_up_on_startup`` would start."""
+    names = []
+
+    class Thread:
+        def __init__(self, target, name, daemon):
+            self.name = name
+
+        def start(self):
+            names.append(self.name)
+
+    monkeypatch.setattr(warmup.threading, "Thread", Thread)
+    return names
+
+
+@pytest.mark.parametrize(
+    "warm_up, deadline_ms, expected",
+    [
+        (None, 1500, ["clip-warmup"]),
+        (None, None, []),
+        (False, 1500, []),
+        (True, None, ["clip-warmup"]),
+    ],
+)
+def test_a_search_deadline_turns_the_warm_up_on_by_default(settings, started, warm_up, deadline_ms, expected):
+    settings.CLIP_WARMUP_ON_STARTUP = warm_up
+    settings.PRODUCT_SEARCH_DEADLINE_MS = deadline_ms
+
+    warmup.warm_up_on_startup()
+
+    assert started == expected
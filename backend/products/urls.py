@@ -4,6 +4,10 @@ from .views import (
     CategoryViewSet,
     ImageSearchView,
     TextSearchView,
+    AsyncImageSearchView,
+    AsyncTextSearchView,
+    SearchReadinessView,
+    SimilarProductsView,
     WishlistViewSet,
     SavedItemViewSet,
     seller_products,
@@ -22,6 +26,9 @@ urlpatterns = [
         'delete': 'destroy'
     }), name='product-detail'),
 
+    # Precomputed "more like this"
+    path('products/<int:pk>/similar/', SimilarProductsView.as_view(), name='product-similar'),
+
     # Category URLs
     path('categories/', CategoryViewSet.as_view({'get': 'list', 'post': 'create'}), name='category-list'),
     path('categories/<int:pk>/', CategoryViewSet.as_view({
@@ -37,6 +44,13 @@ urlpatterns = [
     # Text search with CLIP
     path('search/text/', TextSearchView.as_view(), name='text-search'),
 
+    # Async variants (ASGI): CLIP runs on a bounded pool, the request only awaits
+    path('search/image/async/', AsyncImageSearchView.as_view(), name='image-search-async'),
+    path('search/text/async/', AsyncTextSearchView.as_view(), name='text-search-async'),
+
+    # Readiness probe for the CLIP search stack
+    path('search/ready/', SearchReadinessView.as_view(), name='search-ready'),
+
     # Wishlist URLs
     path('products/wishlist/', WishlistViewSet.as_view({'get': 'list', 'post': 'create'}), name='wishlist-list'),
     path('products/wishlist/<int:pk>/', WishlistViewSet.as_view({'delete': 'destroy'}), name='wishlist-detail'),
@@ -1,13 +1,19 @@
 from rest_framework import generics, permissions, status, viewsets, mixins, parsers, filters
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import APIException, PermissionDenied
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
+from rest_framework.request import Request
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.db.models import Count, Q
-from PIL import Image
-import torch
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+import json
 
 from .serializers import (
     ProductCreateSerializer,
@@ -16,8 +22,25 @@ from .serializers import (
     WishlistItemSerializer,
     SavedItemSerializer,
 )
-from .models import Product, Category, WishlistItem, SavedItem
-from clip_service import get_image_embedding, get_text_embedding
+from .models import Product, Category, WishlistItem, SavedItem, SimilarProduct
+from .duplicates import collapse_duplicates, collapse_overfetch
+from .hybrid import FUSIONS, hybrid_search
+from .image_io import decode_search_image
+from .fallback import lexical_results, recent_results
+from .inference import InferenceUnavailable, deadline_after, default_deadline_ms, inference_gate, remaining
+from .search_cache import (
+    cached_text_embedding,
+    image_cache_key,
+    image_embedding_cache,
+    normalize_query,
+    result_cache_key,
+    search_result_cache,
+    text_cache_key,
+    text_embedding_cache,
+)
+from .search_index import SearchFilters, available_engines, get_index, l2_normalize
+from .similar import queue_update_for_read, similar_count
+from .warmup import readiness
 
 
 class BuyerOnlyPermission(permissions.BasePermission):
@@ -30,6 +53,154 @@ class BuyerOnlyPermission(permissions.BasePermission):
             and getattr(request.user, 'user_type', None) == 'buyer'
         )
 
+def _search_options(request):
+    """Scoring engine chosen by the client, e.g. ``?engine=ivf&nprobe=8`` or
+    ``?engine=int8&rerank=200``.
+
+    Raises ValueError for unknown engines or non-integer tuning values.
+    """
+    options = {}
+    engine = request.query_params.get('engine')
+    if engine:
+        if engine not in available_engines():
+            raise ValueError(f"engine must be one of: {', '.join(available_engines())}")
+        options['engine'] = engine
+    for param in ('nprobe', 'rerank'):
+        value = request.query_params.get(param)
+        if value:
+            options[param] = int(value)
+    return options
+
+
+def _search_filters(request):
+    """Attribute filters for the search endpoints, applied inside the index scan.
+
+    ``?category=3,7&seller=12&min_price=100000&max_price=500000&in_stock=true``
+    (form fields are accepted too for the multipart image search).
+    Raises ValueError on malformed numbers.
+    """
+    def param(name):
+        value = request.query_params.get(name)
+        if value in (None, ''):
+            value = request.data.get(name) if hasattr(request.data, 'get') else None
+        return value if value not in (None, '') else None
+
+    categories = param('category')
+    seller = param('seller')
+    min_price = param('min_price')
+    max_price = param('max_price')
+    in_stock = param('in_stock')
+    return SearchFilters(
+        categories=tuple(int(c) for c in str(categories).split(',') if c.strip()) if categories else (),
+        seller=int(seller) if seller is not None else None,
+        min_price=float(min_price) if min_price is not None else None,
+        max_price=float(max_price) if max_price is not None else None,
+        in_stock=str(in_stock).lower() in ('1', 'true', 'yes') if in_stock is not None else False,
+    )
+
+
+def _hybrid_options(request):
+    """``?mode=hybrid`` turns on BM25 + CLIP fusion for text search.
+
+    ``fusion`` is ``weighted`` or ``rrf``; ``w`` is the lexical weight (0..1).
+    Returns None for plain vector search. Raises ValueError on bad values.
+    """
+    mode = request.query_params.get('mode', 'vector')
+    if mode not in ('vector', 'hybrid'):
+        raise ValueError("mode must be one of: vector, hybrid")
+    if mode == 'vector':
+        return None
+    options = {}
+    fusion = request.query_params.get('fusion')
+    if fusion:
+        if fusion not in FUSIONS:
+            raise ValueError(f"fusion must be one of: {', '.join(FUSIONS)}")
+        options['fusion'] = fusion
+    weight = request.query_params.get('w')
+    if weight:
+        options['lexical_weight'] = float(weight)
+        if not 0.0 <= options['lexical_weight'] <= 1.0:
+            raise ValueError("w must be between 0 and 1")
+    return options
+
+
+def _result_count(request):
+    """``?k=`` (default 50) clamped to 1..``PRODUCT_SEARCH_MAX_RESULTS``.
+
+    Negative slices are not supported by querysets, so the database
+    fallbacks need k >= 1. Raises ValueError when k is not an integer.
+    """
+    k = int(request.query_params.get('k', 50))
+    return max(1, min(k, getattr(settings, 'PRODUCT_SEARCH_MAX_RESULTS', 500)))
+
+
+def _collapse_option(request):
+    """``?collapse=true`` keeps only the best product of each duplicate cluster."""
+    value = request.query_params.get('collapse')
+    if value in (None, ''):
+        return getattr(settings, 'PRODUCT_SEARCH_COLLAPSE_DUPLICATES', False)
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _search_deadline(request):
+    """Deadline (``time.monotonic()``) of the embedding step, or None for no limit.
+
+    ``?deadline_ms=`` can shorten ``PRODUCT_SEARCH_DEADLINE_MS`` but not
+    extend it. Raises ValueError on a malformed value.
+    """
+    budget = default_deadline_ms()
+    value = request.query_params.get('deadline_ms')
+    if value:
+        requested = float(value)
+        if requested <= 0:
+            raise ValueError("deadline_ms must be positive")
+        budget = requested if budget is None else min(budget, requested)
+    return deadline_after(budget)
+
+
+def _fallback_payload(top, reason, **fields):
+    """Response body of a degraded search (``products.fallback`` hits, no CLIP similarity)."""
+    results = []
+    for bm25, p in top:
+        item = {
+            "id": p.id,
+            "name": p.name,
+            "price": str(p.price),
+            "stock": p.stock,
+            "image": (p.image.url if p.image else (p.image_url or None)),
+            "category": p.category.name if p.category else None,
+            "seller": p.seller.username if p.seller else None,
+            "similarity": None,
+        }
+        if bm25 is not None:
+            item["bm25"] = bm25
+        results.append(item)
+    return {**fields, "degraded": True, "degraded_reason": reason, "total_results": len(results), "results": results}
+
+
+def _degraded_image_payload(k, search_filters, reason):
+    return _fallback_payload(recent_results(k, search_filters), reason)
+
+
+def _degraded_text_payload(query, k, search_filters, reason):
+    return _fallback_payload(lexical_results(query, k, search_filters), reason, query=query, mode="lexical")
+
+
+def _rank_products(query_vector, k, collapse=False, **options):
+    """Score ``query_vector`` against the embedding index and load the top-k products.
+
+    With ``collapse``, extra hits are fetched so that k remain after duplicate
+    clusters are folded into their best-scoring member.
+    Returns ``(similarity, product)`` pairs, best first.
+    """
+    if collapse:
+        hits = collapse_duplicates(get_index().search(query_vector, k * collapse_overfetch(), **options), k)
+    else:
+        hits = get_index().search(query_vector, k, **options)
+    products = Product.objects.select_related('seller', 'category').in_bulk([pid for pid, _ in hits])
+    return [(score, products[pid]) for pid, score in hits if pid in products]
+
+
 class ProductViewSet(viewsets.ModelViewSet):
     """CRUD sản phẩm với filter/search"""
     queryset = Product.objects.select_related('seller', 'category').all()
@@ -115,6 +286,130 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return queryset
 
 
+def _parse_roi(data):
+    """Optional ROI from the request body, as a dict {x, y, w, h} or None.
+
+    Accepted forms (normalized 0..1 or absolute pixels):
+    - roi: JSON string or dict {x, y, w, h} (x,y = top-left)
+    - roi_x, roi_y, roi_w, roi_h: individual values
+    """
+    roi = None
+    if 'roi' in data:
+        raw = data.get('roi')
+        if isinstance(raw, str):
+            try:
+                roi = json.loads(raw)
+            except Exception:
+                roi = None
+        elif isinstance(raw, dict):
+            roi = raw
+
+    if roi is None:
+        x = data.get('roi_x')
+        y = data.get('roi_y')
+        w = data.get('roi_w')
+        h = data.get('roi_h')
+        if x is not None and y is not None and w is not None and h is not None:
+            try:
+                roi = {'x': float(x), 'y': float(y), 'w': float(w), 'h': float(h)}
+            except Exception:
+                roi = None
+
+    if roi is not None:
+        try:
+            roi = {key: float(roi.get(key, 0)) for key in ('x', 'y', 'w', 'h')}
+        except Exception:
+            roi = None
+    return roi or None
+
+
+def _fused_image_embedding(full_img, roi_crop):
+    """Normalized query vector: full image, or 0.8·ROI + 0.2·full when an ROI is given.
+
+    Full image and ROI crop are embedded together in one forward pass.
+    """
+    # Imported here so torch/transformers only load on the search code path
+    from clip_service import get_image_embeddings
+
+    images = [full_img] if roi_crop is None else [full_img, roi_crop]
+    vectors = [l2_normalize(v) for v in get_image_embeddings(images)]
+    full_vec = vectors[0]
+    if full_vec is None:
+        return None
+
+    # Fuse embeddings: prefer ROI as close-up
+    roi_vec = vectors[1] if len(vectors) > 1 else None
+    if roi_vec is not None and roi_vec.shape == full_vec.shape:
+        return l2_normalize(0.8 * roi_vec + 0.2 * full_vec)
+    return full_vec
+
+
+def _read_image_upload(request):
+    """``(bytes, roi, cache key)`` of the uploaded query image, or None without one.
+
+    Parses the multipart body and hashes the upload: blocking work that the
+    async view runs in a thread.
+    """
+    file = request.FILES.get("file")
+    if not file:
+        return None
+    data = file.read()
+    roi = _parse_roi(request.data)
+    return data, roi, image_cache_key(data, roi)
+
+
+def _image_query_vector(data, roi, cache_key):
+    """Query vector for an uploaded image: from the embedding cache, or decoded
+    and embedded now. Raises ValueError when the image cannot be decoded;
+    returns None if CLIP gave no vector.
+    """
+    final_vec = image_embedding_cache.get(cache_key)
+    if final_vec is not None:
+        return final_vec
+
+    try:
+        # Reduced-size decode; the ROI is resolved against the original size
+        img, roi_crop = decode_search_image(data, roi)
+    except Exception as e:
+        raise ValueError(f"Cannot open image: {e}") from e
+
+    try:
+        final_vec = _fused_image_embedding(img, roi_crop)
+    finally:
+        for im in (img, roi_crop):
+            try:
+                if im is not None:
+                    im.close()
+            except Exception:
+                pass
+
+    if final_vec is None:
+        return None
+    return image_embedding_cache.set(cache_key, final_vec)
+
+
+def _image_search_results(final_vec, k, search_filters, options, collapse):
+    """Serialized top-k products for an image query vector (result-cached)."""
+    results_key = result_cache_key("image", final_vec, k, search_filters, sorted(options.items()), collapse)
+    results = search_result_cache.get(results_key)
+    if results is None:
+        top = _rank_products(final_vec, k, collapse=collapse, filters=search_filters, **options)
+
+        results = []
+        for score, p in top:
+            results.append({
+                "id": p.id,
+                "name": p.name,
+                "price": str(p.price),
+                "image": (p.image.url if p.image else (p.image_url or None)),
+                "category": p.category.name if p.category else None,
+                "seller": p.seller.username if p.seller else None,
+                "similarity": score,
+            })
+        search_result_cache.set(results_key, results)
+    return results
+
+
 class ImageSearchView(APIView):
     """
     Tìm kiếm sản phẩm bằng ảnh sử dụng ResNet classification
@@ -123,248 +418,326 @@ class ImageSearchView(APIView):
     - Nhận file ảnh
     - Tính embedding CLIP cho ảnh
     - Trả về các sản phẩm có embedding gần nhất
+
+    Re-uploads of the same bytes with the same ROI reuse the cached query
+    embedding and skip decoding and CLIP inference entirely. If the embedding
+    misses its deadline (``?deadline_ms=``, ``PRODUCT_SEARCH_DEADLINE_MS``)
+    or the inference queue is full, the newest products matching the filters
+    are returned with ``"degraded": true``.
     """
     parser_classes = [MultiPartParser]
     permission_classes = [AllowAny]
 
     def post(self, request):
-        file = request.FILES.get("file")
-        if not file:
+        upload = _read_image_upload(request)
+        if upload is None:
             return Response(
                 {"error": "No file uploaded"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         try:
-            img = Image.open(file).convert("RGB")
-        except Exception as e:
-            return Response(
-                {"error": f"Cannot open image: {e}"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Optional ROI support (either as JSON string in 'roi' or separate fields)
-        # Expected ROI format (normalized 0..1 or absolute pixels):
-        # - roi: JSON string or dict {x, y, w, h} (x,y = top-left)
-        # - roi_x, roi_y, roi_w, roi_h: individual values
+            options = _search_options(request)
+            search_filters = _search_filters(request)
+            k = _result_count(request)
+            deadline = _search_deadline(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        collapse = _collapse_option(request)
+
+        data, roi, cache_key = upload
         try:
-            roi = None
-            if 'roi' in request.data:
-                raw = request.data.get('roi')
-                if isinstance(raw, str):
-                    import json
-                    try:
-                        roi = json.loads(raw)
-                    except Exception:
-                        roi = None
-                elif isinstance(raw, dict):
-                    roi = raw
-
-            if roi is None:
-                x = request.data.get('roi_x')
-                y = request.data.get('roi_y')
-                w = request.data.get('roi_w')
-                h = request.data.get('roi_h')
-                if x is not None and y is not None and w is not None and h is not None:
-                    try:
-                        roi = {'x': float(x), 'y': float(y), 'w': float(w), 'h': float(h)}
-                    except Exception:
-                        roi = None
-
-            # Keep original full image for full-image embedding
-            original_img = img.copy()
-
-            roi_crop = None
-            if roi:
-                iw, ih = original_img.size
-                rx = float(roi.get('x', 0))
-                ry = float(roi.get('y', 0))
-                rw = float(roi.get('w', 0))
-                rh = float(roi.get('h', 0))
-                # detect normalized vs absolute: if values <=1 treat as normalized
-                if 0 <= rx <= 1 and 0 <= ry <= 1 and 0 <= rw <= 1 and 0 <= rh <= 1:
-                    left = int(rx * iw)
-                    upper = int(ry * ih)
-                    right = int((rx + rw) * iw)
-                    lower = int((ry + rh) * ih)
-                else:
-                    left = int(rx)
-                    upper = int(ry)
-                    right = int(rx + rw)
-                    lower = int(ry + rh)
-
-                # clamp to image bounds and ensure minimum ROI size (at least 10x10)
-                left = max(0, min(left, iw - 1))
-                upper = max(0, min(upper, ih - 1))
-                right = max(left + 10, min(right, iw))
-                lower = max(upper + 10, min(lower, ih))
-
-                try:
-                    roi_crop = original_img.crop((left, upper, right, lower))
-                    # Validate ROI size
-                    if roi_crop.size[0] < 10 or roi_crop.size[1] < 10:
-                        roi_crop = None  # Ignore too-small ROI
-                except Exception:
-                    roi_crop = None
-
-        except Exception:
-            roi = None
+            final_vec = image_embedding_cache.get(cache_key, shared=False)
+            if final_vec is None:
+                final_vec = inference_gate.call(_image_query_vector, data, roi, cache_key, timeout=remaining(deadline))
+        except InferenceUnavailable as e:
+            return Response(_degraded_image_payload(k, search_filters, e.reason))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": f"Image search failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if final_vec is None:
+            return Response({"error": "Could not compute full image embedding"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         try:
-            # Compute full-image embedding
-            full_embedding = get_image_embedding(original_img)
-            if not full_embedding:
-                return Response({"error": "Could not compute full image embedding"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            full_tensor = torch.tensor(full_embedding, dtype=torch.float32).view(-1)
-            if full_tensor.numel() == 0:
-                return Response({"error": "Empty full image embedding"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            # Compute ROI embedding if provided
-            roi_tensor = None
-            if roi_crop is not None:
-                roi_embedding = get_image_embedding(roi_crop)
-                if roi_embedding:
-                    roi_tensor = torch.tensor(roi_embedding, dtype=torch.float32).view(-1)
-
-            # L2-normalize tensors
-            def l2_normalize(tensor: torch.Tensor):
-                norm = torch.norm(tensor)
-                if norm.numel() == 0 or norm == 0:
-                    return tensor
-                return tensor / norm
-
-            full_tensor = l2_normalize(full_tensor)
-            if roi_tensor is not None:
-                roi_tensor = l2_normalize(roi_tensor)
-
-            # Fuse embeddings: prefer ROI as close-up
-            if roi_tensor is not None:
-                final_tensor = 0.8 * roi_tensor + 0.2 * full_tensor
-                final_tensor = l2_normalize(final_tensor)
-            else:
-                final_tensor = full_tensor
-
-            # Retrieve candidates and compute cosine similarity
-            k = int(request.query_params.get('k', 50))
-            candidates = Product.objects.filter(is_active=True).exclude(image_embedding__isnull=True)
-            scored = []
-            for p in candidates.select_related('seller', 'category'):
-                emb = p.image_embedding
-                if not emb:
-                    continue
-                try:
-                    prod_tensor = torch.tensor(emb, dtype=torch.float32).view(-1)
-                    if prod_tensor.numel() != final_tensor.numel():
-                        continue
-                    prod_tensor = l2_normalize(prod_tensor)
-                    score = float(torch.dot(final_tensor, prod_tensor).item())
-                    scored.append((score, p))
-                except Exception:
-                    continue
-
-            scored.sort(key=lambda x: x[0], reverse=True)
-            top = scored[:k]
-
-            results = []
-            for score, p in top:
-                results.append({
-                    "id": p.id,
-                    "name": p.name,
-                    "price": str(p.price),
-                    "image": (p.image.url if p.image else (p.image_url or None)),
-                    "category": p.category.name if p.category else None,
-                    "seller": p.seller.username if p.seller else None,
-                    "similarity": score,
-                })
-
+            # Cosine similarity against the in-memory embedding index
+            results = _image_search_results(final_vec, k, search_filters, options, collapse)
             return Response({
+                "degraded": False,
                 "total_results": len(results),
                 "results": results,
             })
 
         except Exception as e:
             return Response({"error": f"Image search failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        finally:
-            try:
-                original_img.close()
-            except Exception:
-                pass
-            try:
-                if roi_crop is not None:
-                    roi_crop.close()
-            except Exception:
-                pass
+
+
+class SimilarProductsView(APIView):
+    """GET /api/products/<id>/similar/?limit=20 - precomputed visually similar products.
+
+    Served from the SimilarProduct table in one indexed query. Products not in
+    the table yet (e.g. just embedded) are scored against the index and, with
+    PRODUCT_SIMILAR_ON_SAVE on, queued once for the background graph update.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, pk):
+        try:
+            limit = int(request.query_params.get('limit', similar_count()))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        # Negative slices are not supported by querysets
+        limit = max(1, min(limit, similar_count()))
+
+        edges = list(
+            SimilarProduct.objects.filter(product_id=pk, neighbor__is_active=True)
+            .select_related('neighbor__seller', 'neighbor__category')
+            .order_by('rank')[:limit]
+        )
+        if edges:
+            top = [(e.score, e.neighbor) for e in edges]
+        else:
+            if not Product.objects.filter(pk=pk, is_active=True).exists():
+                return Response({'error': 'Không tìm thấy sản phẩm'}, status=status.HTTP_404_NOT_FOUND)
+            vector = get_index().vector(pk)
+            top = []
+            if vector is not None:
+                top = [(score, p) for score, p in _rank_products(vector, limit + 1) if p.pk != pk][:limit]
+                queue_update_for_read(pk)
+
+        results = []
+        for score, p in top:
+            results.append({
+                "id": p.id,
+                "name": p.name,
+                "price": str(p.price),
+                "stock": p.stock,
+                "image": (p.image.url if p.image else (p.image_url or None)),
+                "category": p.category.name if p.category else None,
+                "seller": p.seller.username if p.seller else None,
+                "similarity": score,
+            })
+        return Response({
+            "product_id": pk,
+            "total_results": len(results),
+            "results": results,
+        })
+
+
+class SearchReadinessView(APIView):
+    """GET /api/search/ready/ - 200 once CLIP and the embedding index are loaded, else 503."""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        report = readiness()
+        code = status.HTTP_200_OK if report["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+        return Response(report, status=code)
+
+
+def _text_search_results(query, text_embedding, k, search_filters, hybrid, options, collapse=False):
+    """Serialized top-k products for a text query (result-cached)."""
+    # Hybrid ranking also depends on the query words, not just the vector
+    results_key = result_cache_key(
+        "text", text_embedding, k, search_filters, sorted(options.items()),
+        (normalize_query(query), sorted(hybrid.items())) if hybrid is not None else None,
+        collapse,
+    )
+    results = search_result_cache.get(results_key)
+    if results is None:
+        results = _text_search(query, text_embedding, k, search_filters, hybrid, options, collapse)
+        search_result_cache.set(results_key, results)
+    return results
+
+
+def _text_search(query, text_embedding, k, search_filters, hybrid, options, collapse=False):
+    if hybrid is not None:
+        if collapse:
+            hits = hybrid_search(
+                query, text_embedding, k * collapse_overfetch(), filters=search_filters, **hybrid, **options
+            )
+            hits = collapse_duplicates(hits, k, key=lambda h: h.product_id)
+        else:
+            hits = hybrid_search(query, text_embedding, k, filters=search_filters, **hybrid, **options)
+        products = Product.objects.select_related('seller', 'category').in_bulk([h.product_id for h in hits])
+        top = [
+            (h.similarity, products[h.product_id], {"score": h.score, "bm25": h.bm25})
+            for h in hits if h.product_id in products
+        ]
+    else:
+        top = [
+            (score, p, {})
+            for score, p in _rank_products(text_embedding, k, collapse=collapse, filters=search_filters, **options)
+        ]
+
+    results = []
+    for score, p, extra in top:
+        results.append({
+            "id": p.id,
+            "name": p.name,
+            "price": str(p.price),
+            "stock": p.stock,
+            "image": (p.image.url if p.image else (p.image_url or None)),
+            "category": p.category.name if p.category else None,
+            "seller": p.seller.username if p.seller else None,
+            "similarity": score,
+            **extra,
+        })
+    return results
 
 
 class TextSearchView(APIView):
-    """Search products using CLIP text embedding"""
+    """Search products using CLIP text embedding
+
+    If the embedding misses its deadline (``?deadline_ms=``,
+    ``PRODUCT_SEARCH_DEADLINE_MS``) or the inference queue is full, the
+    response comes from BM25/the database with ``"mode": "lexical"`` and
+    ``"degraded": true``.
+    """
     permission_classes = [AllowAny]
     
     def get(self, request):
         query = request.query_params.get('q', '').strip()
         if not query:
             return Response({"error": "Query text required"}, status=status.HTTP_400_BAD_REQUEST)
-        
+
         try:
-            # Get text embedding
-            text_embedding = get_text_embedding(query)
-            text_tensor = torch.tensor(text_embedding, dtype=torch.float32).view(-1)
-            
-            # L2 normalize
-            def l2_normalize(tensor: torch.Tensor):
-                norm = torch.norm(tensor)
-                if norm.numel() == 0 or norm == 0:
-                    return tensor
-                return tensor / norm
-            
-            text_tensor = l2_normalize(text_tensor)
-            
+            options = _search_options(request)
+            search_filters = _search_filters(request)
+            hybrid = _hybrid_options(request)
+            k = _result_count(request)
+            deadline = _search_deadline(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        collapse = _collapse_option(request)
+
+        try:
+            # Get text embedding (cached per normalized query)
+            text_embedding = text_embedding_cache.get(text_cache_key(query), shared=False)
+            if text_embedding is None:
+                text_embedding = inference_gate.call(cached_text_embedding, query, timeout=remaining(deadline))
+
             # Search products
-            k = int(request.query_params.get('k', 50))
-            candidates = Product.objects.filter(is_active=True).exclude(image_embedding__isnull=True)
-            scored = []
-            
-            for p in candidates.select_related('seller', 'category'):
-                emb = p.image_embedding
-                if not emb:
-                    continue
-                try:
-                    prod_tensor = torch.tensor(emb, dtype=torch.float32).view(-1)
-                    if prod_tensor.numel() != text_tensor.numel():
-                        continue
-                    prod_tensor = l2_normalize(prod_tensor)
-                    score = float(torch.dot(text_tensor, prod_tensor).item())
-                    scored.append((score, p))
-                except Exception:
-                    continue
-            
-            scored.sort(key=lambda x: x[0], reverse=True)
-            top = scored[:k]
-            
-            results = []
-            for score, p in top:
-                results.append({
-                    "id": p.id,
-                    "name": p.name,
-                    "price": str(p.price),
-                    "stock": p.stock,
-                    "image": (p.image.url if p.image else (p.image_url or None)),
-                    "category": p.category.name if p.category else None,
-                    "seller": p.seller.username if p.seller else None,
-                    "similarity": score,
-                })
+            results = _text_search_results(query, text_embedding, k, search_filters, hybrid, options, collapse)
             
             return Response({
                 "query": query,
+                "mode": "hybrid" if hybrid is not None else "vector",
+                "degraded": False,
                 "total_results": len(results),
                 "results": results,
             })
-            
+
+        except InferenceUnavailable as e:
+            return Response(_degraded_text_payload(query, k, search_filters, e.reason))
         except Exception as e:
             return Response({"error": f"Text search failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncImageSearchView(View):
+    """POST /api/search/image/async/ - ``ImageSearchView`` for ASGI servers.
+
+    Same parameters and response, including the degraded answer when the
+    deadline passes or the inference queue is full. Decoding and CLIP run on
+    the bounded inference pool (``products.inference``) while the request
+    only awaits, so slow inference never ties up Django's sync threads; the
+    index scan and product query run through ``sync_to_async`` once the
+    vector is there. Parsing the multipart body and hashing the upload run
+    through ``sync_to_async`` too, off the event loop.
+    """
+
+    async def post(self, request):
+        # DRF request: the shared parameter helpers read query_params / data
+        request = Request(request, parsers=[MultiPartParser()])
+        try:
+            upload = await sync_to_async(_read_image_upload)(request)
+        except APIException as e:
+            # e.g. a malformed multipart body or another content type; not a DRF view, so answer here
+            return JsonResponse({"error": str(e.detail)}, status=e.status_code)
+        if upload is None:
+            return JsonResponse({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            options = _search_options(request)
+            search_filters = _search_filters(request)
+            k = _result_count(request)
+            deadline = _search_deadline(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        collapse = _collapse_option(request)
+
+        data, roi, cache_key = upload
+        final_vec = image_embedding_cache.get(cache_key, shared=False)
+        if final_vec is None:
+            try:
+                final_vec = await inference_gate.run(_image_query_vector, data, roi, cache_key, timeout=remaining(deadline))
+            except InferenceUnavailable as e:
+                payload = await sync_to_async(_degraded_image_payload)(k, search_filters, e.reason)
+                return JsonResponse(payload, json_dumps_params={"ensure_ascii": False})
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except Exception as e:
+                return JsonResponse({"error": f"Image search failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            if final_vec is None:
+                return JsonResponse({"error": "Could not compute full image embedding"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        try:
+            results = await sync_to_async(_image_search_results)(final_vec, k, search_filters, options, collapse)
+        except Exception as e:
+            return JsonResponse({"error": f"Image search failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse(
+            {"degraded": False, "total_results": len(results), "results": results},
+            json_dumps_params={"ensure_ascii": False},
+        )
+
+
+class AsyncTextSearchView(View):
+    """GET /api/search/text/async/?q=... - ``TextSearchView`` for ASGI servers.
+
+    Same parameters and response, including the degraded lexical answer.
+    Queries already in this worker's embedding cache skip the pool; the rest
+    are embedded on the bounded inference pool (``products.inference``)
+    while the request awaits.
+    """
+
+    async def get(self, request):
+        request = Request(request)
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return JsonResponse({"error": "Query text required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            options = _search_options(request)
+            search_filters = _search_filters(request)
+            hybrid = _hybrid_options(request)
+            k = _result_count(request)
+            deadline = _search_deadline(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        collapse = _collapse_option(request)
+
+        text_embedding = text_embedding_cache.get(text_cache_key(query), shared=False)
+        try:
+            if text_embedding is None:
+                text_embedding = await inference_gate.run(cached_text_embedding, query, timeout=remaining(deadline))
+            results = await sync_to_async(_text_search_results)(
+                query, text_embedding, k, search_filters, hybrid, options, collapse
+            )
+        except InferenceUnavailable as e:
+            payload = await sync_to_async(_degraded_text_payload)(query, k, search_filters, e.reason)
+            return JsonResponse(payload, json_dumps_params={"ensure_ascii": False})
+        except Exception as e:
+            return JsonResponse({"error": f"Text search failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return JsonResponse({
+            "query": query,
+            "mode": "hybrid" if hybrid is not None else "vector",
+            "degraded": False,
+            "total_results": len(results),
+            "results": results,
+        }, json_dumps_params={"ensure_ascii": False})
+
+
 class WishlistViewSet(mixins.ListModelMixin,
                       mixins.CreateModelMixin,
                       mixins.DestroyModelMixin,
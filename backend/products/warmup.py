@@ -0,0 +1,99 @@
+"""Model warm-up and readiness reporting for the CLIP search endpoints.
+
+Nothing here imports torch: ``clip_service`` is only imported when a warm-up
+actually runs, and readiness checks look it up in ``sys.modules`` instead.
+"""
+import logging
+import sys
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_state = {"warming": False, "error": None, "seconds": None}
+_state_lock = threading.Lock()
+
+
+def warm_up(build_index: bool = True) -> None:
+    """Load CLIP (and optionally the embedding index) in the current thread."""
+    with _state_lock:
+        _state.update(warming=True, error=None)
+    try:
+        import clip_service
+
+        seconds = clip_service.warm_up()
+        if build_index:
+            from .lexical import get_lexical_index
+            from .search_index import get_index
+
+            get_index()
+            get_lexical_index()
+        with _state_lock:
+            _state["seconds"] = round(seconds, 2)
+    except Exception as e:
+        logger.exception("CLIP warm-up failed")
+        with _state_lock:
+            _state["error"] = str(e)
+    finally:
+        with _state_lock:
+            _state["warming"] = False
+
+
+def warmup_enabled() -> bool:
+    """CLIP_WARMUP_ON_STARTUP, where None means "whenever searches have a deadline".
+
+    With PRODUCT_SEARCH_DEADLINE_MS set, a cold worker would spend the budget
+    of its first searches loading the model and answer them degraded.
+    """
+    from .inference import default_deadline_ms
+
+    enabled = getattr(settings, "CLIP_WARMUP_ON_STARTUP", None)
+    if enabled is None:
+        return default_deadline_ms() is not None
+    return bool(enabled)
+
+
+def warm_up_on_startup() -> None:
+    """Start a background warm-up if ``warmup_enabled()``.
+
+    Called from ``backend.asgi`` / ``backend.wsgi`` once the app is loaded, so
+    each server worker loads the model before its first search request.
+    """
+    if not warmup_enabled():
+        return
+    threading.Thread(target=warm_up, name="clip-warmup", daemon=True).start()
+
+
+def model_loaded() -> bool:
+    clip_service = sys.modules.get("clip_service")
+    return bool(clip_service is not None and clip_service.is_loaded())
+
+
+def clip_batch_queue() -> int:
+    """Embedding requests waiting in clip_service's micro-batchers (0 if not loaded)."""
+    clip_service = sys.modules.get("clip_service")
+    return clip_service.pending_requests() if clip_service is not None else 0
+
+
+def readiness() -> dict:
+    from .embedding_queue import embedding_queue
+    from .inference import inference_gate
+    from .search_index import peek_index
+
+    index = peek_index()
+    with _state_lock:
+        state = dict(_state)
+    return {
+        "ready": model_loaded() and index is not None,
+        "model_loaded": model_loaded(),
+        "warming": state["warming"],
+        "warmup_seconds": state["seconds"],
+        "warmup_error": state["error"],
+        "index_loaded": index is not None,
+        "index_rows": len(index) if index is not None else 0,
+        "index_snapshot": index.snapshot if index is not None else None,
+        "embedding_queue": embedding_queue.pending(),
+        "inference": inference_gate.metrics(),
+        "clip_batch_queue": clip_batch_queue(),
+    }
@@ -15,6 +15,10 @@ Notes:
 - Ensures seller users exist (seller1/2/3) or creates them with dummy password.
 - Does not delete existing data.
 - You can pass a custom CSV path: run(csv_path="/path/to/file.csv")
+- Images are embedded in batches after the rows are saved (the per-save
+  background embedding is suspended meanwhile, so nothing is embedded twice).
+- Rows without a category go to "Uncategorized" and are then categorized
+  zero-shot with CLIP (products.categorize); pass categorize=False to skip.
 """
 
 import csv
@@ -23,6 +27,8 @@ from typing import Iterable, List
 
 from django.contrib.auth import get_user_model
 from django.core.files import File
+from products import embedding_queue
+from products.categorize import categorize_products, embed_missing, fallback_name
 from products.models import Category, Product
 
 User = get_user_model()
@@ -69,7 +75,7 @@ def _resolve_image_path(image_field: str, dataset_root: Path, base_dir: Path) ->
     return candidate if candidate.exists() else None
 
 
-def run(csv_path: str | None = None, limit: int | None = None):
+def run(csv_path: str | None = None, limit: int | None = None, categorize: bool = True):
     # Resolve CSV path
     dataset_root = Path(r"C:\VIET\PBL6\shopee crawl")
     default_csv = dataset_root / "Dataset" / "products_selected" / "selected_30_per_category.csv"
@@ -95,12 +101,14 @@ def run(csv_path: str | None = None, limit: int | None = None):
     local_images = 0
     remote_images = 0
     missing_images = 0
+    imported: list[int] = []
+    uncategorized: list[int] = []
 
     # Base directory for relative image paths in CSV
     base_dir = products_csv.parent.parent  # points to Dataset/
 
     print(f"🔄 Đang đọc file {products_csv}...")
-    with products_csv.open(newline="", encoding="utf-8") as csvfile:
+    with products_csv.open(newline="", encoding="utf-8") as csvfile, embedding_queue.suspended():
         reader = csv.DictReader(csvfile)
         rows = list(reader)
         if limit is not None:
@@ -112,7 +120,7 @@ def run(csv_path: str | None = None, limit: int | None = None):
             description = row.get("description") or ""
             price_raw = row.get("price") or "0"
             stock_raw = row.get("stock") or "0"
-            category_name = row.get("category") or "Uncategorized"
+            category_name = (row.get("category") or "").strip() or fallback_name()
 
             # Category
             cat = category_cache.get(category_name)
@@ -169,6 +177,9 @@ def run(csv_path: str | None = None, limit: int | None = None):
                     missing_images += 1
 
             created += 1
+            imported.append(product.id)
+            if category_name == fallback_name():
+                uncategorized.append(product.id)
 
             if processed % 50 == 0:
                 print(f"  📦 Đã xử lý {processed} sản phẩm...")
@@ -178,6 +189,13 @@ def run(csv_path: str | None = None, limit: int | None = None):
     print(f"🖼️  Ảnh local: {local_images}")
     print(f"🌐  Ảnh URL: {remote_images}")
     print(f"❌ Thiếu ảnh: {missing_images}")
+
+    if imported:
+        print(f"🧠 Tính embedding cho {len(imported)} sản phẩm...")
+        embed_missing(imported)
+    if categorize and uncategorized:
+        print(f"🏷️  Phân loại tự động {len(uncategorized)} sản phẩm chưa có danh mục...")
+        categorize_products(uncategorized, log=print)
     print(f"📂 Categories: {len(category_cache)}")
 
 
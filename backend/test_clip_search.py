@@ -24,7 +24,7 @@ def test_clip_search(query, top_k=10):
     print(f"✓ Text embedding shape: {text_embedding.shape}")
     
     # Get products with embeddings
-    products = Product.objects.exclude(image_embedding__isnull=True).exclude(image_embedding=[])
+    products = Product.objects.exclude(embedding__isnull=True).filter(embedding_dim__gt=0)
     print(f"✓ Found {products.count()} products with embeddings")
     
     # Compute similarities
@@ -33,7 +33,7 @@ def test_clip_search(query, top_k=10):
     
     for product in products:
         try:
-            prod_emb = torch.tensor(product.image_embedding)
+            prod_emb = torch.from_numpy(product.embedding_vector.astype('float32'))
             prod_tensor = F.normalize(prod_emb, dim=0)
             similarity = torch.dot(text_tensor, prod_tensor).item()
             results.append({